@@ -0,0 +1 @@
+from .stand_in_api import StandInAPI, LatencyModel
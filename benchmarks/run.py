@@ -0,0 +1,218 @@
+import asyncio
+import datetime
+import json
+import logging
+import os
+import statistics
+import tempfile
+import time
+import asyncclick as click
+from typing import Callable, Dict, List, Optional
+from dynaconf.utils.boxing import DynaBox
+from src.db import Database
+from src.pipelines import APIToPostgres, PostgresToS3, AVIVRawToHDPrices, TransformedPricesHealthCheck, PricesUpdater
+from benchmarks.seed import seed_database, synthetic_geo_indices, ZIP_CODES_PER_SCALE, CITIES_PER_SCALE
+from benchmarks.stand_in_api import StandInAPI, LatencyModel
+
+
+STAGES = ["fetch", "transform", "health_check", "backup", "sync"]
+SYNC_TABLES = ["report_batches", "report_headers", "location_prices"]
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baselines.json")
+
+
+class BenchmarkRunner:
+    """
+    Seed a local Postgres with synthetic data and time every pipeline stage.
+
+    All stages run against the ``db.test`` database, so nothing is uploaded to S3 and
+    the secrets file is left untouched. The sync stage targets a second local database
+    (``<test database>_rds``) standing in for the Homeday Prices DB.
+    """
+    def __init__(
+            self,
+            settings,
+            stages: List[str],
+            repeat: int = 1,
+            fetch_units: int = 1000,
+            last_price_date: str = "2024-10-01",
+            latency: Optional[LatencyModel] = None
+        ):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.stages = stages
+        self.repeat = repeat
+        self.fetch_units = fetch_units
+        self.last_price_date = last_price_date
+        self.latency = latency or LatencyModel()
+        self.config = DynaBox({
+            'db': {'test': dict(settings.db.test), 'params': dict(settings.db.params)},
+        })
+        self.rds_config = DynaBox({
+            'db': {
+                'test': {**dict(settings.db.test), 'database': f"{settings.db.test.database}_rds"},
+                'params': {'report_batch_id': 1}
+            },
+        })
+
+    def prepare_databases(self):
+        for config in (self.config, self.rds_config):
+            database = Database(config=config, test=True)
+            database.initiate_db()
+            database.db_handler.close()
+
+    def run(self, scales: List[float]) -> Dict:
+        """Run all stages at every scale and return the results document."""
+        self.prepare_databases()
+        results = {
+            'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+            'repeat': self.repeat,
+            'scales': {}
+        }
+        for scale in scales:
+            timings: Dict[str, List[float]] = {stage: [] for stage in self.stages}
+            seeded = {}
+            for _ in range(self.repeat):
+                seeded = self.seed(scale)
+                for stage in self.stages:
+                    timings[stage].append(self.time_stage(stage))
+            results['scales'][str(scale)] = {
+                'seeded_rows': seeded,
+                'stages': {stage: round(statistics.median(values), 4) for stage, values in timings.items()}
+            }
+        return results
+
+    def seed(self, scale: float) -> Dict[str, int]:
+        database = Database(config=self.config, test=True)
+        try:
+            return seed_database(database.db_handler, scale, self.last_price_date)
+        finally:
+            database.db_handler.close()
+
+    def time_stage(self, stage: str) -> float:
+        stage_function: Callable = getattr(self, f"stage_{stage}")
+        self.logger.info(f"Benchmarking stage '{stage}'...")
+        start_time = time.perf_counter()
+        stage_function()
+        execution_time = time.perf_counter() - start_time
+        self.logger.info(f"Stage '{stage}' executed in {execution_time:.6f} seconds.")
+        return execution_time
+
+    def stage_fetch(self):
+        asyncio.run(self._fetch())
+
+    async def _fetch(self):
+        geo_indices = synthetic_geo_indices(self.fetch_units / (ZIP_CODES_PER_SCALE + CITIES_PER_SCALE), prefix="fetch ")
+        async with StandInAPI(geo_indices=geo_indices, latency=self.latency) as stand_in:
+            config = DynaBox({**self.config.to_dict(), 'api': {'dev': stand_in.api_config()}})
+            pipeline = APIToPostgres(config, test=True)
+            await pipeline.run(geo_indices=geo_indices, price_date=self.last_price_date)
+
+    def stage_transform(self):
+        AVIVRawToHDPrices(self.config, test=True).run()
+
+    def stage_health_check(self):
+        health_check = TransformedPricesHealthCheck(self.config, test=True)
+        try:
+            health_check.run_all_checks()
+        finally:
+            health_check.db_handler.close()
+
+    def stage_backup(self):
+        # PostgresToS3 writes to data/ relative to the working directory
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            os.makedirs(os.path.join(tmp_dir, "data"))
+            os.chdir(tmp_dir)
+            try:
+                loader = PostgresToS3(self.config, s3_connector=None, test=True)
+                loader.backup_tables(['geo_cache', 'prices_all'], local=True)
+                loader.db_handler.close()
+            finally:
+                os.chdir(cwd)
+
+    def stage_sync(self):
+        target = Database(config=self.rds_config, test=True)
+        target.db_handler.execute_query(f"TRUNCATE {', '.join(SYNC_TABLES)}")
+        target.db_handler.commit()
+        target.db_handler.close()
+        PricesUpdater(self.config.db.test, self.rds_config.db.test).run(SYNC_TABLES, mode="full")
+
+
+def compare_with_baseline(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """
+    Compare stage timings against a stored baseline.
+
+    :param results: Results document produced by BenchmarkRunner.run.
+    :param baseline: Previously stored results document.
+    :param threshold: Allowed relative slowdown (0.2 = 20%).
+    :return: Human readable regressions, empty if none.
+    """
+    regressions = []
+    for scale, scale_results in results['scales'].items():
+        baseline_stages = baseline.get('scales', {}).get(scale, {}).get('stages', {})
+        for stage, seconds in scale_results['stages'].items():
+            reference = baseline_stages.get(stage)
+            if reference and seconds > reference * (1 + threshold):
+                regressions.append(
+                    f"{stage} at {scale}x: {seconds:.3f}s vs baseline {reference:.3f}s "
+                    f"(+{(seconds / reference - 1) * 100:.1f}%)"
+                )
+    return regressions
+
+
+@click.command()
+@click.option('--scale', 'scales', multiple=True, type=float, default=[1, 10, 100],
+              help='Data size as multiple of the current production size, repeatable.')
+@click.option('--stage', 'stages', multiple=True, type=click.Choice(STAGES), default=STAGES,
+              help='Stages to benchmark, repeatable.')
+@click.option('--repeat', default=1, type=int, help='Repetitions per scale, the median is reported.')
+@click.option('--fetch_units', default=1000, type=int, help='Geo indices fetched from the stand-in API.')
+@click.option('--latency_median', default=0.0, type=float, help='Median stand-in API latency in seconds.')
+@click.option('--output', default='data/benchmarks', help='Directory for result files.')
+@click.option('--baseline', default=DEFAULT_BASELINE, help='Baseline results to compare against.')
+@click.option('--threshold', default=0.2, type=float, help='Allowed relative slowdown before failing.')
+@click.option('--update_baseline', is_flag=True, help='Store these results as the new baseline.')
+async def main(scales, stages, repeat, fetch_units, latency_median, output, baseline, threshold, update_baseline):
+    """
+    Run the end-to-end benchmark suite.
+    """
+    from config import settings
+
+    runner = BenchmarkRunner(
+        settings, stages=list(stages), repeat=repeat, fetch_units=fetch_units,
+        latency=LatencyModel("lognormal", latency_median, 0.5)
+    )
+    results = await asyncio.to_thread(runner.run, list(scales))
+
+    os.makedirs(output, exist_ok=True)
+    result_path = os.path.join(output, f"results_{datetime.date.today().strftime('%Y%m%d')}.json")
+    with open(result_path, "w") as file:
+        json.dump(results, file, indent=4)
+    click.echo(f"Results written to {result_path}")
+
+    for scale, scale_results in results['scales'].items():
+        for stage, seconds in scale_results['stages'].items():
+            click.echo(f"{scale:>6}x  {stage:<14} {seconds:>10.3f}s")
+
+    if update_baseline:
+        with open(baseline, "w") as file:
+            json.dump(results, file, indent=4)
+        click.echo(f"Baseline updated: {baseline}")
+    elif os.path.exists(baseline):
+        with open(baseline, "r") as file:
+            regressions = compare_with_baseline(results, json.load(file), threshold)
+        if regressions:
+            for regression in regressions:
+                click.echo(f"REGRESSION {regression}")
+            raise SystemExit(1)
+        click.echo("No regressions against baseline.")
+    else:
+        click.echo(f"No baseline at {baseline}, nothing compared. Record one with --update_baseline.")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    main(_anyio_backend="asyncio")
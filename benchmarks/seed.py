@@ -0,0 +1,130 @@
+import json
+import logging
+import random
+import uuid
+from typing import Dict, Iterator, List, Tuple
+from src.db import DatabaseHandler
+from src.db.query_base import REFRESH_GEO_MAPPING
+
+
+logger = logging.getLogger(__name__)
+
+# Size of one production quarter: entries in config/geo_indices.json
+ZIP_CODES_PER_SCALE = 8201
+CITIES_PER_SCALE = 11048
+DEFAULT_QUARTERS = 4
+NO_AVIV_ID_RATIO = 0.03
+
+SEEDED_TABLES = ["location_prices", "report_headers", "report_batches", "prices_all", "geo_mapping", "geo_cache"]
+
+
+def quarter_dates(last_price_date: str, quarters: int) -> List[str]:
+    """Return `quarters` price dates ending with `last_price_date`, oldest first."""
+    year, month = int(last_price_date[:4]), int(last_price_date[5:7])
+    dates = []
+    for _ in range(quarters):
+        dates.append(f"{year}-{month:02d}-01")
+        month -= 3
+        if month < 1:
+            month += 12
+            year -= 1
+    return list(reversed(dates))
+
+
+def synthetic_geo_indices(scale: float, prefix: str = "") -> Dict[str, List[Dict]]:
+    """Geo indices shaped like config/geo_indices.json, `scale` times its size."""
+    zip_codes = [
+        {"id": "no_hd_geo_id_applicable", "name": f"{prefix}Z{i:07d}"}
+        for i in range(int(ZIP_CODES_PER_SCALE * scale))
+    ]
+    cities = [
+        {"id": str(uuid.uuid5(uuid.NAMESPACE_URL, f"{prefix}city-{i}")), "name": f"{prefix}City {i}"}
+        for i in range(int(CITIES_PER_SCALE * scale))
+    ]
+    return {"zip_codes": zip_codes, "cities": cities}
+
+
+def synthetic_geo_rows(geo_indices: Dict[str, List[Dict]], seed: int = 0) -> Iterator[Tuple]:
+    """Yield geo_cache rows for the given geo indices."""
+    rng = random.Random(seed)
+    for param_key, type_key in (("zip_codes", "NBH2"), ("cities", "AD08")):
+        for i, obj in enumerate(geo_indices[param_key]):
+            if rng.random() < NO_AVIV_ID_RATIO:
+                yield obj["name"], obj["id"], "no_aviv_id_available", None, "{}", None, 0
+                continue
+            coordinates = json.dumps({"lat": 47.3 + rng.random() * 7, "lng": 5.9 + rng.random() * 9})
+            yield obj["name"], obj["id"], f"{type_key}DE{i}", type_key, coordinates, obj["name"], 1
+
+
+def synthetic_price_rows(aviv_geo_ids: List[str], price_dates: List[str], seed: int = 0) -> Iterator[Tuple]:
+    """Yield prices_all rows for every aviv geo id and price date."""
+    rng = random.Random(seed)
+
+    def price(geoid: str, value: int) -> str:
+        return json.dumps({
+            "place_id": geoid,
+            "low": int(value * 0.6),
+            "high": int(value * 1.6),
+            "value": value,
+            "accuracy": rng.randint(1, 5)
+        })
+
+    for price_date in price_dates:
+        for geoid in aviv_geo_ids:
+            base = rng.randint(1500, 7500)
+            apartment = price(geoid, int(base * 0.95)) if rng.random() > 0.05 else "null"
+            yield (
+                geoid, price_date, "TRANSACTION_TYPE.SELL",
+                price(geoid, int(base * 1.1)), apartment, price(geoid, base)
+            )
+
+
+def seed_database(
+        db_handler: DatabaseHandler,
+        scale: float,
+        last_price_date: str,
+        quarters: int = DEFAULT_QUARTERS,
+        seed: int = 0
+    ) -> Dict[str, int]:
+    """
+    Truncate the benchmark database and seed geo_cache/prices_all with synthetic data.
+
+    :param db_handler: Handler of the (already created) benchmark database.
+    :param scale: Multiple of the production geo_indices size.
+    :param last_price_date: Latest quarter to generate prices for (YYYY-MM-01).
+    :param quarters: Number of quarters of price history.
+    :param seed: Random seed for reproducible data.
+    :return: Seeded row counts per table.
+    """
+    geo_indices = synthetic_geo_indices(scale)
+    geo_rows = list(synthetic_geo_rows(geo_indices, seed))
+    aviv_geo_ids = sorted({row[2] for row in geo_rows if row[2] != "no_aviv_id_available"})
+    price_dates = quarter_dates(last_price_date, quarters)
+
+    if not db_handler.conn:
+        db_handler.connect()
+    with db_handler.conn.cursor() as cur:
+        cur.execute(f"TRUNCATE {', '.join(SEEDED_TABLES)} RESTART IDENTITY")
+        with cur.copy(
+            "COPY geo_cache (geo_index, hd_geo_id, aviv_geo_id, type_key, coordinates, match_name, confidence_score) "
+            "FROM STDIN"
+        ) as copy:
+            for row in geo_rows:
+                copy.write_row(row)
+        price_rows = 0
+        with cur.copy(
+            "COPY prices_all (aviv_geo_id, price_date, transaction_type, house_price, apartment_price, hybrid_price) "
+            "FROM STDIN"
+        ) as copy:
+            for row in synthetic_price_rows(aviv_geo_ids, price_dates, seed):
+                copy.write_row(row)
+                price_rows += 1
+        cur.execute(REFRESH_GEO_MAPPING)
+        cur.execute("ANALYZE geo_cache")
+        cur.execute("ANALYZE geo_mapping")
+        cur.execute("ANALYZE prices_all")
+    db_handler.commit()
+
+    counts = {"geo_cache": len(geo_rows), "prices_all": price_rows}
+    logger.info(f"Seeded benchmark database at {scale}x: {counts}")
+    return counts
@@ -0,0 +1,340 @@
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import time
+import asyncclick as click
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from aiohttp import ClientSession, web
+
+
+GEOCODING_PATH = "/geocoding"
+PRICE_PATH = "/prices"
+
+
+@dataclass
+class LatencyModel:
+    """Response delay distribution of the stand-in, in seconds."""
+    distribution: str = "fixed"  # fixed, uniform or lognormal
+    median: float = 0.0
+    spread: float = 0.0  # uniform: +/- seconds around median, lognormal: sigma
+
+    def sample(self, rng: random.Random) -> float:
+        if self.distribution == "uniform":
+            return max(0.0, rng.uniform(self.median - self.spread, self.median + self.spread))
+        if self.distribution == "lognormal" and self.median > 0:
+            return rng.lognormvariate(0, self.spread) * self.median
+        return self.median
+
+
+class TokenBucket:
+    """Per API key request budget, refilled continuously."""
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class StandInAPI:
+    """
+    Local stand-in for the AVIV geocoding and price APIs.
+
+    Responses are replayed from a recordings file when available and generated
+    deterministically from the geo indices otherwise. Latency, 429/5xx errors and
+    per-key rate limits are injected to mimic the real services.
+
+    Point ``api.<env>.geo_coding_url`` at ``{base_url}/geocoding?country=DE`` and
+    ``api.<env>.price_url`` at ``{base_url}/prices`` to run ``APIToPostgres`` against it.
+    """
+    def __init__(
+            self,
+            geo_indices: Optional[Dict] = None,
+            recordings: Optional[str] = None,
+            latency: Optional[LatencyModel] = None,
+            error_rate: float = 0.0,
+            throttle_rate: float = 0.0,
+            miss_rate: float = 0.0,
+            rate_limit: Optional[float] = None,
+            upstream: Optional[Dict[str, str]] = None,
+            record_path: Optional[str] = None,
+            seed: int = 0
+        ):
+        """
+        :param geo_indices: Geo indices ({'zip_codes': [...], 'cities': [...]}) to generate responses for.
+        :param recordings: Path of an NDJSON recordings file to replay.
+        :param latency: Latency model applied to every response.
+        :param error_rate: Share of requests answered with a random 5xx status.
+        :param throttle_rate: Share of requests answered with 429 regardless of rate limits.
+        :param miss_rate: Share of geo indices the geocoder does not know.
+        :param rate_limit: Allowed requests per second per X-Api-Key (None disables limiting).
+        :param upstream: Real API base urls ({'geo_coding_url': ..., 'price_url': ...}) to proxy in record mode.
+        :param record_path: NDJSON file proxied responses are appended to in record mode.
+        :param seed: Seed for latency, error injection and generated prices.
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.latency = latency or LatencyModel()
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.miss_rate = miss_rate
+        self.rate_limit = rate_limit
+        self.upstream = upstream
+        self.record_path = record_path
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.stats: Dict[str, int] = {}
+        self.known_names = set()
+        for obj in (geo_indices or {}).get('zip_codes', []) + (geo_indices or {}).get('cities', []):
+            self.known_names.add(obj['name'])
+        self.recordings = self.load_recordings(recordings) if recordings else {}
+        self.runner = None
+        self.base_url = None
+
+    @staticmethod
+    def load_recordings(file_path: str) -> Dict[Tuple[str, str], Tuple[int, Dict]]:
+        """Load recorded responses keyed by (endpoint, request key)."""
+        recordings = {}
+        with open(file_path, "r") as file:
+            for line in file:
+                if line.strip():
+                    entry = json.loads(line)
+                    recordings[(entry['endpoint'], entry['key'])] = (entry['status'], entry['body'])
+        return recordings
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get(GEOCODING_PATH, self.handle_geocoding)
+        app.router.add_get(PRICE_PATH + "/{geoid}", self.handle_price)
+        app.router.add_get("/_stats", self.handle_stats)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Start serving in the running event loop and return the base url."""
+        self.runner = web.AppRunner(self.app())
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        bound_port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{bound_port}"
+        self.logger.info(f"Stand-in API listening on {self.base_url}")
+        return self.base_url
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    def api_config(self, api_key: str = "stand-in") -> Dict[str, str]:
+        """Build an ``api.<env>`` style config block pointing at this stand-in."""
+        return {
+            'geo_coding_url': f"{self.base_url}{GEOCODING_PATH}?country=DE",
+            'price_url': f"{self.base_url}{PRICE_PATH}",
+            'geo_api_key': api_key,
+            'price_api_key': api_key
+        }
+
+    def _count(self, endpoint: str, status: int):
+        key = f"{endpoint}_{status}"
+        self.stats[key] = self.stats.get(key, 0) + 1
+
+    async def _inject_faults(self, request: web.Request, endpoint: str) -> Optional[web.Response]:
+        """Apply latency, rate limiting and error injection; return an error response if any."""
+        await asyncio.sleep(self.latency.sample(self.rng))
+        if self.rate_limit:
+            api_key = request.headers.get('X-Api-Key', '')
+            bucket = self.buckets.setdefault(api_key, TokenBucket(self.rate_limit))
+            if not bucket.take():
+                self._count(endpoint, 429)
+                return web.json_response({'message': 'Too Many Requests'}, status=429, headers={'Retry-After': '1'})
+        roll = self.rng.random()
+        if roll < self.throttle_rate:
+            self._count(endpoint, 429)
+            return web.json_response({'message': 'Too Many Requests'}, status=429, headers={'Retry-After': '1'})
+        if roll < self.throttle_rate + self.error_rate:
+            status = self.rng.choice([500, 502, 503, 504])
+            self._count(endpoint, status)
+            return web.json_response({'message': 'Upstream error'}, status=status)
+        return None
+
+    async def handle_geocoding(self, request: web.Request) -> web.Response:
+        error = await self._inject_faults(request, 'geocoding')
+        if error is not None:
+            return error
+        param_key = 'postal_code' if 'postal_code' in request.query else 'city'
+        name = request.query.get(param_key, '')
+        status, body = await self._respond('geocoding', name, request, f"&{param_key}={name}")
+        if status is None:
+            status, body = self.generate_geocoding(name, param_key)
+        self._count('geocoding', status)
+        return web.json_response(body, status=status)
+
+    async def handle_price(self, request: web.Request) -> web.Response:
+        error = await self._inject_faults(request, 'prices')
+        if error is not None:
+            return error
+        geoid = request.match_info['geoid']
+        price_date = request.query.get('price_date', '')
+        status, body = await self._respond(
+            'prices', f"{geoid}|{price_date}", request, f"/{geoid}?price_date={price_date}"
+        )
+        if status is None:
+            status, body = self.generate_price(geoid, price_date)
+        self._count('prices', status)
+        return web.json_response(body, status=status)
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats)
+
+    async def _respond(self, endpoint: str, key: str, request: web.Request, suffix: str):
+        """Replay a recorded response, or proxy and record it in record mode."""
+        if (endpoint, key) in self.recordings:
+            return self.recordings[(endpoint, key)]
+        if not self.upstream:
+            return None, None
+        base_url = self.upstream['geo_coding_url' if endpoint == 'geocoding' else 'price_url']
+        headers = {'X-Api-Key': request.headers.get('X-Api-Key', '')}
+        async with ClientSession() as session:
+            async with session.get(f"{base_url}{suffix}", headers=headers) as response:
+                status = response.status
+                body = await response.json(content_type=None)
+        self.recordings[(endpoint, key)] = (status, body)
+        if self.record_path:
+            with open(self.record_path, "a") as file:
+                file.write(json.dumps({'endpoint': endpoint, 'key': key, 'status': status, 'body': body}) + "\n")
+        return status, body
+
+    def _digest(self, value: str) -> int:
+        return int(hashlib.sha256(f"{self.seed}:{value}".encode()).hexdigest()[:12], 16)
+
+    def generate_geocoding(self, name: str, param_key: str) -> Tuple[int, Dict]:
+        """Generate a deterministic geocoding payload for a geo index."""
+        digest = self._digest(name)
+        if (self.known_names and name not in self.known_names) or (digest % 10000) < self.miss_rate * 10000:
+            return 404, {'items': {'aviv': []}}
+
+        type_key = 'AD08' if param_key == 'city' else 'NBH2'
+        lat = 47.3 + (digest % 7000) / 1000
+        lng = 5.9 + (digest // 7000 % 9000) / 1000
+        items: List[Dict] = []
+        if param_key == 'postal_code':
+            # The real geocoder usually lists the postal code unit itself first
+            items.append({'match': self._geo_match(f"POCODE{name}", 'POCO', name, lat, lng, 1)})
+        items.append({'match': self._geo_match(f"{type_key}DE{digest % 100000}", type_key, name, lat, lng, 1)})
+        return 200, {'items': {'aviv': items}}
+
+    @staticmethod
+    def _geo_match(geoid: str, type_key: str, name: str, lat: float, lng: float, confidence: int) -> Dict:
+        return {
+            'id': geoid,
+            'type_key': type_key,
+            'coordinates': {'lat': lat, 'lng': lng},
+            'bounding_box': {
+                'ne': {'lat': lat - 0.01, 'lng': lng - 0.01},
+                'sw': {'lat': lat + 0.01, 'lng': lng + 0.01}
+            },
+            'match_name': name,
+            'confidence_score': confidence,
+            'parents': []
+        }
+
+    def generate_price(self, geoid: str, price_date: str) -> Tuple[int, Dict]:
+        """Generate a deterministic price payload for an aviv geo id and price date."""
+        digest = self._digest(f"{geoid}|{price_date}")
+        base = 1500 + digest % 6000
+
+        def price(factor: float, accuracy: int) -> Dict:
+            value = int(base * factor)
+            return {
+                'place_id': geoid,
+                'low': int(value * 0.6),
+                'high': int(value * 1.6),
+                'value': value,
+                'accuracy': accuracy
+            }
+
+        item = {
+            'place_id': geoid,
+            'price_date': price_date,
+            'transaction_type': 'TRANSACTION_TYPE.SELL',
+            'house_price': price(1.1, 1 + digest % 5),
+            'apartment_price': price(0.95, 1 + digest // 5 % 5) if digest % 17 else None,
+            'hybrid_price': price(1.0, 1 + digest // 25 % 5)
+        }
+        return 200, {'items': [item], 'query_duration': round(self.latency.median, 3)}
+
+
+@click.command()
+@click.option('--host', default='127.0.0.1', help='Interface to bind.')
+@click.option('--port', default=8080, type=int, help='Port to bind.')
+@click.option('--recordings', help='NDJSON file with recorded responses to replay.')
+@click.option('--record', 'record_path', help='Proxy unknown requests to the configured API and append them to this file.')
+@click.option('--latency', type=click.Choice(['fixed', 'uniform', 'lognormal']), default='lognormal')
+@click.option('--latency_median', default=0.2, type=float, help='Median response time in seconds.')
+@click.option('--latency_spread', default=0.5, type=float, help='Uniform half-width or lognormal sigma.')
+@click.option('--error_rate', default=0.0, type=float, help='Share of requests answered with 5xx.')
+@click.option('--throttle_rate', default=0.0, type=float, help='Share of requests answered with 429.')
+@click.option('--miss_rate', default=0.0, type=float, help='Share of geo indices without a geocoding match.')
+@click.option('--rate_limit', type=float, help='Requests per second allowed per API key.')
+@click.option('--seed', default=0, type=int)
+async def main(
+    host, port, recordings, record_path, latency, latency_median, latency_spread,
+    error_rate, throttle_rate, miss_rate, rate_limit, seed
+):
+    """
+    Serve the AVIV stand-in API until interrupted.
+    """
+    from config import settings
+
+    upstream = None
+    if record_path:
+        upstream = {
+            'geo_coding_url': settings.api.preview.geo_coding_url,
+            'price_url': settings.api.preview.price_url
+        }
+    stand_in = StandInAPI(
+        geo_indices=settings.geo_indices,
+        recordings=recordings,
+        latency=LatencyModel(latency, latency_median, latency_spread),
+        error_rate=error_rate,
+        throttle_rate=throttle_rate,
+        miss_rate=miss_rate,
+        rate_limit=rate_limit,
+        upstream=upstream,
+        record_path=record_path,
+        seed=seed
+    )
+    await stand_in.start(host, port)
+    click.echo(f"geo_coding_url: {stand_in.base_url}{GEOCODING_PATH}?country=DE")
+    click.echo(f"price_url: {stand_in.base_url}{PRICE_PATH}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await stand_in.stop()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    main(_anyio_backend="asyncio")
@@ -0,0 +1,195 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+import asyncclick as click
+from typing import Callable, Dict, List
+from dynaconf.utils.boxing import DynaBox
+from src.db import Database, DatabaseHandler
+from src.db.query_base import insert_source, REFLECT_AVIVID
+
+
+MODES = ["text", "prepared", "pipeline"]
+# Synthetic rows are tagged with this prefix and removed after each measurement
+PREFIX = "bench_statement_"
+
+
+def geo_cache_rows(units: int) -> List[List[tuple]]:
+    """Statements of `Database.cache_geo_response` per unit: the geo_cache and geo_mapping inserts."""
+    statements = []
+    for unit in range(units):
+        row = (f"{PREFIX}{unit}", "no_hd_geo_id_applicable", f"{PREFIX}{unit}", "NBH2", "{}", f"Bench {unit}", 1)
+        statements.append([(insert_source['geo_cache'], row), (insert_source['geo_mapping'], row[:3])])
+    return statements
+
+
+def prices_all_rows(units: int) -> List[List[tuple]]:
+    """Statements of `Database.store_price_in_db` per unit."""
+    price = json.dumps({"low": 1, "high": 2, "value": 1, "accuracy": 3})
+    return [
+        [(insert_source['prices_all'], (f"{PREFIX}{unit}", "2024-10-01", "sell", price, price, price))]
+        for unit in range(units)
+    ]
+
+
+def geo_cache_lookups(units: int) -> List[List[tuple]]:
+    """Statements of `Database.get_cached_geoid` per unit."""
+    return [[(REFLECT_AVIVID, ([f"{PREFIX}{unit}"],))] for unit in range(units)]
+
+
+# Hot statements of the fetch pipeline, and whether each unit is committed
+STATEMENTS: Dict[str, tuple] = {
+    "geo_cache_insert": (geo_cache_rows, True),
+    "prices_all_insert": (prices_all_rows, True),
+    "geo_cache_lookup": (geo_cache_lookups, False),
+}
+
+
+class LatencyProxy:
+    """
+    TCP proxy delaying every packet by a fixed time in both directions, to measure the
+    statements against a database with the round trip time of a remote one.
+    """
+    def __init__(self, host: str, port: int, delay: float):
+        self.target = (host, port)
+        self.delay = delay
+        self.loop = asyncio.new_event_loop()
+        self.server = None
+
+    async def forward(self, reader, writer):
+        # Packets are delayed independently, a burst is not delayed once per packet
+        queue = asyncio.Queue()
+
+        async def send():
+            while (item := await queue.get())[1]:
+                await asyncio.sleep(max(0.0, item[0] - self.loop.time()))
+                writer.write(item[1])
+                await writer.drain()
+            writer.close()
+
+        sender = asyncio.create_task(send())
+        while True:
+            data = await reader.read(65536)
+            queue.put_nowait((self.loop.time() + self.delay, data))
+            if not data:
+                break
+        await sender
+
+    async def handle(self, client_reader, client_writer):
+        server_reader, server_writer = await asyncio.open_connection(*self.target)
+        await asyncio.gather(
+            self.forward(client_reader, server_writer), self.forward(server_reader, client_writer),
+            return_exceptions=True
+        )
+
+    def start(self) -> int:
+        """Serve on a free local port in a background thread and return the port."""
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        self.server = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(self.handle, "127.0.0.1", 0), self.loop
+        ).result()
+        return self.server.sockets[0].getsockname()[1]
+
+    async def shutdown(self):
+        self.server.close()
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.shutdown(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+def run_units(handler: DatabaseHandler, units_statements: List[List[tuple]], mode: str, commit: bool):
+    """
+    Execute the statements of some units the way `mode` sends them: one unit after the other
+    as text or prepared statements, or all units in one pipeline and transaction.
+    """
+    if mode == "pipeline":
+        handler.execute_and_commit([statement for statements in units_statements for statement in statements], True)
+        return
+    for statements in units_statements:
+        for query, params in statements:
+            handler.execute_query(query, params, prepare=mode == "prepared")
+        if commit:
+            handler.commit()
+
+
+def measure(handler: DatabaseHandler, build: Callable, commit: bool, mode: str, units: int, batch_size: int) -> float:
+    """Statements per second of `units` units sent the way `mode` sends them, in batches of `batch_size` units."""
+    units_statements = build(units)
+    start = time.perf_counter()
+    for index in range(0, units, batch_size):
+        run_units(handler, units_statements[index:index + batch_size], mode, commit)
+    seconds = time.perf_counter() - start
+    return sum(len(statements) for statements in units_statements) / seconds
+
+
+def clean_up(handler: DatabaseHandler):
+    for table in ("geo_mapping", "geo_cache", "prices_all"):
+        handler.execute_query(f"DELETE FROM {table} WHERE aviv_geo_id LIKE '{PREFIX}%%'")
+    handler.commit()
+
+
+def benchmark_statements(db_config, units: int = 1000, batch_size: int = 50) -> Dict[str, Dict[str, float]]:
+    """
+    Statements per second of each hot statement sent as plain text and as a prepared statement,
+    committed per unit like `cache_geo_response` and `store_price_in_db`, and for the writes also
+    as prepared statements of a whole batch in pipeline mode with one commit, like `cache_geo_responses`.
+
+    Lookups are not pipelined: the fetch pipeline needs each result before its next lookup.
+    """
+    handler = DatabaseHandler(db_config)
+    results = {}
+    with handler.borrow():
+        for name, (build, commit) in STATEMENTS.items():
+            results[name] = {}
+            for mode in MODES:
+                if mode == "pipeline" and not commit:
+                    continue
+                clean_up(handler)
+                if not commit:
+                    # Lookups read the rows the inserts wrote
+                    run_units(handler, geo_cache_rows(units), "pipeline", True)
+                results[name][mode] = measure(handler, build, commit, mode, units, batch_size)
+        clean_up(handler)
+    return results
+
+
+@click.command()
+@click.option('--units', default=1000, type=int, help='Units (statement groups) per statement and mode.')
+@click.option('--batch_size', default=50, type=int, help='Units per pipeline.')
+@click.option('--latency', default=0.0, type=float,
+              help='Delay in seconds added to each direction, e.g. 0.001 for a 2ms round trip.')
+async def main(units, batch_size, latency):
+    """
+    Measure statements/sec of the fetch pipeline's hot statements on the local db.test database.
+    """
+    from config import settings
+    Database(config=settings, test=True).initiate_db()
+    db_config = settings.db.test
+    proxy = None
+    if latency:
+        proxy = LatencyProxy(db_config.host, db_config.port, latency)
+        db_config = DynaBox({**db_config, 'host': '127.0.0.1', 'port': proxy.start()})
+    try:
+        results = benchmark_statements(db_config, units, batch_size)
+    finally:
+        DatabaseHandler.close_pools()
+        if proxy:
+            proxy.stop()
+    for name, modes in results.items():
+        for mode, rate in modes.items():
+            click.echo(f"{name:<18} {mode:<9} {rate:>10.0f} statements/s")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    main(_anyio_backend="asyncio")
@@ -1,11 +1,12 @@
 import asyncio
+import datetime
 import asyncclick as click
 import logging
-from concurrent.futures import ThreadPoolExecutor
-from src.db import DatabaseHandler
-from src.pipelines import APIToPostgres, PostgresToS3, AVIVRawToHDPrices, TransformedPricesHealthCheck
+from src.pipelines import APIToPostgres, PostgresToS3, AVIVRawToHDPrices, TransformedPricesHealthCheck, PriceAnomalyCheck
+from src.pipelines import PricesUpdater, SYNC_MODES, BackupToPostgres
 from src.lib.aws import S3Connector, SecretManager
-from src.lib import get_first_day_of_quarter, validate_year
+from src.lib import get_first_day_of_quarter, validate_year, metrics
+from src.lib.profiling import Profiler, PROFILE_MODES
 
 
 # Set up logging configuration
@@ -35,77 +36,57 @@ async def extract_prices(config, price_date: str, is_test: bool):
     geo_indices = config.test_geo_indices if is_test else config.geo_indices
     await pipeline.run(geo_indices=geo_indices, price_date=price_date)
 
-def transform_prices(config, is_test: bool):
+def transform_prices(config, is_test: bool, bulk_load: bool = False):
     """
     Transform raw data to HD prices schema.
     """
-    transformer = AVIVRawToHDPrices(config, is_test)
+    transformer = AVIVRawToHDPrices(config, is_test, bulk_load=bulk_load or None)
     transformer.run()
 
-def transformed_prices_health_check(config, is_test: bool):
+def transformed_prices_health_check(config, is_test: bool, price_date: str = None):
+    """
+    Run the health checks of the transformed quarter (default: latest active quarter).
+    """
     health_check = TransformedPricesHealthCheck(config, is_test)
-    health_check.run_all_checks()
+    geo_indices = config.test_geo_indices if is_test else config.geo_indices
+    health_check.run_all_checks(price_date=price_date, geo_indices=geo_indices)
+
+def price_anomaly_check(config, is_test: bool, price_date: str = None):
+    """
+    Check the quarter-over-quarter price changes of the transformed quarter (default: latest active quarter).
+    """
+    PriceAnomalyCheck(config, is_test).run(price_date=price_date)
 
-def backup_pg_to_filesystem(config, is_test: bool, save_local: bool):
+def backup_pg_to_filesystem(config, is_test: bool, save_local: bool, price_date: str = None, incremental: bool = False):
     """
-    Backup source tables' data (geo_cache, prices_all) from PostgreSQL to S3 or local data/ folder.
+    Backup source tables' data (geo_cache, prices_all) from PostgreSQL to S3 or local data/ folder,
+    in parallel from one snapshot and with a manifest of their row counts and checksums.
+    With a price date, partitioned tables only back up the partition of that quarter.
+    Incremental backups only store the chunks of the tables that changed since the previous one.
     """
     s3_connector = S3Connector(config)
     loader = PostgresToS3(config, s3_connector=s3_connector, test=is_test)
-    for table_name in ['geo_cache', 'prices_all']:
-        loader.run(table_name=table_name, local=save_local)
-
-
-class PricesUpdater:
-    def __init__(self, local_config, rds_config, chunk_size=10000):
-        self.local_handler = DatabaseHandler(local_config)
-        self.rds_handler = DatabaseHandler(rds_config)
-        self.chunk_size = chunk_size
-
-    def update_table(self, table_name):
-        """Update data from a local table to an RDS table."""
-        print(f"Processing table: {table_name}")
-
-        # Fetch column names
-        column_names = self.local_handler.fetch_column_names(table_name)
-
-        # Calculate total rows in the table
-        query = f"SELECT COUNT(*) FROM {table_name};"
-        with self.local_handler.conn.cursor() as cur:
-            cur.execute(query)
-            total_rows = cur.fetchone()[0]
-
-        print(f"Total rows in {table_name}: {total_rows}")
-
-        # Fetch and append data in chunks
-        offset = 0
-        while offset < total_rows:
-            chunk = self.local_handler.fetch_chunked_data(table_name, offset, self.chunk_size)
-            self.rds_handler.append_data(table_name, chunk, column_names)
-            offset += len(chunk)
-
-            progress = (offset / total_rows) * 100
-            print(f"Progress for {table_name}: {progress:.2f}%")
-
-        print(f"Data from {table_name} appended successfully!")
-
-    def run(self, tables):
-        """Run the update process for multiple tables asynchronously."""
-        try:
-            self.local_handler.connect()
-            self.rds_handler.connect()
-
-            with ThreadPoolExecutor() as executor:
-                futures = [executor.submit(self.update_table, table) for table in tables]
-                for future in futures:
-                    future.result()
-
-        except Exception as e:
-            print(f"An error occurred: {e}")
+    if incremental:
+        loader.backup_incremental(['geo_cache', 'prices_all'], local=save_local)
+    else:
+        loader.backup_tables(['geo_cache', 'prices_all'], local=save_local, price_date=price_date)
 
-        finally:
-            self.local_handler.close()
-            self.rds_handler.close()
+def seed_from_backup(
+    config, is_test: bool, source: str, incremental: bool = False, save_local: bool = False, at: str = None
+):
+    """
+    Seed source tables' data (geo_cache, prices_all) of a fresh database from a backup file or directory,
+    or from the incremental backup (on S3, or in data/incremental/ with --local) taken at or before `at`.
+    """
+    seeder = BackupToPostgres(config, is_test)
+    if incremental:
+        loader = PostgresToS3(config, s3_connector=S3Connector(config) if not save_local else None, test=is_test)
+        at = datetime.datetime.fromisoformat(at) if at else None
+        seeded = seeder.restore_incremental(loader.backup_store(save_local), at=at)
+        click.echo(f"Seeded rows from the incremental backup{f' at {at}' if at else ''}: {seeded}")
+        return
+    seeded = seeder.run(source=source)
+    click.echo(f"Seeded rows from {source}: {seeded}")
 
 
 async def run_etl_process(
@@ -115,7 +96,12 @@ async def run_etl_process(
     should_transform: bool, 
     is_test: bool, 
     save_local: bool,
-    is_production: bool
+    is_production: bool,
+    sync_mode: str = "delta",
+    bulk_load: bool = False,
+    source: str = "data",
+    incremental: bool = False,
+    at: str = None
 ):
     """
     Execute the ETL process based on the provided parameters.
@@ -138,36 +124,53 @@ async def run_etl_process(
         price_date = get_first_day_of_quarter(price_year + price_quarter)
         await extract_prices(config=settings, price_date=price_date, is_test=is_test)
 
-        backup_pg_to_filesystem(config=settings, is_test=is_test, save_local=save_local)
+        backup_pg_to_filesystem(
+            config=settings, is_test=is_test, save_local=save_local, price_date=price_date, incremental=incremental
+        )
         configure_secrets(secret_manager, action="update")
     elif process == "sync".casefold():
+        price_date = get_first_day_of_quarter(price_year + price_quarter) if price_year and price_quarter else None
         if should_transform:
-            transform_prices(config=settings, is_test=is_test)
-            transformed_prices_health_check(config=settings, is_test=is_test)
+            transform_prices(config=settings, is_test=is_test, bulk_load=bulk_load)
+            transformed_prices_health_check(config=settings, is_test=is_test, price_date=price_date)
+            price_anomaly_check(config=settings, is_test=is_test, price_date=price_date)
         if not is_test:
-            click.echo("Upload transformed tables to hd prices db")
+            click.echo(f"Upload transformed tables to hd prices db ({sync_mode})")
             local_conf = settings.db.dev
-            rds_conf = settings.aws.rds_config.prices_staging if not is_production \
-                else settings.aws.rds_config.prices_production
-            price_updater = PricesUpdater(local_conf, rds_conf)
+            target = "prices_production" if is_production else "prices_staging"
+            rds_conf = settings.aws.rds_config[target]
+            price_updater = PricesUpdater(local_conf, rds_conf, target=target, bulk_load=bulk_load)
             tables = [
-                "report_batches"
+                "report_batches",
                 "report_headers", 
                 "location_prices"
             ]
-            price_updater.run(tables)
+            mismatches = price_updater.run(tables, mode=sync_mode, price_date=price_date)
+            if mismatches and any(mismatches.values()):
+                raise click.ClickException(f"Local and RDS tables differ: {mismatches}")
+    elif process == "backup".casefold():
+        price_date = get_first_day_of_quarter(price_year + price_quarter) if price_year and price_quarter else None
+        backup_pg_to_filesystem(
+            config=settings, is_test=is_test, save_local=save_local, price_date=price_date, incremental=incremental
+        )
+    elif process == "seed".casefold():
+        seed_from_backup(
+            config=settings, is_test=is_test, source=source, incremental=incremental, save_local=save_local, at=at
+        )
 
 
 @click.command()
 @click.option(
     "--process",
     prompt="Which process is going to continue?",
-    type=click.Choice(["fetch", "sync"]), 
+    type=click.Choice(["fetch", "sync", "backup", "seed"]), 
     required=True,
     help="""
     Specify the process to execute.
     fetch: Fetch and save geo info and prices from AVIV API
     sync: Perform transformation and update transformed data to HD Prices staging/production DB
+    backup: Backup source tables to S3 (or data/ with --local) without fetching
+    seed: Load source tables from a backup (--source) with binary COPY
     """
 )
 @click.option('--price_year', help='Year for AVIV price API query.')
@@ -176,19 +179,84 @@ async def run_etl_process(
 @click.option('--test', is_flag=True, help='Run in test mode.')
 @click.option('--local', is_flag=True, help='Save source data tables locally.')
 @click.option('--sync_prod', is_flag=True, help='Sync prices data table to HD Prices production DB')
-async def main(process, price_year, price_quarter, transform, test, local, sync_prod):
+@click.option(
+    '--sync_mode',
+    type=click.Choice(SYNC_MODES),
+    default="delta",
+    help="""
+    How sync ships tables to HD Prices DB.
+    full: every row
+    delta: only rows changed since the last successful sync to the same DB
+    verify: compare per-quarter row counts and checksums, nothing is shipped
+    publish: load the quarter (--price_year/--price_quarter, default latest) into staging tables and swap it in atomically
+    """
+)
+@click.option(
+    '--bulk_load',
+    is_flag=True,
+    help='Drop non-unique indexes while transforming/syncing and rebuild them afterwards (concurrently on RDS).'
+)
+@click.option(
+    '--metrics_file',
+    help='Write per-stage metrics to this file (Prometheus text, OpenMetrics for .om files), e.g. data/metrics.prom'
+)
+@click.option('--trace', is_flag=True, help='Record spans of every pipeline stage to data/trace_<process>.json')
+@click.option(
+    '--profile',
+    type=click.Choice(PROFILE_MODES),
+    help="""
+    Profile the chosen process and write the results to data/.
+    cprofile: CPU profile (pstats + collapsed stacks)
+    yappi: asyncio-aware wall clock profile (pstats + collapsed stacks)
+    tracemalloc: memory snapshots at stage boundaries
+    """
+)
+@click.option('--profile_top', default=20, help='Number of entries in the printed profile summary.')
+@click.option(
+    '--source',
+    default="data",
+    help='Backup to seed from: a JSON/NDJSON backup file or a directory of them (default: data/).'
+)
+@click.option(
+    '--incremental',
+    is_flag=True,
+    help='Backup only the changed chunks of the tables (S3 incremental/ or data/incremental/ with --local), '
+         'or seed from such a backup.'
+)
+@click.option('--at', help='With seed --incremental: restore the backup taken at or before this ISO timestamp.')
+async def main(
+    process, price_year, price_quarter, transform, test, local, sync_prod, sync_mode, bulk_load, metrics_file, trace,
+    profile, profile_top, source, incremental, at
+):
     """
     Entry point for the ETL script.
     """
-    await run_etl_process(
-        process=process,
-        price_year=price_year,
-        price_quarter=price_quarter,
-        should_transform=transform,
-        is_test=test,
-        save_local=local,
-        is_production=sync_prod
-    )
+    metrics.enable_tracing(trace)
+    profiler = Profiler(profile, label=process, top=profile_top) if profile else None
+    if profiler:
+        profiler.start()
+    try:
+        await run_etl_process(
+            process=process,
+            price_year=price_year,
+            price_quarter=price_quarter,
+            should_transform=transform,
+            is_test=test,
+            save_local=local,
+            is_production=sync_prod,
+            sync_mode=sync_mode,
+            bulk_load=bulk_load,
+            source=source,
+            incremental=incremental,
+            at=at
+        )
+    finally:
+        if profiler:
+            profiler.stop()
+        if metrics_file:
+            metrics.write(metrics_file)
+        if trace:
+            metrics.write_trace(f"data/trace_{process}.json")
 
 if __name__ == "__main__":
     main(_anyio_backend="asyncio")
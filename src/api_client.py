@@ -1,8 +1,10 @@
 import logging
+import time
 import aiohttp
 from typing import Dict, List
 from aiohttp.client_exceptions import ClientConnectorDNSError, ContentTypeError
 from src.models import GeocodingResponse, PriceResponse
+from src.lib.metrics import metrics
 
 
 class APIClient:
@@ -15,26 +17,45 @@ class APIClient:
         self.geo_api_key = geoapi_key
         self.price_api_key = priceapi_key
 
-    async def _make_request(self, url: str, headers: Dict[str, str]) -> Dict:
+    async def _make_request(self, url: str, headers: Dict[str, str], endpoint: str = "unknown") -> Dict:
         """Helper method to make HTTP GET requests."""
+        status = "error"
+        start_time = time.perf_counter()
         async with aiohttp.ClientSession() as session:
             try:
                 async with session.get(url, headers=headers) as response:
+                    status = response.status
                     if response.status in {200, 404}:
-                        return await response.json()
+                        data = await response.json()
+                        self._record_query_duration(endpoint, data)
+                        return data
                     else:
                         self.logger.error(f"Unexpected status {response.status} for URL: {url}")
                         return {}
             except (ClientConnectorDNSError, ContentTypeError) as e:
                 self.logger.error(f"Connection error for URL: {url}. Error: {e}")
                 return {}
+            finally:
+                metrics.histogram("aviv_http_request_seconds", "AVIV API round trip time").observe(
+                    time.perf_counter() - start_time, endpoint=endpoint, status=status
+                )
+                metrics.counter("aviv_http_requests", "AVIV API requests").inc(endpoint=endpoint, status=status)
+
+    @staticmethod
+    def _record_query_duration(endpoint: str, data: Dict):
+        """Record the server side duration reported by the API, to tell API time from network time."""
+        query_duration = data.get('query_duration') if isinstance(data, dict) else None
+        if isinstance(query_duration, (int, float)):
+            metrics.histogram("aviv_api_query_seconds", "Query duration reported by the AVIV API").observe(
+                query_duration, endpoint=endpoint
+            )
 
     async def fetch_geocoding_data(self, base_url: str, geo_obj: Dict) -> GeocodingResponse:
         headers = {'X-Api-Key': self.geo_api_key}
         param_key = 'postal_code' if geo_obj['id'] == 'no_hd_geo_id_applicable' else 'city'
         url = f"{base_url}&{param_key}={geo_obj['name']}"
 
-        response = await self._make_request(url, headers)
+        response = await self._make_request(url, headers, endpoint='geocoding')
         if response:
             data = self._validate_geocoding_data(response.get('items', {}).get('aviv', []), param_key)
             if data:
@@ -47,7 +68,7 @@ class APIClient:
         headers = {'X-Api-Key': self.price_api_key}
         url = f"{base_url}/{geoid}?price_date={price_date}"
 
-        response = await self._make_request(url, headers)
+        response = await self._make_request(url, headers, endpoint='prices')
         if response:
             if response.get('items'):
                 data = response['items'][0]
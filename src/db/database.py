@@ -1,49 +1,184 @@
-import psycopg
+import atexit
 import json
 import logging
-from typing import List, Dict, Union
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import List, Dict, Optional, Set, Union
 from psycopg import sql
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import ConnectionPool
 from dynaconf import Dynaconf
+from dynaconf.utils.boxing import DynaBox
 from src.models import GeocodingResponse, PriceResponse
+from src.lib.metrics import metrics
+from src.lib.helpers import get_quarter_suffix, get_quarter_interval_bounds
 from src.db.query_base import CREATE_DB, CHECK_DB_EXISTENCE, RESET_SEQUENCE
 from src.db.query_base import create_source_schema, create_price_map_schema, insert_source
-from src.db.query_base import REFLECT_AVIVID, VALIDATE_PRICE_GEN, GET_SEQUENCE_VALUE
+from src.db.query_base import create_partitioned_source_schema, create_partitioned_price_map_schema
+from src.db.query_base import (
+    CHECK_PARTITIONED, CHECK_TABLE_EXISTENCE, CHECK_PARTITION_ATTACHED, CREATE_PARTITION_TABLE,
+    MOVE_FROM_DEFAULT_PARTITION, ATTACH_LIST_PARTITION, ATTACH_RANGE_PARTITION, DETACH_PARTITION,
+    LIST_TABLE_INDEXES, RENAME_TABLE, RENAME_INDEX, COPY_TABLE_ROWS, DROP_TABLE, GET_PRICE_DATES,
+    LIST_SECONDARY_INDEXES, DROP_INDEX, DROP_INDEX_CONCURRENTLY, CHECK_INVALID_INDEX,
+    CREATE_INDEX, CREATE_INDEX_CONCURRENTLY, ANALYZE_TABLE
+)
+from src.db.query_base import create_sync_schema, GET_PRIMARY_KEY, UPSERT_ROWS, CREATE_TRANSFORM_FUNCTION
+from src.db.query_base import TRANSFORM_FUNCTION_VERSION, GET_TRANSFORM_FUNCTION_VERSION, SET_TRANSFORM_FUNCTION_VERSION
+from src.db.query_base import PRUNE_GEO_MAPPING, REFRESH_GEO_MAPPING
+from src.db.query_base import CREATE_PRICES_ALL_INCOMING, COPY_PRICES_ALL_INCOMING, MERGE_PRICES_ALL_INCOMING
+from src.db.query_base import REFLECT_AVIVID, VALIDATE_PRICE_GEN
+from src.db.query_base import (
+    GET_GEO_COVERAGE, GET_CACHED_GEO_ENTRIES, UPSERT_GEO_COVERAGE, MARK_GEO_COVERAGE_REMOVED,
+    DELETE_GEO_CACHE_ENTRIES, GEO_COVERAGE_REPORT
+)
+
+
+GEO_COVERAGE_STATUSES = ('matched', 'defaulted', 'low_confidence', 'missing', 'removed')
+
+
+def _columns(rows: List[tuple], width: int) -> List[list]:
+    """Rows as one list per column, to pass them as arrays to unnest()."""
+    return [list(column) for column in zip(*rows)] if rows else [[] for _ in range(width)]
 
 
 class DatabaseHandler:
-    """A reusable database handler for establishing and managing database connections."""
+    """
+    A reusable database handler borrowing its connection from a pool shared per database.
+
+    Pool sizes and timeouts are read from the database config: `pool_min_size` (default 1),
+    `pool_max_size` (10), `pool_max_idle` seconds before idle connections above the minimum
+    are closed (300) and `pool_timeout` seconds to wait for a free connection (30).
+    Connections are checked before they are handed out.
+    """
+    _pools: Dict[tuple, ConnectionPool] = {}
+    _pools_lock = threading.Lock()
+
     def __init__(self, db_config):
         self.logger = logging.getLogger(self.__class__.__name__)
         self.db_config = db_config
         self.conn = None
+        self._pool = None
+        self._borrowed = 0
+
+    @property
+    def pool_key(self) -> tuple:
+        return (self.db_config.host, self.db_config.port, self.db_config.database, self.db_config.username)
+
+    def pool(self) -> ConnectionPool:
+        """The pool of this handler's database, opened on first use."""
+        with self._pools_lock:
+            pool = self._pools.get(self.pool_key)
+            if pool is None:
+                pool = ConnectionPool(
+                    conninfo=make_conninfo(
+                        host=self.db_config.host,
+                        port=self.db_config.port,
+                        dbname=self.db_config.database,
+                        user=self.db_config.username,
+                        password=self.db_config.password
+                    ),
+                    min_size=self.db_config.get('pool_min_size', 1),
+                    max_size=self.db_config.get('pool_max_size', 10),
+                    max_idle=self.db_config.get('pool_max_idle', 300),
+                    timeout=self.db_config.get('pool_timeout', 30),
+                    check=ConnectionPool.check_connection,
+                    reset=self._reset_connection,
+                    name=self.db_config.database,
+                    open=True
+                )
+                self._pools[self.pool_key] = pool
+            return pool
+
+    @staticmethod
+    def _reset_connection(conn):
+        conn.autocommit = False
+        conn.isolation_level = None
+
+    @classmethod
+    def close_pools(cls, database: Optional[str] = None):
+        """Close the pools of a database (default: all), e.g. before dropping it."""
+        with cls._pools_lock:
+            for key in [key for key in cls._pools if database in (None, key[2])]:
+                cls._pools.pop(key).close()
+
+    def _record_pool_stats(self):
+        stats = self._pool.get_stats()
+        connections = metrics.gauge("db_pool_connections", "Connections of the database pool by state")
+        connections.set(stats.get('pool_size', 0), database=self.db_config.database, state='open')
+        connections.set(stats.get('pool_available', 0), database=self.db_config.database, state='idle')
 
     def connect(self):
-        """Establish a database connection."""
+        """Borrow a connection from the pool, unless this handler holds one already."""
+        if self.conn is not None and not self.conn.closed:
+            return
         try:
-            self.conn = psycopg.connect(
-                host=self.db_config.host,
-                port=self.db_config.port,
-                dbname=self.db_config.database,
-                user=self.db_config.username,
-                password=self.db_config.password
-            )
+            with metrics.histogram(
+                "db_pool_acquire_seconds", "Time waited for a pooled connection"
+            ).time(database=self.db_config.database):
+                self._pool = self.pool()
+                self.conn = self._pool.getconn()
+            self._record_pool_stats()
         except Exception as error:
             self.logger.error(f"Error connecting to the database: {error}")
             raise
 
     def close(self):
-        """Close the database connection."""
+        """Return the connection to the pool, rolling back an open transaction."""
         if self.conn:
-            self.conn.close()
+            # The pool it came from, even if the pools were closed and reopened meanwhile
+            self._pool.putconn(self.conn)
+            self.conn = None
+            self._record_pool_stats()
+
+    @contextmanager
+    def borrow(self):
+        """
+        Return the connection used inside a block to the pool when the block ends.
 
-    def execute_query(self, query, params=None):
-        """Execute a query with optional parameters."""
+        The connection is taken on the first query. Nested blocks share it, the outermost
+        block returns it, also when it was taken before the block.
+        """
+        self._borrowed += 1
+        try:
+            yield self
+        finally:
+            self._borrowed -= 1
+            if not self._borrowed:
+                self.close()
+
+    def __del__(self):
+        # A handler dropped without close() would keep its connection out of the pool
+        if self.conn is not None and self._pool is not None and not self._pool.closed:
+            self._pool.putconn(self.conn)
+
+    def execute_query(self, query, params=None, prepare: Optional[bool] = None):
+        """
+        Execute a query with optional parameters.
+
+        :param prepare: True to use a server-side prepared statement from the first execution,
+            None to let psycopg prepare it after a few executions, False to never prepare it.
+        """
         if not self.conn:
             self.connect()
         with self.conn.cursor() as cur:
-            cur.execute(query, params)
+            cur.execute(query, params, prepare=prepare)
             return cur.fetchall() if cur.description else None
 
+    def execute_and_commit(self, statements: List[tuple], pipeline: bool = False):
+        """
+        Execute statements without results as prepared statements and commit them together.
+
+        :param statements: (query, params) pairs.
+        :param pipeline: Send all statements and the commit in pipeline mode, without waiting
+            for each result: a couple of round trips for the whole list instead of one per statement.
+        """
+        if not self.conn:
+            self.connect()
+        with self.conn.pipeline() if pipeline else nullcontext(), self.conn.cursor() as cur:
+            for query, params in statements:
+                cur.execute(query, params, prepare=True)
+            self.conn.commit()
+
     def commit(self):
         """Commit changes to the database."""
         if self.conn:
@@ -83,26 +218,124 @@ class DatabaseHandler:
         with self.conn.cursor() as cur:
             for row in data:
                 cur.execute(query, row)
-            self.connection.commit()
+            self.conn.commit()
+
+    def fetch_primary_key(self, table_name):
+        """Retrieves the primary key columns of a table."""
+        return [row[0] for row in self.execute_query(GET_PRIMARY_KEY, (table_name,)) or []]
+
+    @staticmethod
+    def upsert_query(template, table_name, column_names, key_columns, **kwargs) -> sql.Composed:
+        """Format an INSERT ... ON CONFLICT ({keys}) DO UPDATE SET {updates} template."""
+        return sql.SQL(template).format(
+            table=sql.Identifier(table_name),
+            columns=sql.SQL(', ').join(map(sql.Identifier, column_names)),
+            keys=sql.SQL(', ').join(map(sql.Identifier, key_columns)),
+            updates=sql.SQL(', ').join(
+                sql.SQL("{} = EXCLUDED.{}").format(sql.Identifier(column), sql.Identifier(column))
+                for column in column_names if column not in key_columns
+            ),
+            **kwargs
+        )
+
+    def upsert_data(self, table_name, data, column_names, key_columns):
+        """Inserts rows into a table, updating rows whose key already exists."""
+        query = self.upsert_query(
+            UPSERT_ROWS, table_name, column_names, key_columns,
+            placeholders=sql.SQL(', ').join(sql.Placeholder() * len(column_names))
+        )
+        if not self.conn:
+            self.connect()
+
+        with self.conn.cursor() as cur:
+            cur.executemany(query, data)
+            self.conn.commit()
+
+    def analyze_tables(self, table_names):
+        """Refresh planner statistics of tables."""
+        for table_name in table_names:
+            self.execute_query(sql.SQL(ANALYZE_TABLE).format(sql.Identifier(table_name)))
+        self.commit()
+
+    @contextmanager
+    def deferred_indexes(self, table_names, concurrently=False):
+        """
+        Drop the non-unique indexes of tables for a bulk load and rebuild them afterwards.
+
+        Unique and primary key indexes stay, so ON CONFLICT keeps working. The indexes are
+        rebuilt even if the load fails; with `concurrently` they are dropped and rebuilt with
+        DROP/CREATE INDEX CONCURRENTLY so readers are not blocked (not possible on partitioned
+        tables). An invalid index left by a failed concurrent build is dropped and built again.
+        """
+        if not self.conn:
+            self.connect()
+        dropped = []
+        self.commit()
+        with self._autocommit(concurrently):
+            for table_name in table_names:
+                for index_name, definition, partitioned in self.execute_query(LIST_SECONDARY_INDEXES, (table_name,)):
+                    self.logger.warning(f"Dropping index for bulk load: {index_name} ON {table_name}{definition}")
+                    self._drop_index(index_name, concurrently and not partitioned)
+                    dropped.append((index_name, table_name, definition, partitioned))
+            self.commit()
+        try:
+            yield dropped
+        except Exception:
+            self.conn.rollback()
+            raise
+        finally:
+            with metrics.span("rebuild_indexes", tables=",".join(table_names)):
+                self.commit()
+                with self._autocommit(concurrently):
+                    for index_name, table_name, definition, partitioned in dropped:
+                        concurrent_build = concurrently and not partitioned
+                        invalid = self.execute_query(CHECK_INVALID_INDEX, (index_name,))
+                        if invalid and invalid[0][0]:
+                            self.logger.warning(f"Dropping invalid index {index_name} before rebuilding it.")
+                            self._drop_index(index_name, concurrent_build)
+                        query = CREATE_INDEX_CONCURRENTLY if concurrent_build else CREATE_INDEX
+                        self.execute_query(sql.SQL(query).format(
+                            sql.Identifier(index_name), sql.Identifier(table_name), sql.SQL(definition)
+                        ))
+                    self.commit()
+            self.logger.info(f"Rebuilt {len(dropped)} indexes on {', '.join(table_names)}.")
+
+    def _drop_index(self, index_name: str, concurrently: bool):
+        query = DROP_INDEX_CONCURRENTLY if concurrently else DROP_INDEX
+        self.execute_query(sql.SQL(query).format(sql.Identifier(index_name)))
+
+    @contextmanager
+    def _autocommit(self, enabled: bool):
+        """Run statements in autocommit mode, required by the CONCURRENTLY index commands."""
+        autocommit = self.conn.autocommit
+        self.conn.autocommit = enabled
+        try:
+            yield
+        finally:
+            self.conn.autocommit = autocommit
+
+
+atexit.register(DatabaseHandler.close_pools)
+
 
 class Database:
+    # Tables partitioned by quarter when `db.params.partition_by_quarter` is enabled
+    PARTITIONED_TABLES = ['prices_all', 'location_prices']
+
     def __init__(self, config: Dynaconf, test=False):
         self.logger = logging.getLogger(self.__class__.__name__)
         self.db_handler = DatabaseHandler(config.db.dev if not test else config.db.test)
         self.db_params = config.db.params
+        self.partition_by_quarter = self.db_params.get('partition_by_quarter', False)
 
     def create_database(self):
         """Ensure the database exists, creating it if necessary."""
+        maintenance = DatabaseHandler(DynaBox({**self.db_handler.db_config, 'database': 'postgres'}))
         try:
-            with psycopg.connect(
-                host=self.db_handler.db_config.host,
-                port=self.db_handler.db_config.port,
-                dbname="postgres",
-                user=self.db_handler.db_config.username,
-                password=self.db_handler.db_config.password
-            ) as conn:
-                conn.autocommit = True
-                with conn.cursor() as cur:
+            with maintenance.borrow():
+                maintenance.connect()
+                maintenance.conn.autocommit = True
+                with maintenance.conn.cursor() as cur:
                     cur.execute(sql.SQL(CHECK_DB_EXISTENCE).format(sql.Literal(self.db_handler.db_config.database)))
                     if not cur.fetchone():
                         cur.execute(sql.SQL(CREATE_DB).format(sql.Identifier(self.db_handler.db_config.database)))
@@ -117,8 +350,20 @@ class Database:
         """Create required tables in the database if they do not exist."""
         self.db_handler.connect()
         with self.db_handler.conn.cursor() as cur:
-            self.execute_nested_query_structure(cur, create_source_schema)
-            self.execute_nested_query_structure(cur, create_price_map_schema)
+            if self.partition_by_quarter:
+                for table_name in self.PARTITIONED_TABLES:
+                    self._rename_unpartitioned_table(cur, table_name)
+                self.execute_nested_query_structure(cur, create_partitioned_source_schema)
+                self.execute_nested_query_structure(cur, create_partitioned_price_map_schema)
+                for table_name in self.PARTITIONED_TABLES:
+                    self._migrate_unpartitioned_rows(cur, table_name)
+            else:
+                self.execute_nested_query_structure(cur, create_source_schema)
+                self.execute_nested_query_structure(cur, create_price_map_schema)
+            self.execute_nested_query_structure(cur, create_sync_schema)
+            self._install_transform_function(cur)
+            cur.execute(PRUNE_GEO_MAPPING)
+            cur.execute(REFRESH_GEO_MAPPING)
             if not self.db_handler.db_config.database == 'test_db':
                 cur.execute(
                     sql.SQL(RESET_SEQUENCE).format(
@@ -129,6 +374,137 @@ class Database:
         self.db_handler.commit()
         self.logger.info("Tables created successfully.")
 
+    def _install_transform_function(self, cursor):
+        """(Re)create the transform function only when its definition changed, keeping its cached plans."""
+        cursor.execute(GET_TRANSFORM_FUNCTION_VERSION)
+        if cursor.fetchone()[0] == TRANSFORM_FUNCTION_VERSION:
+            return
+        cursor.execute(CREATE_TRANSFORM_FUNCTION)
+        cursor.execute(sql.SQL(SET_TRANSFORM_FUNCTION_VERSION).format(sql.Literal(TRANSFORM_FUNCTION_VERSION)))
+        self.logger.info("Installed the transform function.")
+
+    def _rename_unpartitioned_table(self, cursor, table_name: str):
+        """Move an existing heap table (and its indexes) aside so the partitioned one can be created."""
+        cursor.execute(sql.SQL(CHECK_TABLE_EXISTENCE).format(sql.Literal(table_name)))
+        if not cursor.fetchone()[0]:
+            return
+        cursor.execute(sql.SQL(CHECK_PARTITIONED).format(sql.Literal(table_name)))
+        if cursor.fetchone()[0]:
+            return
+        self.logger.info(f"Converting '{table_name}' to a table partitioned by quarter...")
+        cursor.execute(sql.SQL(LIST_TABLE_INDEXES).format(sql.Literal(table_name)))
+        for (index_name,) in cursor.fetchall():
+            cursor.execute(sql.SQL(RENAME_INDEX).format(
+                sql.Identifier(index_name), sql.Identifier(f"{index_name[:50]}_unpartitioned")
+            ))
+        cursor.execute(sql.SQL(RENAME_TABLE).format(
+            sql.Identifier(table_name), sql.Identifier(f"{table_name}_unpartitioned")
+        ))
+
+    def _migrate_unpartitioned_rows(self, cursor, table_name: str):
+        """Copy rows of a renamed heap table into quarter partitions and drop it."""
+        old_table = f"{table_name}_unpartitioned"
+        cursor.execute(sql.SQL(CHECK_TABLE_EXISTENCE).format(sql.Literal(old_table)))
+        if not cursor.fetchone()[0]:
+            return
+        if table_name == 'prices_all':
+            cursor.execute(sql.SQL(GET_PRICE_DATES).format(sql.Identifier(old_table)))
+            for (price_date,) in cursor.fetchall():
+                self._ensure_quarter_partitions(cursor, price_date)
+        cursor.execute(sql.SQL(COPY_TABLE_ROWS).format(sql.Identifier(table_name), sql.Identifier(old_table)))
+        migrated = cursor.rowcount
+        cursor.execute(sql.SQL(DROP_TABLE).format(sql.Identifier(old_table)))
+        self.logger.info(f"Migrated {migrated} rows of '{table_name}' into quarter partitions.")
+
+    def is_partitioned(self, table_name: str) -> bool:
+        """Check whether a table is a partitioned table."""
+        result = self.db_handler.execute_query(sql.SQL(CHECK_PARTITIONED).format(sql.Literal(table_name)))
+        return bool(result and result[0][0])
+
+    def ensure_quarter_partitions(self, price_date: str):
+        """
+        Create the quarter partitions of prices_all and location_prices for a price date.
+
+        Rows of that quarter already sitting in the default partitions are moved over.
+        No-op for unpartitioned tables.
+        """
+        if not self.db_handler.conn:
+            self.db_handler.connect()
+        with self.db_handler.conn.cursor() as cur:
+            self._ensure_quarter_partitions(cur, price_date)
+        self.db_handler.commit()
+
+    def _ensure_quarter_partitions(self, cursor, price_date: str):
+        suffix = get_quarter_suffix(price_date)
+        interval_from, interval_to = get_quarter_interval_bounds(price_date)
+        partitions = [
+            (
+                'prices_all', sql.SQL(ATTACH_LIST_PARTITION), [sql.Literal(price_date)],
+                sql.SQL("price_date = {}").format(sql.Literal(price_date))
+            ),
+            (
+                'location_prices', sql.SQL(ATTACH_RANGE_PARTITION),
+                [sql.Literal(interval_from), sql.Literal(interval_to)],
+                sql.SQL('"interval" >= {} AND "interval" < {}').format(
+                    sql.Literal(interval_from), sql.Literal(interval_to)
+                )
+            )
+        ]
+        for table_name, attach_query, bounds, condition in partitions:
+            cursor.execute(sql.SQL(CHECK_PARTITIONED).format(sql.Literal(table_name)))
+            if not cursor.fetchone()[0]:
+                continue
+            partition = f"{table_name}_{suffix}"
+            cursor.execute(sql.SQL(CHECK_PARTITION_ATTACHED).format(sql.Literal(partition)))
+            if cursor.fetchone()[0]:
+                continue
+            cursor.execute(sql.SQL(CREATE_PARTITION_TABLE).format(sql.Identifier(partition), sql.Identifier(table_name)))
+            cursor.execute(sql.SQL(MOVE_FROM_DEFAULT_PARTITION).format(
+                sql.Identifier(f"{table_name}_default"), condition, sql.Identifier(partition)
+            ))
+            cursor.execute(attach_query.format(sql.Identifier(table_name), sql.Identifier(partition), *bounds))
+            self.logger.info(f"Created partition '{partition}'.")
+
+    def detach_quarter_partition(self, table_name: str, price_date: str, drop: bool = False) -> str:
+        """
+        Detach the quarter partition of a table, e.g. to archive an old quarter.
+
+        :param table_name: prices_all or location_prices.
+        :param price_date: First day of the quarter.
+        :param drop: Drop the detached partition as well.
+        :return: Name of the detached partition.
+        """
+        partition = f"{table_name}_{get_quarter_suffix(price_date)}"
+        self.db_handler.execute_query(
+            sql.SQL(DETACH_PARTITION).format(sql.Identifier(table_name), sql.Identifier(partition))
+        )
+        if drop:
+            self.db_handler.execute_query(sql.SQL(DROP_TABLE).format(sql.Identifier(partition)))
+        self.db_handler.commit()
+        self.logger.info(f"Detached partition '{partition}'{' and dropped it' if drop else ''}.")
+        return partition
+
+    def refresh_geo_mapping(self) -> int:
+        """
+        Bring geo_mapping in line with geo_cache, e.g. after loading or cleaning up geo_cache in bulk.
+
+        :return: Number of mapping entries removed or added.
+        """
+        if not self.db_handler.conn:
+            self.db_handler.connect()
+        with self.db_handler.conn.cursor() as cur:
+            cur.execute(PRUNE_GEO_MAPPING)
+            changed = cur.rowcount
+            cur.execute(REFRESH_GEO_MAPPING)
+            changed += cur.rowcount
+        self.db_handler.commit()
+        return changed
+
+    def get_price_dates(self) -> List[str]:
+        """Retrieve all price dates present in prices_all."""
+        result = self.db_handler.execute_query(sql.SQL(GET_PRICE_DATES).format(sql.Identifier('prices_all')))
+        return [row[0] for row in result] if result else []
+
     def execute_nested_query_structure(self, cursor, query_structure: Dict[str, Union[str, Dict[str, str]]]):
         """Execute a nested structure of SQL queries."""
         for table_name, queries in query_structure.items():
@@ -147,13 +523,51 @@ class Database:
 
     def get_cached_geoid(self, geo_index: List[str]):
         """Retrieve cached geo_id for a given zip code."""
-        query = REFLECT_AVIVID % ', '.join('%s' for _ in geo_index)
-        result = self.db_handler.execute_query(query, geo_index)
+        result = self.db_handler.execute_query(REFLECT_AVIVID, (list(geo_index),), prepare=True)
         return [row[0] for row in result] if result else None
 
-    def cache_geo_response(self, geocoding_response: GeocodingResponse):
-        """Cache geocoding response data in the geo_cache table."""
-        query = insert_source['geo_cache']
+    def get_geo_coverage(self) -> Dict[tuple, tuple]:
+        """
+        Entries of geo_indices.json covered by the previous fetch.
+
+        :return: {(level, entry_key): (geo_index, hd_geo_id, entry_hash, cached)}
+        """
+        result = self.db_handler.execute_query(GET_GEO_COVERAGE)
+        return {(level, entry_key): tuple(entry) for level, entry_key, *entry in result or []}
+
+    def get_cached_geo_entries(self, entries: List[tuple]) -> Set[tuple]:
+        """Which of the (geo_index, hd_geo_id) pairs are in geo_cache."""
+        result = self.db_handler.execute_query(GET_CACHED_GEO_ENTRIES, _columns(entries, 2))
+        return {tuple(row) for row in result or []}
+
+    def save_geo_coverage(self, entries: List[tuple], removed: List[tuple], stale: List[tuple]):
+        """
+        Record the covered entries of geo_indices.json in one transaction.
+
+        :param entries: (level, entry_key, geo_index, hd_geo_id, entry_hash) of added or changed entries.
+        :param removed: (level, entry_key) of entries removed from geo_indices.json.
+        :param stale: (geo_index, hd_geo_id) of geo_cache rows to delete, e.g. of renamed cities.
+        """
+        self.db_handler.execute_and_commit([
+            (UPSERT_GEO_COVERAGE, _columns(entries, 5)),
+            (MARK_GEO_COVERAGE_REMOVED, _columns(removed, 2)),
+            (DELETE_GEO_CACHE_ENTRIES, _columns(stale, 2)),
+        ])
+
+    def geo_coverage_report(self, min_confidence_score: int) -> Dict[str, Dict[str, int]]:
+        """
+        Covered entries per level by status: matched, defaulted (`no_aviv_id_available`),
+        low_confidence (below `min_confidence_score`), missing from geo_cache, and removed.
+        """
+        report = {level: dict.fromkeys(GEO_COVERAGE_STATUSES, 0) for level in ('zip_codes', 'cities')}
+        rows = self.db_handler.execute_query(GEO_COVERAGE_REPORT, {'min_confidence_score': min_confidence_score})
+        for level, status, count in rows or []:
+            report[level][status] = count
+        return report
+
+    @staticmethod
+    def geo_cache_statements(geocoding_response: GeocodingResponse) -> List[tuple]:
+        """The geo_cache and geo_mapping inserts of a geocoding response."""
         geocoding_data = (
             geocoding_response.geo_index,
             geocoding_response.hd_geo_id,
@@ -163,8 +577,26 @@ class Database:
             geocoding_response.match_name,
             geocoding_response.confidence_score
         )
-        self.db_handler.execute_query(query, geocoding_data)
-        self.db_handler.commit()
+        return [(insert_source['geo_cache'], geocoding_data), (insert_source['geo_mapping'], geocoding_data[:3])]
+
+    def cache_geo_response(self, geocoding_response: GeocodingResponse):
+        """Cache geocoding response data in the geo_cache table."""
+        with metrics.histogram("db_write_seconds", "Latency of database writes").time(table='geo_cache'):
+            self.db_handler.execute_and_commit(self.geo_cache_statements(geocoding_response))
+
+    def cache_geo_responses(self, geocoding_responses: List[GeocodingResponse]) -> Dict[str, int]:
+        """
+        Cache a batch of geocoding responses in one transaction, sent in pipeline mode.
+
+        :return: Number of cached responses.
+        """
+        statements = [
+            statement for geocoding_response in geocoding_responses
+            for statement in self.geo_cache_statements(geocoding_response)
+        ]
+        with metrics.histogram("db_write_seconds", "Latency of database writes").time(table='geo_cache_bulk'):
+            self.db_handler.execute_and_commit(statements, pipeline=True)
+        return {'cached': len(geocoding_responses)}
 
     def get_validated_price(self, price_date: str):
         """Retrieve validated price data."""
@@ -184,11 +616,41 @@ class Database:
                 json.dumps(price_response.apartment_price),
                 json.dumps(price_response.hybrid_price)
             )
-            self.db_handler.execute_query(query, price_data)
-            self.db_handler.commit()
+            with metrics.histogram("db_write_seconds", "Latency of database writes").time(table='prices_all'):
+                self.db_handler.execute_and_commit([(query, price_data)])
 
-    def get_last_value_sequence(self):
-        """Retrieve the last value of a sequence."""
-        query = sql.SQL(GET_SEQUENCE_VALUE).format(sql.Identifier('report_batches_id_seq'))
-        result = self.db_handler.execute_query(query)
-        return result[0][0] if result else None
+    def store_prices_in_db(self, price_responses: List[PriceResponse]) -> Dict[str, int]:
+        """
+        Store a batch of price responses in prices_all with one COPY and one merge.
+
+        Same semantics as `store_price_in_db`: new units are inserted, rows stored without a
+        transaction type are replaced, priced rows are kept.
+        :return: Number of rows inserted, upgraded from NULL and skipped.
+        """
+        rows = [
+            (
+                price_response.place_id,
+                price_response.price_date,
+                price_response.transaction_type,
+                json.dumps(price_response.house_price),
+                json.dumps(price_response.apartment_price),
+                json.dumps(price_response.hybrid_price)
+            )
+            for price_response in price_responses if price_response
+        ]
+        if not self.db_handler.conn:
+            self.db_handler.connect()
+        with metrics.histogram("db_write_seconds", "Latency of database writes").time(table='prices_all_bulk'):
+            with self.db_handler.conn.cursor() as cur:
+                cur.execute(CREATE_PRICES_ALL_INCOMING)
+                with cur.copy(COPY_PRICES_ALL_INCOMING) as copy:
+                    for row in rows:
+                        copy.write_row(row)
+                cur.execute(MERGE_PRICES_ALL_INCOMING)
+                inserted, upgraded = cur.fetchone()
+            self.db_handler.commit()
+        outcome = {'inserted': inserted, 'upgraded': upgraded, 'skipped': len(rows) - inserted - upgraded}
+        merged_rows = metrics.counter("prices_all_merged_rows", "Rows of bulk price batches by outcome")
+        for result, count in outcome.items():
+            merged_rows.inc(count, result=result)
+        return outcome
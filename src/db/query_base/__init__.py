@@ -1,4 +1,13 @@
 from .create import create_source_schema, create_price_map_schema
+from .create import create_partitioned_source_schema, create_partitioned_price_map_schema
 from .insert import insert_source, insert_price_map
+from .insert import CREATE_TRANSFORM_FUNCTION, RUN_TRANSFORM_FUNCTION
+from .insert import TRANSFORM_FUNCTION_VERSION, GET_TRANSFORM_FUNCTION_VERSION, SET_TRANSFORM_FUNCTION_VERSION
+from .insert import PRUNE_GEO_MAPPING, REFRESH_GEO_MAPPING
+from .insert import CREATE_PRICES_ALL_INCOMING, COPY_PRICES_ALL_INCOMING, MERGE_PRICES_ALL_INCOMING
 from .db_setup import *
 from .validation import *
+from .sync import *
+from .restore import *
+from .backup import *
+from .coverage import *
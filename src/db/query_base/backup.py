@@ -0,0 +1,30 @@
+# Snapshot of the exporting transaction, importable by other transactions until it ends
+EXPORT_SNAPSHOT = "SELECT pg_export_snapshot()"
+
+SET_TRANSACTION_SNAPSHOT = "SET TRANSACTION SNAPSHOT {}"
+
+# How incremental backups split each table into chunks: prices_all per price date (one chunk
+# per quarter), geo_cache in 256 buckets of geo_index so new entries only change a few chunks
+INCREMENTAL_CHUNKS = {
+    "prices_all": "price_date",
+    "geo_cache": "left(md5(geo_index), 2)",
+}
+
+# Rows and an MD5 of the ordered rows per chunk, telling changed chunks apart without reading them
+CHUNK_FINGERPRINTS = """
+    SELECT {chunk} AS chunk, COUNT(*), md5(string_agg(t::text, E'\\n' ORDER BY {keys}))
+    FROM {table} t
+    GROUP BY 1
+    ORDER BY 1
+"""
+
+SELECT_CHUNK_ROWS = "SELECT * FROM {table} t WHERE {chunk} = %s ORDER BY {keys}"
+
+# Sort columns and partition column of indexed local backups: each quarter of prices_all is a
+# contiguous range sorted by aviv_geo_id, geo_cache is sorted by aviv_geo_id
+INDEXED_BACKUP_ORDER = {
+    "prices_all": (["price_date", "aviv_geo_id"], "price_date"),
+    "geo_cache": (["aviv_geo_id", "geo_index", "hd_geo_id"], None),
+}
+
+SELECT_SORTED_ROWS = "SELECT * FROM {table} ORDER BY {order}"
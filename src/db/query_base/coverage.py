@@ -0,0 +1,62 @@
+# Entries of geo_indices.json covered by the previous fetch, and whether each is still in geo_cache
+GET_GEO_COVERAGE = """
+    SELECT cv.level, cv.entry_key, cv.geo_index, cv.hd_geo_id, cv.entry_hash, EXISTS (
+        SELECT 1 FROM geo_cache gc WHERE gc.geo_index = cv.geo_index AND gc.hd_geo_id = cv.hd_geo_id
+    )
+    FROM geo_coverage cv
+    WHERE cv.removed_at IS NULL
+"""
+
+# The (geo_index, hd_geo_id) pairs of two arrays that are cached, in one statement however many they are
+GET_CACHED_GEO_ENTRIES = """
+    SELECT gc.geo_index, gc.hd_geo_id
+    FROM geo_cache gc
+    JOIN unnest(%s::text[], %s::text[]) AS e (geo_index, hd_geo_id)
+    ON gc.geo_index = e.geo_index AND gc.hd_geo_id = e.hd_geo_id
+"""
+
+# Column arrays: level, entry_key, geo_index, hd_geo_id, entry_hash. A removed entry added again is active again.
+UPSERT_GEO_COVERAGE = """
+    INSERT INTO geo_coverage (level, entry_key, geo_index, hd_geo_id, entry_hash)
+    SELECT * FROM unnest(%s::text[], %s::text[], %s::text[], %s::text[], %s::text[])
+    ON CONFLICT (level, entry_key) DO UPDATE SET
+        geo_index = EXCLUDED.geo_index,
+        hd_geo_id = EXCLUDED.hd_geo_id,
+        entry_hash = EXCLUDED.entry_hash,
+        updated_at = now(),
+        removed_at = NULL
+"""
+
+# Column arrays: level, entry_key
+MARK_GEO_COVERAGE_REMOVED = """
+    UPDATE geo_coverage cv SET removed_at = now(), updated_at = now()
+    FROM unnest(%s::text[], %s::text[]) AS e (level, entry_key)
+    WHERE cv.level = e.level AND cv.entry_key = e.entry_key AND cv.removed_at IS NULL
+"""
+
+# Column arrays: geo_index, hd_geo_id, e.g. of cities cached under the name they had before
+DELETE_GEO_CACHE_ENTRIES = """
+    DELETE FROM geo_cache gc
+    USING unnest(%s::text[], %s::text[]) AS e (geo_index, hd_geo_id)
+    WHERE gc.geo_index = e.geo_index AND gc.hd_geo_id = e.hd_geo_id
+"""
+
+# Entries per level and status: matched, defaulted (geocoded to `no_aviv_id_available`), low_confidence
+# (a confidence_score below %(min_confidence_score)s), missing (not in geo_cache) or removed
+GEO_COVERAGE_REPORT = """
+    SELECT level, status, COUNT(*)
+    FROM (
+        SELECT
+            cv.level,
+            CASE
+                WHEN cv.removed_at IS NOT NULL THEN 'removed'
+                WHEN gc.aviv_geo_id IS NULL THEN 'missing'
+                WHEN gc.aviv_geo_id = 'no_aviv_id_available' THEN 'defaulted'
+                WHEN COALESCE(gc.confidence_score, 0) < %(min_confidence_score)s THEN 'low_confidence'
+                ELSE 'matched'
+            END AS status
+        FROM geo_coverage cv
+        LEFT JOIN geo_cache gc ON gc.geo_index = cv.geo_index AND gc.hd_geo_id = cv.hd_geo_id
+    ) entries
+    GROUP BY level, status
+"""
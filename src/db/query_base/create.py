@@ -10,6 +10,23 @@ create_prices_all = """
     )
 """
 
+create_prices_all_partitioned = {
+    "prices_all": """
+        CREATE TABLE IF NOT EXISTS prices_all (
+            aviv_geo_id TEXT,
+            price_date TEXT,
+            transaction_type TEXT,
+            house_price JSON,
+            apartment_price JSON,
+            hybrid_price JSON,
+            PRIMARY KEY (aviv_geo_id, price_date)
+        ) PARTITION BY LIST (price_date)
+    """,
+    "default_partition": """
+        CREATE TABLE IF NOT EXISTS prices_all_default PARTITION OF prices_all DEFAULT
+    """
+}
+
 create_geo_cache = """
     CREATE TABLE IF NOT EXISTS geo_cache (
         geo_index TEXT,
@@ -23,6 +40,48 @@ create_geo_cache = """
     )
 """
 
+# geo_cache resolved to the location fields of location_prices: `level` is the report header
+# name the entry is priced under, zip codes carry `zip_code` and cities `city_id`.
+create_geo_mapping = {
+    "geo_mapping": """
+        CREATE TABLE IF NOT EXISTS geo_mapping (
+            geo_index TEXT NOT NULL,
+            hd_geo_id TEXT NOT NULL,
+            aviv_geo_id TEXT NOT NULL,
+            level TEXT NOT NULL CHECK (level IN ('zip_codes', 'cities')),
+            zip_code varchar NULL,
+            city_id varchar NULL,
+            PRIMARY KEY (geo_index, hd_geo_id)
+        )
+    """,
+    "index_level_and_aviv_geo_id": """
+        CREATE INDEX IF NOT EXISTS index_geo_mapping_on_level_and_aviv_geo_id
+        ON geo_mapping USING btree (level, aviv_geo_id) INCLUDE (zip_code, city_id)
+    """
+}
+
+# Entries of geo_indices.json covered by the previous fetch, by level and key (a zip code's name,
+# a city's hd_geo_id, so a renamed city is the same entry) with an MD5 of each entry. Entries
+# removed from geo_indices.json keep their row with `removed_at`, and the transform skips them.
+create_geo_coverage = {
+    "geo_coverage": """
+        CREATE TABLE IF NOT EXISTS geo_coverage (
+            level TEXT NOT NULL CHECK (level IN ('zip_codes', 'cities')),
+            entry_key TEXT NOT NULL,
+            geo_index TEXT NOT NULL,
+            hd_geo_id TEXT NOT NULL,
+            entry_hash TEXT NOT NULL,
+            updated_at TIMESTAMP NOT NULL DEFAULT now(),
+            removed_at TIMESTAMP NULL,
+            PRIMARY KEY (level, entry_key)
+        )
+    """,
+    "index_removed_geo_index_and_hd_geo_id": """
+        CREATE INDEX IF NOT EXISTS index_geo_coverage_on_removed_geo_index_and_hd_geo_id
+        ON geo_coverage USING btree (geo_index, hd_geo_id) WHERE removed_at IS NOT NULL
+    """
+}
+
 extensions = 'CREATE EXTENSION IF NOT EXISTS "uuid-ossp"'
 
 
@@ -130,9 +189,49 @@ create_location_prices = {
     """
 }
 
+# Partitioned by quarter on "interval", which is [price_date - 3 months, price_date)
+# for every row of a quarter. Partition keys must be part of the primary key.
+create_location_prices_partitioned = {
+    "location_prices": """
+        CREATE TABLE IF NOT EXISTS location_prices (
+            id uuid DEFAULT uuid_generate_v4() NOT NULL,
+            report_header_id uuid NULL,
+            city varchar NULL,
+            district varchar NULL,
+            zip_code varchar NULL,
+            price numeric(15, 2) NULL,
+            unit varchar NULL,
+            min numeric(15, 2) NULL,
+            max numeric(15, 2) NULL,
+            mean numeric(15, 2) NULL,
+            median numeric(15, 2) NULL,
+            standard_deviation numeric NULL,
+            "interval" daterange NOT NULL,
+            created_at timestamp NOT NULL,
+            updated_at timestamp NOT NULL,
+            country varchar NULL,
+            country_id varchar NULL,
+            city_id varchar NULL,
+            district_id varchar NULL,
+            zip_code_id varchar NULL,
+            score numeric NULL,
+            CONSTRAINT location_prices_pkey PRIMARY KEY (id, "interval")
+        ) PARTITION BY RANGE ("interval")
+    """,
+    "default_partition": """
+        CREATE TABLE IF NOT EXISTS location_prices_default PARTITION OF location_prices DEFAULT
+    """,
+    "index_city_id": create_location_prices["index_city_id"],
+    "index_country": create_location_prices["index_country"],
+    "index_country_and_city_and_district": create_location_prices["index_country_and_city_and_district"],
+    "index_report_header_id": create_location_prices["index_report_header_id"]
+}
+
 
 create_source_schema = {
     'geo_cache': create_geo_cache, 
+    'geo_mapping': create_geo_mapping,
+    'geo_coverage': create_geo_coverage,
     'prices_all': create_prices_all, 
     'extensions': extensions
 }
@@ -142,3 +241,17 @@ create_price_map_schema = {
     "report_headers": create_report_headers, 
     "location_prices": create_location_prices
 }
+
+create_partitioned_source_schema = {
+    'geo_cache': create_geo_cache,
+    'geo_mapping': create_geo_mapping,
+    'geo_coverage': create_geo_coverage,
+    'prices_all': create_prices_all_partitioned,
+    'extensions': extensions
+}
+
+create_partitioned_price_map_schema = {
+    "report_batches": create_report_batches,
+    "report_headers": create_report_headers,
+    "location_prices": create_location_prices_partitioned
+}
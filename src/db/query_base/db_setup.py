@@ -3,3 +3,59 @@ CREATE_DB = "CREATE DATABASE {}"
 CHECK_DB_EXISTENCE = "SELECT 1 FROM pg_database WHERE datname = {};"
 
 RESET_SEQUENCE = "ALTER SEQUENCE {} RESTART WITH {}"
+
+
+CHECK_PARTITIONED = "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass({}))"
+
+CHECK_TABLE_EXISTENCE = "SELECT to_regclass({}) IS NOT NULL"
+
+CHECK_PARTITION_ATTACHED = "SELECT EXISTS (SELECT 1 FROM pg_inherits WHERE inhrelid = to_regclass({}))"
+
+CREATE_PARTITION_TABLE = "CREATE TABLE IF NOT EXISTS {} (LIKE {} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+
+MOVE_FROM_DEFAULT_PARTITION = """
+    WITH moved AS (
+        DELETE FROM {} WHERE {} RETURNING *
+    )
+    INSERT INTO {} SELECT * FROM moved
+"""
+
+ATTACH_LIST_PARTITION = "ALTER TABLE {} ATTACH PARTITION {} FOR VALUES IN ({})"
+
+ATTACH_RANGE_PARTITION = "ALTER TABLE {} ATTACH PARTITION {} FOR VALUES FROM ({}) TO ({})"
+
+DETACH_PARTITION = "ALTER TABLE {} DETACH PARTITION {}"
+
+LIST_TABLE_INDEXES = "SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND tablename = {}"
+
+RENAME_TABLE = "ALTER TABLE {} RENAME TO {}"
+
+RENAME_INDEX = "ALTER INDEX {} RENAME TO {}"
+
+COPY_TABLE_ROWS = "INSERT INTO {} SELECT * FROM {}"
+
+DROP_TABLE = "DROP TABLE {}"
+
+GET_PRICE_DATES = "SELECT DISTINCT price_date FROM {} ORDER BY price_date"
+
+# Non-unique indexes as (index name, " USING ..." definition, whether the table is partitioned)
+LIST_SECONDARY_INDEXES = """
+    SELECT ic.relname, substring(pg_get_indexdef(i.indexrelid) FROM ' USING .*$'), t.relkind = 'p'
+    FROM pg_index i
+    JOIN pg_class ic ON ic.oid = i.indexrelid
+    JOIN pg_class t ON t.oid = i.indrelid
+    WHERE i.indrelid = to_regclass(%s) AND NOT i.indisunique AND NOT i.indisprimary
+"""
+
+DROP_INDEX = "DROP INDEX IF EXISTS {}"
+
+DROP_INDEX_CONCURRENTLY = "DROP INDEX CONCURRENTLY IF EXISTS {}"
+
+# Left behind by a failed CREATE INDEX CONCURRENTLY, which IF NOT EXISTS would then skip
+CHECK_INVALID_INDEX = "SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)"
+
+CREATE_INDEX = "CREATE INDEX IF NOT EXISTS {} ON {} {}"
+
+CREATE_INDEX_CONCURRENTLY = "CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON {} {}"
+
+ANALYZE_TABLE = "ANALYZE {}"
@@ -1,3 +1,5 @@
+import hashlib
+
 insert_geo_cache = """
     INSERT INTO geo_cache (
         geo_index, hd_geo_id, aviv_geo_id, type_key, coordinates, match_name, confidence_score
@@ -18,8 +20,110 @@ insert_prices_all = """
     WHERE prices_all.transaction_type IS NULL
 """
 
+# Keeps geo_mapping in line with geo_cache, either for one cached response or for all of geo_cache
+insert_geo_mapping = """
+    INSERT INTO geo_mapping (geo_index, hd_geo_id, aviv_geo_id, level, zip_code, city_id)
+    SELECT
+        geo_index,
+        hd_geo_id,
+        aviv_geo_id,
+        CASE WHEN hd_geo_id = 'no_hd_geo_id_applicable' THEN 'zip_codes' ELSE 'cities' END,
+        CASE WHEN hd_geo_id = 'no_hd_geo_id_applicable' THEN geo_index END,
+        CASE WHEN hd_geo_id != 'no_hd_geo_id_applicable' THEN hd_geo_id END
+    FROM (VALUES (%s, %s, %s)) AS gc (geo_index, hd_geo_id, aviv_geo_id)
+    WHERE aviv_geo_id IS NOT NULL
+    ON CONFLICT (geo_index, hd_geo_id) DO NOTHING
+"""
+
+REFRESH_GEO_MAPPING = """
+    INSERT INTO geo_mapping (geo_index, hd_geo_id, aviv_geo_id, level, zip_code, city_id)
+    SELECT
+        gc.geo_index,
+        gc.hd_geo_id,
+        gc.aviv_geo_id,
+        CASE WHEN gc.hd_geo_id = 'no_hd_geo_id_applicable' THEN 'zip_codes' ELSE 'cities' END,
+        CASE WHEN gc.hd_geo_id = 'no_hd_geo_id_applicable' THEN gc.geo_index END,
+        CASE WHEN gc.hd_geo_id != 'no_hd_geo_id_applicable' THEN gc.hd_geo_id END
+    FROM geo_cache gc
+    WHERE gc.aviv_geo_id IS NOT NULL
+    AND NOT EXISTS (
+        SELECT 1 FROM geo_mapping gm WHERE gm.geo_index = gc.geo_index AND gm.hd_geo_id = gc.hd_geo_id
+    )
+    AND NOT EXISTS (
+        SELECT 1 FROM geo_coverage cv
+        WHERE cv.geo_index = gc.geo_index AND cv.hd_geo_id = gc.hd_geo_id AND cv.removed_at IS NOT NULL
+    )
+"""
+
+# Mapping entries whose geo_cache row was deleted or geocoded to another aviv_geo_id since,
+# or whose entry was removed from geo_indices.json
+PRUNE_GEO_MAPPING = """
+    DELETE FROM geo_mapping gm
+    WHERE NOT EXISTS (
+        SELECT 1 FROM geo_cache gc
+        WHERE gc.geo_index = gm.geo_index AND gc.hd_geo_id = gm.hd_geo_id AND gc.aviv_geo_id = gm.aviv_geo_id
+    )
+    OR EXISTS (
+        SELECT 1 FROM geo_coverage cv
+        WHERE cv.geo_index = gm.geo_index AND cv.hd_geo_id = gm.hd_geo_id AND cv.removed_at IS NOT NULL
+    )
+"""
+
+# Bulk path of insert_prices_all: a batch is COPYed into a session-local staging table and
+# merged with one statement, with the same upgrade-from-NULL semantics as the per-row upsert
+CREATE_PRICES_ALL_INCOMING = """
+    CREATE TEMP TABLE IF NOT EXISTS prices_all_incoming (
+        aviv_geo_id TEXT,
+        price_date TEXT,
+        transaction_type TEXT,
+        house_price JSON,
+        apartment_price JSON,
+        hybrid_price JSON
+    ) ON COMMIT DELETE ROWS
+"""
+
+COPY_PRICES_ALL_INCOMING = """
+    COPY prices_all_incoming (
+        aviv_geo_id, price_date, transaction_type, house_price, apartment_price, hybrid_price
+    ) FROM STDIN
+"""
+
+# A batch holding the same unit twice keeps its priced row. Returns the inserted rows and
+# the NULL rows upgraded; everything else in the batch was skipped. Whether a row existed is
+# looked up before the insert, as RETURNING xmax is not available on partitioned tables.
+MERGE_PRICES_ALL_INCOMING = """
+    WITH incoming AS (
+        SELECT DISTINCT ON (i.aviv_geo_id, i.price_date)
+            i.*,
+            EXISTS (
+                SELECT 1 FROM prices_all pa WHERE pa.aviv_geo_id = i.aviv_geo_id AND pa.price_date = i.price_date
+            ) AS existed
+        FROM prices_all_incoming i
+        ORDER BY i.aviv_geo_id, i.price_date, i.transaction_type NULLS LAST
+    ),
+    merged AS (
+        INSERT INTO prices_all (
+            aviv_geo_id, price_date, transaction_type, house_price, apartment_price, hybrid_price
+        )
+        SELECT aviv_geo_id, price_date, transaction_type, house_price, apartment_price, hybrid_price
+        FROM incoming
+        ON CONFLICT (aviv_geo_id, price_date)
+        DO UPDATE SET
+            transaction_type = COALESCE(EXCLUDED.transaction_type, prices_all.transaction_type),
+            house_price = EXCLUDED.house_price,
+            apartment_price = EXCLUDED.apartment_price,
+            hybrid_price = EXCLUDED.hybrid_price
+        WHERE prices_all.transaction_type IS NULL
+        RETURNING aviv_geo_id, price_date
+    )
+    SELECT COUNT(*) FILTER (WHERE NOT i.existed), COUNT(*) FILTER (WHERE i.existed)
+    FROM merged m
+    JOIN incoming i ON i.aviv_geo_id = m.aviv_geo_id AND i.price_date = m.price_date
+"""
+
 insert_source = {
     'geo_cache': insert_geo_cache, 
+    'geo_mapping': insert_geo_mapping,
     'prices_all': insert_prices_all
 }
 
@@ -80,7 +184,7 @@ SQL_REPORT_HEADERS = """
     update_existing AS (
         -- Update existing rows with the same report_batch_id to set active = FALSE
         UPDATE report_headers
-        SET active = FALSE
+        SET active = FALSE, updated_at = CURRENT_TIMESTAMP
         WHERE report_batch_id IN (
             SELECT DISTINCT report_batch_id
             FROM expanded_rows
@@ -172,22 +276,6 @@ SQL_LOCATION_PRICES = """
         JOIN report_headers rh
         ON pa.price_date::date = rh.date
         WHERE rh.active = TRUE
-    ),
-    geo_data AS (
-        -- Map geo_cache information for zip_code and city_id
-        SELECT
-            gc.geo_index,
-            gc.aviv_geo_id,
-            gc.hd_geo_id,
-            CASE
-                WHEN gc.hd_geo_id = 'no_hd_geo_id_applicable' THEN gc.geo_index
-                ELSE NULL
-            END AS zip_code,
-            CASE
-                WHEN gc.hd_geo_id != 'no_hd_geo_id_applicable' THEN gc.hd_geo_id
-                ELSE NULL
-            END AS city_id
-        FROM geo_cache gc
     )
     INSERT INTO location_prices (
         report_header_id, city_id, zip_code, price, unit, median, 
@@ -195,8 +283,8 @@ SQL_LOCATION_PRICES = """
     )
     SELECT 
         pd.report_header_id,
-        gd.city_id,
-        gd.zip_code,
+        gm.city_id,
+        gm.zip_code,
         pd.price,
         'EUR_SQM' AS unit,
         pd.price AS median,
@@ -208,19 +296,64 @@ SQL_LOCATION_PRICES = """
         pd.score,
         pd.interval
     FROM price_data pd
-    inner JOIN geo_data gd
-    ON pd.aviv_geo_id = gd.aviv_geo_id
-    WHERE 
-        -- Map `zip_codes` to `hd_geo_id = 'no_hd_geo_id_applicable'`
-        (pd.header_name = 'zip_codes' AND gd.hd_geo_id = 'no_hd_geo_id_applicable')
-        OR
-        -- Map `cities` to valid `hd_geo_id`
-        (pd.header_name = 'cities' AND gd.hd_geo_id != 'no_hd_geo_id_applicable')
-    ON CONFLICT (id) DO NOTHING
+    -- `zip_codes` headers take the zip code entries, `cities` headers the city entries
+    JOIN geo_mapping gm
+    ON gm.level = pd.header_name AND gm.aviv_geo_id = pd.aviv_geo_id
+    ON CONFLICT DO NOTHING
 """
 
 insert_price_map = {
     "report_batches": SQL_REPORT_BATCHES,
     "report_headers": SQL_REPORT_HEADERS,
     "location_prices": SQL_LOCATION_PRICES
-}
\ No newline at end of file
+}
+
+def _function_statement(query: str) -> str:
+    return query.strip().rstrip(';')
+
+
+# The transform as one server-side function: a single round trip and a single transaction,
+# with the statement plans cached by PL/pgSQL for the session. Returns one row per step
+# with the affected rows, and the last report_batches id as the final step. geo_mapping is
+# first brought in line with geo_cache, however geo_cache was loaded or cleaned up.
+CREATE_TRANSFORM_FUNCTION = f"""
+    CREATE OR REPLACE FUNCTION transform_aviv_prices()
+    RETURNS TABLE (step text, row_count bigint)
+    LANGUAGE plpgsql AS $transform$
+    DECLARE
+        affected bigint;
+        pruned bigint;
+    BEGIN
+        {_function_statement(PRUNE_GEO_MAPPING)};
+        GET DIAGNOSTICS pruned = ROW_COUNT;
+        {_function_statement(REFRESH_GEO_MAPPING)};
+        GET DIAGNOSTICS affected = ROW_COUNT;
+        step := 'geo_mapping'; row_count := pruned + affected; RETURN NEXT;
+
+        {_function_statement(SQL_REPORT_BATCHES)};
+        GET DIAGNOSTICS affected = ROW_COUNT;
+        step := 'report_batches'; row_count := affected; RETURN NEXT;
+
+        {_function_statement(SQL_REPORT_HEADERS)};
+        GET DIAGNOSTICS affected = ROW_COUNT;
+        step := 'report_headers'; row_count := affected; RETURN NEXT;
+
+        {_function_statement(SQL_LOCATION_PRICES)};
+        GET DIAGNOSTICS affected = ROW_COUNT;
+        step := 'location_prices'; row_count := affected; RETURN NEXT;
+
+        step := 'report_batches_id_seq';
+        SELECT last_value INTO row_count FROM report_batches_id_seq;
+        RETURN NEXT;
+    END
+    $transform$
+"""
+
+# Kept as the function comment, so the function is only replaced when its definition changed
+TRANSFORM_FUNCTION_VERSION = hashlib.md5(CREATE_TRANSFORM_FUNCTION.encode()).hexdigest()
+
+GET_TRANSFORM_FUNCTION_VERSION = "SELECT obj_description(to_regprocedure('transform_aviv_prices()'), 'pg_proc')"
+
+SET_TRANSFORM_FUNCTION_VERSION = "COMMENT ON FUNCTION transform_aviv_prices() IS {}"
+
+RUN_TRANSFORM_FUNCTION = "SELECT step, row_count FROM transform_aviv_prices()"
@@ -0,0 +1,18 @@
+# Seeding source tables from a backup: rows are COPYed in parallel into an unlogged
+# `<table>_seed` table, then inserted in one statement, keeping rows already present
+GET_COLUMN_TYPES = """
+    SELECT attname, format_type(atttypid, atttypmod)
+    FROM pg_attribute
+    WHERE attrelid = to_regclass(%s) AND attnum > 0 AND NOT attisdropped
+    ORDER BY attnum
+"""
+
+CREATE_SEED_TABLE = "CREATE UNLOGGED TABLE {seed} (LIKE {table})"
+
+COPY_SEED_ROWS = "COPY {seed} ({columns}) FROM STDIN (FORMAT BINARY)"
+
+INSERT_SEED_ROWS = """
+    INSERT INTO {table} ({columns})
+    SELECT {columns} FROM {seed}
+    ON CONFLICT DO NOTHING
+"""
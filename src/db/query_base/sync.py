@@ -0,0 +1,159 @@
+create_sync_watermarks = """
+    CREATE TABLE IF NOT EXISTS sync_watermarks (
+        table_name varchar NOT NULL,
+        target varchar NOT NULL,
+        updated_at timestamp NULL,
+        synced_rows int8 DEFAULT 0 NOT NULL,
+        synced_at timestamp NOT NULL,
+        CONSTRAINT sync_watermarks_pkey PRIMARY KEY (table_name, target)
+    )
+"""
+
+create_sync_schema = {
+    'sync_watermarks': create_sync_watermarks
+}
+
+GET_SYNC_WATERMARK = """
+    SELECT updated_at FROM sync_watermarks
+    WHERE table_name = %s AND target = %s
+"""
+
+UPSERT_SYNC_WATERMARK = """
+    INSERT INTO sync_watermarks (table_name, target, updated_at, synced_rows, synced_at)
+    VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP)
+    ON CONFLICT (table_name, target)
+    DO UPDATE SET
+        updated_at = EXCLUDED.updated_at,
+        synced_rows = sync_watermarks.synced_rows + EXCLUDED.synced_rows,
+        synced_at = EXCLUDED.synced_at
+"""
+
+# Rows changed after the watermark; a NULL watermark selects every row
+COUNT_CHANGED_ROWS = """
+    SELECT COUNT(*) FROM {table}
+    WHERE updated_at > COALESCE(%(updated_at)s::timestamp, '-infinity'::timestamp)
+"""
+
+SELECT_CHANGED_ROWS = """
+    SELECT {columns} FROM {table}
+    WHERE updated_at > COALESCE(%(updated_at)s::timestamp, '-infinity'::timestamp)
+    ORDER BY updated_at
+"""
+
+GET_PRIMARY_KEY = """
+    SELECT a.attname
+    FROM pg_index i
+    JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+    WHERE i.indrelid = to_regclass(%s) AND i.indisprimary
+    ORDER BY array_position(i.indkey::int2[], a.attnum)
+"""
+
+UPSERT_ROWS = """
+    INSERT INTO {table} ({columns}) VALUES ({placeholders})
+    ON CONFLICT ({keys}) DO UPDATE SET {updates}
+"""
+
+# Rows to ship whose unique column is already taken on RDS by a row with another id,
+# upserting them on the primary key would fail on the unique index
+FIND_UNIQUE_CONFLICTS = """
+    SELECT s.{unique}, s.id, t.id FROM {source}
+    JOIN {table} t ON t.{unique} = s.{unique} AND t.id <> s.id
+    ORDER BY 1
+"""
+
+# Per-quarter row count and checksum of the AVIV rows of a table, formatted with
+# {columns} (the checksummed columns) and the quarter/join/filter of `sync_tables`.
+QUARTER_CHECKSUMS = """
+    SELECT
+        {quarter} AS quarter,
+        COUNT(*) AS row_count,
+        md5(string_agg(md5(ROW({columns})::text), '' ORDER BY t.id)) AS checksum
+    FROM {table} t
+    {join}
+    WHERE {filter}
+    GROUP BY 1
+    ORDER BY 1
+"""
+
+# Tables shipped to the Homeday Prices DB:
+#   unique: column with a unique index besides the primary key, checked by FIND_UNIQUE_CONFLICTS
+#   quarter/join/filter: how QUARTER_CHECKSUMS groups the AVIV rows of the table by quarter
+sync_tables = {
+    "report_batches": {
+        "unique": "name",
+        "quarter": "replace(t.name, 'AVIV-', '')",
+        "join": "",
+        "filter": "t.name LIKE 'AVIV-%'"
+    },
+    "report_headers": {
+        "unique": None,
+        "quarter": "to_char(t.date, 'YYYY\"Q\"Q')",
+        "join": "",
+        "filter": "t.source = 1"
+    },
+    "location_prices": {
+        "unique": None,
+        "quarter": "to_char(rh.date, 'YYYY\"Q\"Q')",
+        "join": "JOIN report_headers rh ON rh.id = t.report_header_id",
+        "filter": "rh.source = 1"
+    }
+}
+
+# Publishing a quarter through unlogged staging tables on RDS
+CREATE_STAGING_TABLE = "CREATE UNLOGGED TABLE {staging} (LIKE {table} INCLUDING DEFAULTS)"
+
+DROP_TABLE_IF_EXISTS = "DROP TABLE IF EXISTS {}"
+
+COPY_QUARTER_OUT = """
+    COPY (
+        SELECT {columns} FROM {table} t
+        {join}
+        WHERE {filter} AND {quarter} = {value}
+    ) TO STDOUT (FORMAT BINARY)
+"""
+
+COPY_STAGING_IN = "COPY {staging} ({columns}) FROM STDIN (FORMAT BINARY)"
+
+UPSERT_FROM_TABLE = """
+    INSERT INTO {table} ({columns})
+    SELECT {columns} FROM {source}
+    ON CONFLICT ({keys}) DO UPDATE SET {updates}
+"""
+
+# Watermark after publishing a quarter: the newest updated_at up to which every changed row
+# belongs to the quarter, so the next delta sync still ships the changes of other quarters
+PUBLISHED_WATERMARK = """
+    SELECT max(updated_at) FROM (
+        SELECT
+            t.updated_at,
+            bool_and(COALESCE({filter} AND {quarter} = {value}, false)) OVER (ORDER BY t.updated_at) AS published
+        FROM {table} t
+        {join}
+        WHERE t.updated_at > COALESCE({updated_at}::timestamp, '-infinity'::timestamp)
+    ) changed
+    WHERE published
+"""
+
+# Indexes besides the primary key, which staging gets as a constraint (ADD_STAGING_PRIMARY_KEY)
+LIST_INDEX_DEFINITIONS = """
+    SELECT i.indisunique, substring(pg_get_indexdef(i.indexrelid) FROM ' USING .*$')
+    FROM pg_index i
+    WHERE i.indrelid = to_regclass(%s) AND NOT i.indisprimary
+"""
+
+CREATE_STAGING_INDEX = "CREATE {unique} INDEX ON {staging} {definition}"
+
+# ATTACH PARTITION only adopts a staging index for the parent's primary key when it backs a
+# primary key constraint too, a plain unique index would make it build another one
+ADD_STAGING_PRIMARY_KEY = "ALTER TABLE {staging} ADD PRIMARY KEY ({keys})"
+
+ADD_INTERVAL_CHECK = """
+    ALTER TABLE {staging} ADD CONSTRAINT {name}
+    CHECK ("interval" IS NOT NULL AND "interval" >= {interval_from} AND "interval" < {interval_to})
+"""
+
+# Rows of the replaced partition that were not published from local, e.g. other sources
+CARRY_OVER_ROWS = """
+    INSERT INTO {table} SELECT * FROM {old_partition} o
+    WHERE NOT EXISTS (SELECT 1 FROM {table} n WHERE n.id = o.id AND n."interval" = o."interval")
+"""
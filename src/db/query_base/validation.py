@@ -1,15 +1,175 @@
+# One array parameter whatever the number of geo indices, so the statement text never changes
+# and it can be prepared once per connection
 REFLECT_AVIVID = """
-            SELECT aviv_geo_id FROM geo_cache 
-            WHERE geo_index IN (%s)
+            SELECT aviv_geo_id FROM geo_cache
+            WHERE geo_index = ANY(%s)
         """
 
+# Entries removed from geo_indices.json are not priced anymore
 VALIDATE_PRICE_GEN = """
-            SELECT aviv_geo_id FROM geo_cache
+            SELECT aviv_geo_id FROM geo_cache gc
             WHERE aviv_geo_id != 'no_aviv_id_available'
+            AND NOT EXISTS (
+                SELECT 1 FROM geo_coverage cv
+                WHERE cv.geo_index = gc.geo_index AND cv.hd_geo_id = gc.hd_geo_id AND cv.removed_at IS NOT NULL
+            )
             AND aviv_geo_id NOT IN (
                 SELECT aviv_geo_id FROM prices_all 
                 WHERE price_date = {} AND transaction_type IS NOT NULL
             )
         """
 
-GET_SEQUENCE_VALUE = "SELECT last_value FROM {}"
\ No newline at end of file
+# Health checks of a transformed quarter, evaluated in a single statement.
+# The shared CTEs scope every check to the quarter in %(price_date)s:
+#   scope (price_date, previous_date, batch_name), scoped_batches, scoped_headers (active),
+#   scoped_prices (location_prices of scoped_headers + header_name, property_type) and
+#   previous_prices (active location_prices of the previous quarter).
+# Each check selects one `sample` jsonb per violation.
+HEALTH_CHECK_SCOPE = """
+    WITH scope AS (
+        SELECT
+            %(price_date)s::date AS price_date,
+            (%(price_date)s::date - INTERVAL '3 months')::date AS previous_date,
+            CONCAT(
+                'AVIV-', EXTRACT(YEAR FROM %(price_date)s::date)::TEXT, 'Q', EXTRACT(QUARTER FROM %(price_date)s::date)::TEXT
+            ) AS batch_name
+    ),
+    scoped_batches AS (
+        SELECT rb.*
+        FROM report_batches rb
+        JOIN scope ON rb.name = scope.batch_name
+    ),
+    scoped_headers AS (
+        SELECT rh.*
+        FROM report_headers rh
+        JOIN scope ON rh.date = scope.price_date
+        WHERE rh.active = TRUE
+    ),
+    scoped_prices AS MATERIALIZED (
+        SELECT lp.*, sh.name AS header_name, sh.property_type
+        FROM location_prices lp
+        JOIN scoped_headers sh ON lp.report_header_id = sh.id
+    ),
+    previous_prices AS MATERIALIZED (
+        SELECT lp.zip_code, lp.city_id, lp.price, rh.name AS header_name, rh.property_type
+        FROM location_prices lp
+        JOIN report_headers rh ON lp.report_header_id = rh.id
+        JOIN scope ON rh.date = scope.previous_date
+        WHERE rh.active = TRUE
+    ),
+    violations AS (
+        {checks}
+    )
+    SELECT check_name, COUNT(*) AS violations, (ARRAY_AGG(sample))[1:%(sample_size)s] AS samples
+    FROM violations
+    GROUP BY check_name
+"""
+
+health_checks = {
+    "duplicate_report_batches": {
+        "severity": "error",
+        "description": "Duplicate names found in report_batches",
+        "query": """
+            SELECT jsonb_build_object('name', name, 'count', COUNT(*)) AS sample
+            FROM scoped_batches
+            GROUP BY name
+            HAVING COUNT(*) > 1
+        """
+    },
+    "report_headers_mapping": {
+        "severity": "error",
+        "description": "Inconsistent report_headers mapping",
+        "query": """
+            SELECT jsonb_build_object('report_batch_id', sh.report_batch_id, 'count', COUNT(*)) AS sample
+            FROM scoped_headers sh
+            JOIN report_batches rb ON sh.report_batch_id = rb.id
+            WHERE sh.date != DATE_TRUNC('quarter', rb.started_at)
+            GROUP BY sh.report_batch_id
+            HAVING COUNT(*) > 4
+        """
+    },
+    "negative_location_prices": {
+        "severity": "error",
+        "description": "Negative values detected in location_prices",
+        "query": """
+            SELECT jsonb_build_object(
+                'report_header_id', report_header_id, 'zip_code', zip_code, 'city_id', city_id,
+                'price', price, 'max', max, 'min', min
+            ) AS sample
+            FROM scoped_prices
+            WHERE (zip_code IS NOT NULL OR city_id IS NOT NULL)
+            AND (price < 0 OR max < 0 OR min < 0)
+        """
+    },
+    "null_price_ratio": {
+        "severity": "warning",
+        "description": "Share of location_prices without price above max_null_price_ratio",
+        "query": """
+            SELECT jsonb_build_object(
+                'header_name', header_name, 'property_type', property_type,
+                'null_prices', COUNT(*) FILTER (WHERE price IS NULL), 'rows', COUNT(*)
+            ) AS sample
+            FROM scoped_prices
+            GROUP BY header_name, property_type
+            HAVING COUNT(*) FILTER (WHERE price IS NULL) > %(max_null_price_ratio)s * COUNT(*)
+        """
+    },
+    "geo_indices_coverage": {
+        "severity": "warning",
+        "description": "Locations with prices below min_coverage of geo_indices",
+        "query": """
+            SELECT jsonb_build_object(
+                'header_name', e.header_name, 'property_type', t.property_type,
+                'locations', COALESCE(c.locations, 0), 'expected', e.expected
+            ) AS sample
+            FROM (VALUES ('zip_codes', %(expected_zip_codes)s::int), ('cities', %(expected_cities)s::int))
+                AS e(header_name, expected)
+            CROSS JOIN (VALUES ('apartment'), ('house')) AS t(property_type)
+            LEFT JOIN (
+                SELECT header_name, property_type, COUNT(DISTINCT COALESCE(zip_code, city_id)) AS locations
+                FROM scoped_prices
+                GROUP BY header_name, property_type
+            ) c ON c.header_name = e.header_name AND c.property_type = t.property_type
+            WHERE COALESCE(c.locations, 0) < %(min_coverage)s * e.expected
+        """
+    },
+    "quarter_over_quarter_jump": {
+        "severity": "warning",
+        "description": "Prices changed more than max_price_jump since the previous quarter",
+        "query": """
+            SELECT jsonb_build_object(
+                'header_name', sp.header_name, 'property_type', sp.property_type,
+                'location', COALESCE(sp.zip_code, sp.city_id), 'price', sp.price, 'previous_price', pp.price
+            ) AS sample
+            FROM scoped_prices sp
+            JOIN previous_prices pp
+            ON pp.header_name = sp.header_name
+                AND pp.property_type = sp.property_type
+                AND COALESCE(pp.zip_code, pp.city_id) = COALESCE(sp.zip_code, sp.city_id)
+            WHERE pp.price > 0 AND ABS(sp.price / pp.price - 1) > %(max_price_jump)s
+        """
+    }
+}
+
+GET_LATEST_ACTIVE_QUARTER = "SELECT MAX(date) FROM report_headers WHERE active = TRUE"
+
+# Every priced location of a quarter with its price of the previous quarter, for the anomaly check
+ANOMALY_CHECK_PRICES = """
+    WITH quarter_prices AS (
+        SELECT rh.date, rh.name AS header_name, rh.property_type,
+               COALESCE(lp.zip_code, lp.city_id) AS location,
+               lp.price::float8 AS price, lp.min::float8 AS min, lp.max::float8 AS max
+        FROM location_prices lp
+        JOIN report_headers rh ON lp.report_header_id = rh.id
+        WHERE rh.active = TRUE
+        AND rh.date IN (%(price_date)s::date, (%(price_date)s::date - INTERVAL '3 months')::date)
+    )
+    SELECT c.header_name, c.property_type, c.location, c.price, c.min, c.max, p.price AS previous_price
+    FROM quarter_prices c
+    LEFT JOIN quarter_prices p
+    ON p.date < c.date
+        AND p.header_name = c.header_name
+        AND p.property_type = c.property_type
+        AND p.location = c.location
+    WHERE c.date = %(price_date)s::date
+"""
@@ -2,5 +2,9 @@ from .helpers import (
     benchmark, 
     update_report_batch_id, 
     get_first_day_of_quarter,
-    validate_year
+    validate_year,
+    get_quarter_suffix,
+    add_months,
+    get_quarter_interval_bounds
 )
+from .metrics import metrics
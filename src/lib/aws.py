@@ -1,20 +1,38 @@
 import boto3
 import json
 import base64
+import hashlib
+import logging
 import os
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from dynaconf import Dynaconf
-from typing import Dict
-from botocore.exceptions import NoCredentialsError, PartialCredentialsError, ClientError
+from typing import Dict, Iterable, List, Optional
+from botocore.exceptions import NoCredentialsError, PartialCredentialsError, ClientError, BotoCoreError
+from tenacity import Retrying, stop_after_attempt, wait_exponential, retry_if_exception_type
+from src.lib.metrics import metrics
+
+
+MIB = 1024 * 1024
 
 
 class S3Connector:
+    # S3 rejects parts below 5 MiB, except the last part of an upload
+    MIN_PART_SIZE = 5 * MIB
+    PART_SIZE = 8 * MIB
+    UPLOAD_WORKERS = 4
+    PART_ATTEMPTS = 3
+
     def __init__(self, config: Dynaconf, profile_name: str = "default"):
         """
         Initialize the S3Connector with a bucket name and AWS profile.
         :param config: config file.
         :param profile_name: The AWS profile name to use (default: 'default').
         """
+        self.logger = logging.getLogger(self.__class__.__name__)
         self.bucket_name = config.aws.s3_bucket
+        self.part_size = max(config.aws.get('part_size_mb', self.PART_SIZE // MIB) * MIB, self.MIN_PART_SIZE)
+        self.upload_workers = config.aws.get('upload_workers', self.UPLOAD_WORKERS)
+        self.part_attempts = config.aws.get('part_attempts', self.PART_ATTEMPTS)
         self.session = boto3.Session(profile_name=profile_name)
         self.s3_client = self.session.client("s3")
 
@@ -25,19 +43,12 @@ class S3Connector:
         :param s3_key: The S3 key (object name) to use for the uploaded file.
         """
         try:
-            with open(file_path, "r") as json_file:
-                data = json.load(json_file)
-                self.s3_client.put_object(
-                    Bucket=self.bucket_name,
-                    Key=s3_key,
-                    Body=json.dumps(data),
-                    ContentType="application/json"
-                )
+            with open(file_path, "rb") as json_file:
+                # Streamed as is, the file is neither parsed nor held in memory
+                self.upload_stream(iter(lambda: json_file.read(self.part_size), b""), s3_key)
             print(f"Successfully uploaded {file_path} to s3://{self.bucket_name}/{s3_key}")
         except FileNotFoundError:
             print(f"Error: File {file_path} not found.")
-        except json.JSONDecodeError:
-            print(f"Error: File {file_path} is not valid JSON.")
         except (NoCredentialsError, PartialCredentialsError) as e:
             print(f"Error: AWS credentials issue - {e}")
         except Exception as e:
@@ -62,6 +73,132 @@ class S3Connector:
         except Exception as e:
             print(f"Unexpected error: {e}")
 
+    def incomplete_upload(self, s3_key: str) -> Optional[str]:
+        """Id of the latest multipart upload of `s3_key` that was started but neither completed nor aborted."""
+        response = self.s3_client.list_multipart_uploads(Bucket=self.bucket_name, Prefix=s3_key)
+        uploads = [upload for upload in response.get("Uploads", []) if upload["Key"] == s3_key]
+        if not uploads:
+            return None
+        return max(uploads, key=lambda upload: upload["Initiated"])["UploadId"]
+
+    def uploaded_parts(self, s3_key: str, upload_id: str) -> Dict[int, str]:
+        """ETag by part number of the parts already uploaded to a multipart upload."""
+        parts = {}
+        paginator = self.s3_client.get_paginator("list_parts")
+        for page in paginator.paginate(Bucket=self.bucket_name, Key=s3_key, UploadId=upload_id):
+            parts.update({part["PartNumber"]: part["ETag"] for part in page.get("Parts", [])})
+        return parts
+
+    def upload_part(self, s3_key: str, upload_id: str, part_number: int, body: bytes, digest: bytes) -> str:
+        """Upload one part with its Content-MD5 checksum, retried with backoff, and return its ETag."""
+        retrying = Retrying(
+            stop=stop_after_attempt(self.part_attempts),
+            wait=wait_exponential(multiplier=0.5, min=0.5, max=8),
+            retry=retry_if_exception_type((ClientError, BotoCoreError)),
+            reraise=True
+        )
+        for attempt in retrying:
+            with attempt:
+                response = self.s3_client.upload_part(
+                    Bucket=self.bucket_name, Key=s3_key, UploadId=upload_id, PartNumber=part_number,
+                    Body=body, ContentMD5=base64.b64encode(digest).decode()
+                )
+        metrics.counter("s3_upload_bytes", "Bytes uploaded to S3 in multipart parts").inc(len(body), key=s3_key)
+        return response["ETag"]
+
+    def parts(self, chunks: Iterable[bytes]) -> Iterable[bytes]:
+        """Regroup a stream of byte chunks into parts of `part_size` bytes, the last one may be smaller."""
+        buffer = bytearray()
+        for chunk in chunks:
+            buffer += chunk
+            while len(buffer) >= self.part_size:
+                yield bytes(buffer[:self.part_size])
+                del buffer[:self.part_size]
+        if buffer:
+            yield bytes(buffer)
+
+    def upload_stream(self, chunks: Iterable[bytes], s3_key: str, content_type: str = "application/json",
+                      resume: bool = True) -> Dict[str, int]:
+        """
+        Upload a stream of bytes as a multipart upload, `upload_workers` parts at a time.
+
+        At most twice as many parts as workers are held in memory, so the stream is never
+        materialised. A failed upload is left open: with `resume`, uploading the same stream to
+        the same key again only sends the parts whose checksum differs from the uploaded ones.
+
+        :param chunks: Byte chunks of the object, of any size.
+        :param s3_key: The S3 key (object name) to upload to.
+        :param content_type: Content type of the object.
+        :param resume: Continue the latest incomplete upload of `s3_key` instead of starting a new one.
+        :return: Number of parts and bytes of the object, and how many parts were skipped as already uploaded.
+        """
+        upload_id = self.incomplete_upload(s3_key) if resume else None
+        uploaded = self.uploaded_parts(s3_key, upload_id) if upload_id else {}
+        if upload_id:
+            self.logger.info(f"Resuming upload of s3://{self.bucket_name}/{s3_key} with {len(uploaded)} part(s).")
+        else:
+            upload_id = self.s3_client.create_multipart_upload(
+                Bucket=self.bucket_name, Key=s3_key, ContentType=content_type
+            )["UploadId"]
+
+        etags, pending = {}, {}
+        outcome = {"parts": 0, "bytes": 0, "skipped": 0}
+        with metrics.span("s3_upload", key=s3_key), ThreadPoolExecutor(self.upload_workers) as executor:
+            for part_number, body in enumerate(self.parts(chunks), start=1):
+                outcome["parts"] += 1
+                outcome["bytes"] += len(body)
+                digest = hashlib.md5(body).digest()
+                # The ETag of a part uploaded without SSE-KMS is the MD5 of its body
+                if uploaded.get(part_number, "").strip('"') == digest.hex():
+                    etags[part_number] = uploaded[part_number]
+                    outcome["skipped"] += 1
+                    continue
+                pending[executor.submit(self.upload_part, s3_key, upload_id, part_number, body, digest)] = part_number
+                if len(pending) >= 2 * self.upload_workers:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        etags[pending.pop(future)] = future.result()
+            for future in wait(pending).done:
+                etags[pending[future]] = future.result()
+
+        if not etags:
+            # Nothing to upload: S3 cannot complete a multipart upload without parts
+            self.s3_client.abort_multipart_upload(Bucket=self.bucket_name, Key=s3_key, UploadId=upload_id)
+            self.s3_client.put_object(Bucket=self.bucket_name, Key=s3_key, Body=b"", ContentType=content_type)
+            return outcome
+        self.s3_client.complete_multipart_upload(
+            Bucket=self.bucket_name, Key=s3_key, UploadId=upload_id,
+            MultipartUpload={"Parts": [{"PartNumber": number, "ETag": etag} for number, etag in sorted(etags.items())]}
+        )
+        return outcome
+
+
+    def object_exists(self, s3_key: str) -> bool:
+        """Whether an object exists in the bucket."""
+        try:
+            self.s3_client.head_object(Bucket=self.bucket_name, Key=s3_key)
+            return True
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def list_keys(self, prefix: str) -> List[str]:
+        """Keys of the bucket starting with `prefix`, sorted."""
+        keys = []
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+            keys += [item["Key"] for item in page.get("Contents", [])]
+        return sorted(keys)
+
+    def read_object(self, s3_key: str) -> bytes:
+        """Body of an object."""
+        return self.s3_client.get_object(Bucket=self.bucket_name, Key=s3_key)["Body"].read()
+
+    def download_file(self, s3_key: str, file_path: str):
+        """Download an object to a local file, in parallel ranges for large objects."""
+        self.s3_client.download_file(self.bucket_name, s3_key, file_path)
+
 
 class SecretManager:
 
@@ -0,0 +1,120 @@
+import datetime
+import json
+import os
+from typing import Dict, Iterable, List, Optional
+from src.lib.aws import S3Connector
+
+
+class BackupStore:
+    """
+    Content-addressed storage of incremental backups.
+
+    Chunks of rows are stored once under the SHA-256 of their content (`chunks/<sha256>.ndjson`),
+    and each backup is a manifest (`manifests/<UTC timestamp>.json`) referencing the chunks of every
+    table at that time. Subclasses store the objects in a local directory or under an S3 prefix.
+    """
+    CHUNKS = "chunks"
+    MANIFESTS = "manifests"
+
+    @classmethod
+    def chunk_key(cls, sha256: str) -> str:
+        return f"{cls.CHUNKS}/{sha256}.ndjson"
+
+    @classmethod
+    def manifest_key(cls, created_at: datetime.datetime) -> str:
+        return f"{cls.MANIFESTS}/{created_at.strftime('%Y%m%dT%H%M%S%fZ')}.json"
+
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def write(self, key: str, chunks: Iterable[bytes]):
+        raise NotImplementedError
+
+    def read(self, key: str) -> bytes:
+        raise NotImplementedError
+
+    def list(self, prefix: str) -> List[str]:
+        raise NotImplementedError
+
+    def fetch(self, key: str, directory: str) -> str:
+        """Local path of an object, downloaded into `directory` when it is not stored locally."""
+        raise NotImplementedError
+
+    def save_manifest(self, manifest: Dict, created_at: datetime.datetime) -> str:
+        key = self.manifest_key(created_at)
+        self.write(key, [json.dumps(manifest, indent=4).encode()])
+        return key
+
+    def manifest_at(self, at: Optional[datetime.datetime] = None) -> Optional[str]:
+        """Key of the latest manifest saved at or before `at` (default: the latest one)."""
+        manifests = self.list(f"{self.MANIFESTS}/")
+        if at is not None:
+            if at.tzinfo is None:
+                at = at.replace(tzinfo=datetime.timezone.utc)
+            latest = self.manifest_key(at.astimezone(datetime.timezone.utc))
+            manifests = [key for key in manifests if key <= latest]
+        return manifests[-1] if manifests else None
+
+    def load_manifest(self, key: Optional[str]) -> Optional[Dict]:
+        return json.loads(self.read(key)) if key else None
+
+
+class LocalBackupStore(BackupStore):
+    def __init__(self, root: str = "data/incremental"):
+        self.root = root
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def exists(self, key: str) -> bool:
+        return os.path.isfile(self.path(key))
+
+    def write(self, key: str, chunks: Iterable[bytes]):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written under a temporary name first, an interrupted write never leaves a truncated chunk
+        with open(f"{path}.part", "wb") as file:
+            for chunk in chunks:
+                file.write(chunk)
+        os.replace(f"{path}.part", path)
+
+    def read(self, key: str) -> bytes:
+        with open(self.path(key), "rb") as file:
+            return file.read()
+
+    def list(self, prefix: str) -> List[str]:
+        directory = os.path.dirname(self.path(prefix))
+        if not os.path.isdir(directory):
+            return []
+        keys = (os.path.relpath(os.path.join(directory, name), self.root) for name in os.listdir(directory))
+        return sorted(key for key in keys if key.startswith(prefix) and not key.endswith(".part"))
+
+    def fetch(self, key: str, directory: str) -> str:
+        return self.path(key)
+
+
+class S3BackupStore(BackupStore):
+    def __init__(self, s3_connector: S3Connector, prefix: str = "incremental"):
+        self.s3_connector = s3_connector
+        self.prefix = prefix
+
+    def s3_key(self, key: str) -> str:
+        return f"{self.prefix}/{key}"
+
+    def exists(self, key: str) -> bool:
+        return self.s3_connector.object_exists(self.s3_key(key))
+
+    def write(self, key: str, chunks: Iterable[bytes]):
+        content_type = "application/json" if key.endswith(".json") else "application/x-ndjson"
+        self.s3_connector.upload_stream(chunks, self.s3_key(key), content_type=content_type)
+
+    def read(self, key: str) -> bytes:
+        return self.s3_connector.read_object(self.s3_key(key))
+
+    def list(self, prefix: str) -> List[str]:
+        return [key[len(self.prefix) + 1:] for key in self.s3_connector.list_keys(self.s3_key(prefix))]
+
+    def fetch(self, key: str, directory: str) -> str:
+        path = os.path.join(directory, os.path.basename(key))
+        self.s3_connector.download_file(self.s3_key(key), path)
+        return path
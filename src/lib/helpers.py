@@ -5,6 +5,7 @@ from functools import wraps
 import inspect
 import asyncclick as click
 from datetime import date
+from .metrics import metrics
 
 
 logger = logging.getLogger(__name__)  # Create a logger instance
@@ -20,6 +21,9 @@ def benchmark(enabled=True):
             result = func(*args, **kwargs)  # Execute the synchronous function
             end_time = time.perf_counter()
             execution_time = end_time - start_time
+            metrics.histogram("function_duration_seconds", "Wall time of benchmarked functions").observe(
+                execution_time, function=func.__name__
+            )
             logger.info(f"Sync function '{func.__name__}' executed in {execution_time:.6f} seconds.")
             return result
 
@@ -29,6 +33,9 @@ def benchmark(enabled=True):
             result = await func(*args, **kwargs)  # Await the asynchronous function
             end_time = time.perf_counter()
             execution_time = end_time - start_time
+            metrics.histogram("function_duration_seconds", "Wall time of benchmarked functions").observe(
+                execution_time, function=func.__name__
+            )
             logger.info(f"Async function '{func.__name__}' executed in {execution_time:.6f} seconds.")
             return result
 
@@ -105,6 +112,36 @@ def get_first_day_of_quarter(quarter_name):
         return f"Error: {e}"
 
 
+def get_quarter_suffix(price_date):
+    """
+    Returns the partition suffix of the quarter of a price date, e.g. '2024-10-01' -> '2024q4'.
+    """
+    year, month = int(price_date[:4]), int(price_date[5:7])
+    return f"{year}q{(month - 1) // 3 + 1}"
+
+
+def add_months(price_date, months):
+    """
+    Returns the first day of the month `months` away from `price_date` as 'YYYY-MM-01'.
+    """
+    year, month = int(price_date[:4]), int(price_date[5:7])
+    index = year * 12 + month - 1 + months
+    return f"{index // 12}-{index % 12 + 1:02d}-01"
+
+
+def get_quarter_interval_bounds(price_date):
+    """
+    Returns the range partition bounds of location_prices."interval" for the quarter of a price date.
+
+    Rows of a quarter have interval [price_date - 3 months, price_date), so the partition
+    holds the daterange values from that range up to (excluding) the next quarter's one.
+    """
+    return (
+        f"[{add_months(price_date, -3)},{price_date})",
+        f"[{price_date},{add_months(price_date, 3)})"
+    )
+
+
 def validate_year(ctx, param, value):
     current_year = date.today().year
     last_2years = current_year - 2
@@ -0,0 +1,180 @@
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterator, List, Optional, Sequence
+
+
+MAGIC = b"PHIDX001"
+# Header length after the magic, then the JSON header padded to 8 bytes, then one offset per row
+HEADER_LENGTH = struct.Struct("<Q")
+OFFSET = struct.Struct("<Q")
+
+
+def index_path(path: str) -> str:
+    return f"{path}.idx"
+
+
+class IndexedBackupWriter:
+    """
+    Write rows as NDJSON with a fixed-width offsets index next to it (`<path>.idx`).
+
+    Rows must be written sorted by `sort` columns in code point order (`COLLATE "C"` in
+    Postgres), the order lookups search in. When `partition` is the first sort column,
+    the index also keeps the row range of each of its values, e.g. of each quarter's price_date.
+    The NDJSON file is a plain backup on its own, `BackupToPostgres` seeds from it.
+    """
+    def __init__(self, path: str, sort: Sequence[str], partition: Optional[str] = None):
+        if partition and (partition != sort[0] or len(sort) < 2):
+            raise ValueError("The partition column must be the first of at least two sort columns.")
+        self.path = path
+        self.sort = list(sort)
+        self.partition = partition
+        self.offsets = array("Q", [0])
+        self.partitions: Dict[str, List[int]] = {}
+        self.file = open(path, "wb")
+
+    def write(self, row: Dict) -> bytes:
+        """Append a row and return its encoded line."""
+        line = (json.dumps(row, default=str) + "\n").encode()
+        if self.partition:
+            value = str(row[self.partition])
+            rows = len(self.offsets) - 1
+            self.partitions.setdefault(value, [rows, rows])[1] = rows + 1
+        self.file.write(line)
+        self.offsets.append(self.offsets[-1] + len(line))
+        return line
+
+    def close(self):
+        self.file.close()
+        header = json.dumps({
+            "rows": len(self.offsets) - 1, "sort": self.sort,
+            "partition": self.partition, "partitions": self.partitions
+        }).encode()
+        header += b" " * (-len(header) % 8)
+        with open(index_path(self.path), "wb") as index:
+            index.write(MAGIC + HEADER_LENGTH.pack(len(header)) + header)
+            if sys.byteorder == "big":
+                self.offsets.byteswap()
+            index.write(self.offsets.tobytes())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class IndexedBackupReader:
+    """
+    Memory-mapped reader of a backup written by `IndexedBackupWriter`.
+
+    Only the rows a lookup touches are parsed: a lookup binary searches the sorted rows through
+    the offsets index, and a partition (quarter) is a contiguous range of rows. A missing partition
+    has no rows.
+
+        with IndexedBackupReader("data/prices_all.ndjson") as prices:
+            prices.find(aviv_geo_id="NBH2DE75702", price_date="2024-10-01")
+            for row in prices.partition_rows("2024-10-01"):
+                ...
+    """
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as data, open(index_path(path), "rb") as index:
+            # mmap cannot map an empty file
+            self.data = mmap.mmap(data.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(data.fileno()).st_size else b""
+            self.index = mmap.mmap(index.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.index[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{index_path(path)} is not a backup index.")
+        header_length = HEADER_LENGTH.unpack_from(self.index, len(MAGIC))[0]
+        start = len(MAGIC) + HEADER_LENGTH.size
+        header = json.loads(self.index[start:start + header_length])
+        self.offsets_start = start + header_length
+        self.rows = header["rows"]
+        self.sort = header["sort"]
+        self.partition = header["partition"]
+        self.partitions = header["partitions"]
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def offset(self, position: int) -> int:
+        return OFFSET.unpack_from(self.index, self.offsets_start + position * OFFSET.size)[0]
+
+    def row(self, position: int) -> Dict:
+        """Row at a position of the sort order."""
+        return json.loads(self.data[self.offset(position):self.offset(position + 1)])
+
+    def rows_between(self, start: int, stop: int) -> Iterator[Dict]:
+        for position in range(start, stop):
+            yield self.row(position)
+
+    def partition_rows(self, value: str) -> Iterator[Dict]:
+        """Rows of one partition value, e.g. of one quarter's price_date."""
+        start, stop = self.partitions.get(str(value), (0, 0))
+        return self.rows_between(start, stop)
+
+    def _key_range(self, column: str, value, start: int, stop: int) -> range:
+        """Positions in [start, stop) whose `column` equals `value`, the rows being sorted by it there."""
+        keys = _Keys(self, column, start)
+        return range(
+            start + bisect_left(keys, value, 0, stop - start),
+            start + bisect_right(keys, value, 0, stop - start)
+        )
+
+    def find(self, **criteria) -> List[Dict]:
+        """
+        Rows matching all `criteria`, e.g. find(aviv_geo_id="...") or with a price_date too.
+
+        The partition and the first sort column after it are looked up through the index, other
+        criteria filter the rows found.
+        """
+        if self.partition and self.partition in criteria:
+            ranges = [self.partitions.get(str(criteria[self.partition]), (0, 0))]
+        elif self.partition:
+            ranges = list(self.partitions.values())
+        else:
+            ranges = [(0, self.rows)]
+        search = self.sort[1] if self.partition else self.sort[0]
+        found = []
+        for start, stop in ranges:
+            positions = (
+                self._key_range(search, criteria[search], start, stop) if search in criteria else range(start, stop)
+            )
+            found += [
+                row for row in map(self.row, positions)
+                if all(row.get(column) == value for column, value in criteria.items())
+            ]
+        return found
+
+    def __iter__(self) -> Iterator[Dict]:
+        return self.rows_between(0, self.rows)
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _Keys(Sequence):
+    """One column of a row range as a lazy sequence, for bisect."""
+    def __init__(self, reader: IndexedBackupReader, column: str, start: int):
+        self.reader = reader
+        self.column = column
+        self.start = start
+
+    def __getitem__(self, position):
+        return self.reader.row(self.start + position)[self.column]
+
+    def __len__(self):
+        return self.reader.rows - self.start
+
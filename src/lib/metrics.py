@@ -0,0 +1,241 @@
+import contextvars
+import json
+import os
+import threading
+import time
+import logging
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000, 10000, 50000)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (f'{name}="{value}"'.replace("\n", "\\n") for name, value in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+class Metric:
+    type_name = "untyped"
+
+    def __init__(self, name: str, description: str, lock: threading.Lock):
+        self.name = name
+        self.description = description
+        self.lock = lock
+        self.values: Dict[LabelKey, float] = {}
+
+    def value(self, **labels) -> float:
+        return self.values.get(_label_key(labels), 0)
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(key)} {value}" for key, value in sorted(self.values.items())]
+
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}_total{_format_labels(key)} {value}" for key, value in sorted(self.values.items())]
+
+
+class Gauge(Metric):
+    type_name = "gauge"
+
+    def set(self, value: float, **labels):
+        with self.lock:
+            self.values[_label_key(labels)] = value
+
+
+class Histogram(Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, description: str, lock: threading.Lock, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, description, lock)
+        self.buckets = tuple(buckets)
+        self.observations: Dict[LabelKey, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            # Per label set: one counter per bucket, then +Inf count and sum
+            state = self.observations.setdefault(key, [0] * (len(self.buckets) + 2))
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                state[index] += 1
+            state[-2] += 1
+            state[-1] += value
+
+    def count(self, **labels) -> int:
+        return int(self.observations.get(_label_key(labels), [0, 0])[-2])
+
+    def sum(self, **labels) -> float:
+        return self.observations.get(_label_key(labels), [0, 0])[-1]
+
+    @contextmanager
+    def time(self, **labels):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start_time, **labels)
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, state in sorted(self.observations.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', str(bound)))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, ('le', '+Inf'))} {state[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {state[-2]}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {state[-1]}")
+        return lines
+
+
+class Span:
+    """A timed pipeline stage; set `rows` to get a rows/sec figure for the stage."""
+    def __init__(self, name: str, parent: Optional["Span"], attributes: Dict):
+        self.name = name
+        self.parent = parent
+        self.attributes = attributes
+        self.rows: Optional[int] = None
+        self.thread_id = threading.get_ident()
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+
+class MetricsRegistry:
+    """
+    Process wide collection of counters, gauges, histograms and stage spans.
+
+    Metrics are exported in the Prometheus text format (or OpenMetrics with `openmetrics=True`).
+    Span tracing is off by default; once enabled, finished spans are kept and can be written
+    as a Chrome trace file (viewable in chrome://tracing or Perfetto).
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics: Dict[str, Metric] = {}
+        self.tracing = False
+        self.finished_spans: List[Span] = []
+        self.current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+        self.origin = time.perf_counter()
+
+    def _get_or_create(self, cls, name: str, description: str, **kwargs):
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = cls(name, description, self.lock, **kwargs)
+            return self.metrics[name]
+
+    def counter(self, name: str, description: str = "") -> Counter:
+        return self._get_or_create(Counter, name, description)
+
+    def gauge(self, name: str, description: str = "") -> Gauge:
+        return self._get_or_create(Gauge, name, description)
+
+    def histogram(self, name: str, description: str = "", buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, description, buckets=buckets)
+
+    def enable_tracing(self, enabled: bool = True):
+        self.tracing = enabled
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """
+        Time a pipeline stage.
+
+        Records `pipeline_stage_seconds{stage=name}` and, when `span.rows` is set,
+        `pipeline_stage_rows_per_second{stage=name}`. Nested spans keep their parent for tracing.
+        """
+        parent = self.current_span.get()
+        span = Span(name, parent, attributes)
+        token = self.current_span.set(span)
+        try:
+            yield span
+        finally:
+            span.end = time.perf_counter()
+            self.current_span.reset(token)
+            self.histogram("pipeline_stage_seconds", "Wall time per pipeline stage").observe(
+                span.duration, stage=name
+            )
+            if span.rows is not None:
+                self.counter("pipeline_stage_rows", "Rows handled per pipeline stage").inc(span.rows, stage=name)
+                if span.duration > 0:
+                    self.gauge("pipeline_stage_rows_per_second", "Throughput of the last stage run").set(
+                        round(span.rows / span.duration, 3), stage=name
+                    )
+            if self.tracing:
+                with self.lock:
+                    self.finished_spans.append(span)
+
+    def to_text(self, openmetrics: bool = False) -> str:
+        lines = []
+        with self.lock:
+            metrics = sorted(self.metrics.values(), key=lambda metric: metric.name)
+        for metric in metrics:
+            if metric.description:
+                lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(metric.samples())
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write(self, file_path: str):
+        """Write all metrics to `file_path`; `.om`/`.openmetrics` files use the OpenMetrics format."""
+        openmetrics = file_path.endswith((".om", ".openmetrics"))
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        with open(file_path, "w") as file:
+            file.write(self.to_text(openmetrics=openmetrics))
+        logger.info(f"Metrics written to {file_path}")
+
+    def write_trace(self, file_path: str):
+        """Write finished spans as Chrome trace events."""
+        with self.lock:
+            spans = list(self.finished_spans)
+        events = [
+            {
+                "name": span.name,
+                "ph": "X",
+                "ts": round((span.start - self.origin) * 1e6),
+                "dur": round(span.duration * 1e6),
+                "pid": os.getpid(),
+                "tid": span.thread_id,
+                "args": {**span.attributes, **({"rows": span.rows} if span.rows is not None else {})}
+            }
+            for span in spans
+        ]
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        with open(file_path, "w") as file:
+            json.dump({"traceEvents": events}, file, default=str)
+        logger.info(f"Trace with {len(events)} spans written to {file_path}")
+
+    def reset(self):
+        with self.lock:
+            self.metrics.clear()
+            self.finished_spans.clear()
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,161 @@
+import cProfile
+import datetime
+import io
+import logging
+import os
+import pstats
+import tracemalloc
+from typing import Dict, List, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ["cprofile", "yappi", "tracemalloc"]
+
+_active_profiler: Optional["Profiler"] = None
+
+
+def memory_snapshot(stage: str):
+    """
+    Take a tracemalloc snapshot at a pipeline stage boundary.
+
+    No-op unless a tracemalloc profiler is running, so it can stay in the pipelines.
+    """
+    if _active_profiler and _active_profiler.mode == "tracemalloc":
+        _active_profiler.take_snapshot(stage)
+
+
+def pstats_to_collapsed(stats: pstats.Stats, max_depth: int = 40, min_share: float = 0.001) -> List[str]:
+    """
+    Approximate collapsed stacks ("a;b;c <microseconds>") from a pstats call graph.
+
+    Self time of every function is distributed over its call paths proportionally to
+    the cumulative time of each caller edge; negligible paths are pruned.
+    """
+    entries = stats.stats
+    total = sum(tt for _, _, tt, _, _ in entries.values()) or 1
+
+    def label(func: Tuple) -> str:
+        filename, line, name = func
+        return f"{name} ({os.path.basename(filename)}:{line})" if line else name
+
+    stacks: Dict[str, float] = {}
+
+    def walk(func: Tuple, weight: float, path: List[str], seen: frozenset):
+        callers = entries[func][4] if func in entries else {}
+        edges = [(caller, edge[3]) for caller, edge in callers.items() if caller not in seen]
+        edge_total = sum(ct for _, ct in edges)
+        if not edges or edge_total <= 0 or len(path) >= max_depth:
+            stack = ";".join(reversed(path))
+            stacks[stack] = stacks.get(stack, 0) + weight
+            return
+        for caller, ct in edges:
+            share = weight * ct / edge_total
+            if share / total >= min_share:
+                walk(caller, share, path + [label(caller)], seen | {caller})
+
+    for func, (_, _, tt, _, _) in entries.items():
+        if tt / total >= min_share:
+            walk(func, tt, [label(func)], frozenset({func}))
+
+    return [f"{stack} {int(weight * 1e6)}" for stack, weight in sorted(stacks.items()) if weight > 0]
+
+
+class Profiler:
+    """
+    Profile a block of code with cProfile, yappi (asyncio aware) or tracemalloc.
+
+    Results are written into `output_dir` as `profile_<label>_<timestamp>.*`:
+    - cprofile/yappi: a `.pstats` file and a `.collapsed` stack file for flame graphs.
+    - tracemalloc: one `.snapshot` file per stage boundary (see `memory_snapshot`).
+    A top-N summary is printed when the block ends.
+    """
+    def __init__(self, mode: str, label: str, output_dir: str = "data", top: int = 20):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Invalid profile mode '{mode}', expected one of {PROFILE_MODES}")
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.mode = mode
+        self.top = top
+        self.output_dir = output_dir
+        timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+        self.prefix = os.path.join(output_dir, f"profile_{label}_{timestamp}")
+        self.profile = None
+        self.snapshots: List[Tuple[str, tracemalloc.Snapshot]] = []
+        self.files: List[str] = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        global _active_profiler
+        os.makedirs(self.output_dir, exist_ok=True)
+        if self.mode == "cprofile":
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        elif self.mode == "yappi":
+            try:
+                import yappi
+            except ImportError as e:
+                raise RuntimeError("yappi is not installed, run `pip install yappi` or use --profile cprofile") from e
+            yappi.set_clock_type("wall")
+            yappi.start()
+        else:
+            tracemalloc.start(25)
+            self.take_snapshot("start")
+        _active_profiler = self
+
+    def stop(self):
+        global _active_profiler
+        _active_profiler = None
+        if self.mode == "cprofile":
+            self.profile.disable()
+            self._write_pstats(pstats.Stats(self.profile))
+        elif self.mode == "yappi":
+            import yappi
+            yappi.stop()
+            stats_path = f"{self.prefix}.pstats"
+            yappi.get_func_stats().save(stats_path, type="pstat")
+            yappi.clear_stats()
+            self._write_pstats(pstats.Stats(stats_path), stats_path)
+        else:
+            self.take_snapshot("end")
+            tracemalloc.stop()
+            self._summarize_memory()
+        self.logger.info(f"Profile written to: {', '.join(self.files)}")
+
+    def take_snapshot(self, stage: str):
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        file_path = f"{self.prefix}_{len(self.snapshots):02d}_{stage}.snapshot"
+        snapshot.dump(file_path)
+        self.files.append(file_path)
+        self.snapshots.append((stage, snapshot))
+        self.logger.info(f"Memory at '{stage}': current {current / 2**20:.1f} MiB, peak {peak / 2**20:.1f} MiB")
+
+    def _write_pstats(self, stats: pstats.Stats, stats_path: Optional[str] = None):
+        if not stats_path:
+            stats_path = f"{self.prefix}.pstats"
+            stats.dump_stats(stats_path)
+        collapsed_path = f"{self.prefix}.collapsed"
+        with open(collapsed_path, "w") as file:
+            file.write("\n".join(pstats_to_collapsed(stats)) + "\n")
+        self.files.extend([stats_path, collapsed_path])
+
+        summary = io.StringIO()
+        stats.stream = summary
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top)
+        print(f"Top {self.top} functions by cumulative time:")
+        print(summary.getvalue())
+
+    def _summarize_memory(self):
+        print(f"Top {self.top} allocation sites at the end of the run:")
+        for stat in self.snapshots[-1][1].statistics("lineno")[:self.top]:
+            print(f"  {stat}")
+        for (previous_stage, previous), (stage, snapshot) in zip(self.snapshots, self.snapshots[1:]):
+            print(f"Top allocation growth between '{previous_stage}' and '{stage}':")
+            for stat in snapshot.compare_to(previous, "lineno")[:min(self.top, 5)]:
+                print(f"  {stat}")
@@ -1,2 +1,4 @@
 from .extract_and_load import APIToPostgres, PostgresToS3
-from .transform import AVIVRawToHDPrices, TransformedPricesHealthCheck
\ No newline at end of file
+from .transform import AVIVRawToHDPrices, TransformedPricesHealthCheck, PriceAnomalyCheck
+from .sync import PricesUpdater, SYNC_MODES
+from .restore import BackupToPostgres
@@ -1,22 +1,44 @@
 import asyncio
 import datetime
+import hashlib
+import itertools
 import json
 import logging
-from collections import deque
-from typing import List, Dict, Union, Callable
+import tempfile
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Iterator, Optional, Tuple, Union, Callable
 from dynaconf import Dynaconf
+from psycopg import IsolationLevel, sql
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
-from src.db import Database
+from src.db import Database, DatabaseHandler
+from src.db.query_base import EXPORT_SNAPSHOT, SET_TRANSACTION_SNAPSHOT
+from src.db.query_base import INCREMENTAL_CHUNKS, CHUNK_FINGERPRINTS, SELECT_CHUNK_ROWS
+from src.db.query_base import INDEXED_BACKUP_ORDER, SELECT_SORTED_ROWS
 from src.api_client import APIClient
 from src.lib.aws import S3Connector
-from src.lib import benchmark
+from src.lib.backup_store import BackupStore, LocalBackupStore, S3BackupStore
+from src.lib.indexed_backup import IndexedBackupWriter
+from src.lib import benchmark, metrics, get_quarter_suffix
+from src.lib.metrics import SIZE_BUCKETS
+from src.lib.profiling import memory_snapshot
+
+
+# What an empty table is backed up as
+EMPTY_BACKUP = b"[]"
 
 
 class APIToPostgres(Database):
-    
+    # Batches with at least this many results are stored with one COPY and merge
+    BULK_SINK_MIN_ROWS = 20
+    # Geocoded entries below this confidence_score are reported as low confidence
+    MIN_CONFIDENCE_SCORE = 1
+
     def __init__(self, config: Dynaconf, test=False):
         super().__init__(config=config, test=test)
         self.logger = logging.getLogger(self.__class__.__name__)
+        self.bulk_sink_min_rows = self.db_params.get('bulk_sink_min_rows', self.BULK_SINK_MIN_ROWS)
+        self.min_confidence_score = self.db_params.get('min_confidence_score', self.MIN_CONFIDENCE_SCORE)
         self.GEOCODING_URL = None
         self.PRICE_URL = None
         self.api = None
@@ -49,6 +71,7 @@ class APIToPostgres(Database):
             cache_function: Callable,
             batch_size: int,
             rate_limit_interval: float,
+            bulk_cache_function: Optional[Callable] = None,
             **kwargs
         ):
         """
@@ -60,12 +83,21 @@ class APIToPostgres(Database):
         :param cache_function: Function to store or cache results.
         :param batch_size: Size of each batch.
         :param rate_limit_interval: Delay between processing batches.
+        :param bulk_cache_function: Function storing all results of a batch at once, used instead of
+            cache_function for batches of at least `bulk_sink_min_rows` results. It may return
+            {outcome: rows}, summed up over the run.
         :param kwargs: Additional arguments for fetch_function.
+        :return: Summed outcomes of bulk_cache_function.
         """
         # Pre-split batches and prepare queues
         batches = [idx_group[i:i + batch_size] for i in range(0, len(idx_group), batch_size)]
         total_batches = len(batches)
         self.logger.info(f"Starting data fetching from {fetch_function.__name__} in {total_batches} batches...")
+        queue_depth = metrics.gauge("fetch_queue_depth", "Units waiting to be fetched")
+        flush_size = metrics.histogram("batch_flush_size", "Results cached per batch", buckets=SIZE_BUCKETS)
+        failures = metrics.counter("fetch_failures", "Units whose fetch raised or returned nothing")
+        pending = len(idx_group)
+        bulk_outcome = Counter()
 
         async def process_single_batch(batch, batch_index):
             """
@@ -76,58 +108,169 @@ class APIToPostgres(Database):
                 *(self.fetch_with_retry(base_url, unit, fetch_function, **kwargs) for unit in batch),
                 return_exceptions=True  # Prevent a single failure from stopping all
             )
+            fetched = []
             for result in results:
                 if not result or isinstance(result, Exception):
                     self.logger.error(f"Failed to fetch data for batch {batch_index}: {result}")
+                    failures.inc(function=fetch_function.__name__)
                     continue
-                cache_function(result)
+                fetched.append(result)
+            if bulk_cache_function and len(fetched) >= self.bulk_sink_min_rows:
+                bulk_outcome.update(bulk_cache_function(fetched) or {})
+            else:
+                for result in fetched:
+                    cache_function(result)
+            flush_size.observe(len(fetched), function=fetch_function.__name__)
 
         # Process batches with rate limiting
         for index, batch in enumerate(batches, start=1):
+            queue_depth.set(pending, function=fetch_function.__name__)
             await process_single_batch(batch, index)
+            pending -= len(batch)
             if index < total_batches:  # Skip delay after the last batch
                 await asyncio.sleep(rate_limit_interval)
+        queue_depth.set(0, function=fetch_function.__name__)
+        if bulk_outcome:
+            self.logger.info(
+                f"Bulk stored from {fetch_function.__name__}: "
+                + ", ".join(f"{count} {outcome}" for outcome, count in bulk_outcome.items())
+            )
+        return dict(bulk_outcome)
 
     @benchmark(enabled=True)
     async def run(self, geo_indices: Dict, price_date: str):
         if not self.api:
             self.api = self.api_client()
-        try:
-            self.logger.info("Starting extraction pipeline...")
-            await self.ensure_geoid_cache(geo_indices)
-            await self.fetch_price(price_date)
-            self.logger.info("Prices info has been cached")
-        finally:
-            self.db_handler.close()
-            self.logger.info("Pipeline execution completed.")
+        with self.db_handler.borrow():
+            try:
+                self.logger.info("Starting extraction pipeline...")
+                await self.ensure_geoid_cache(geo_indices)
+                memory_snapshot("ensure_geoid_cache")
+                await self.fetch_price(price_date)
+                memory_snapshot("fetch_price")
+                self.logger.info("Prices info has been cached")
+            finally:
+                self.logger.info("Pipeline execution completed.")
 
     async def fetch_price(self, price_date: str):
-        cached_geoid = self.get_validated_price(price_date)
-        if cached_geoid:
-            await self.process_data_in_batch(
-                self.PRICE_URL, cached_geoid, self.api.fetch_price_data, self.store_price_in_db,
-                self.api.batch_size, self.api.rate_limit_interval, price_date=price_date
-            )
+        with metrics.span("fetch_price", price_date=price_date) as span:
+            if self.partition_by_quarter:
+                self.ensure_quarter_partitions(price_date)
+            cached_geoid = self.get_validated_price(price_date)
+            if cached_geoid:
+                span.rows = len(cached_geoid)
+                await self.process_data_in_batch(
+                    self.PRICE_URL, cached_geoid, self.api.fetch_price_data, self.store_price_in_db,
+                    self.api.batch_size, self.api.rate_limit_interval,
+                    bulk_cache_function=self.store_prices_in_db, price_date=price_date
+                )
     
-    async def ensure_geoid_cache(self, geo_indices: Dict):
-        """Retrieve or fetch and cache geo_id for a given list of zip codes."""
-        _all = geo_indices['zip_codes'] + geo_indices['cities']
-        not_cached_yet = []
-        for obj in _all:
-            cached_geoid = self.get_cached_geoid([obj['name']])
-            if not cached_geoid:
-                not_cached_yet.append(obj)
-        if not_cached_yet:
-            self.logger.info(f"Found {len(not_cached_yet)} geo_indices haven't been cached yet")
-            await self.fetch_geo(not_cached_yet)
+    @staticmethod
+    def geo_coverage_entries(geo_indices: Dict) -> Dict[tuple, Tuple[Dict, str]]:
+        """
+        Entries of geo_indices by (level, entry_key) with the MD5 of each entry.
+
+        Zip codes are keyed by their name and cities by their hd_geo_id, so a renamed city
+        is a changed entry rather than a removed and an added one.
+        """
+        entries = {}
+        for level in ('zip_codes', 'cities'):
+            for entry in geo_indices[level]:
+                entry_key = entry['name'] if level == 'zip_codes' else entry['id']
+                entry_hash = hashlib.md5(json.dumps(entry, sort_keys=True).encode()).hexdigest()
+                entries[(level, entry_key)] = (entry, entry_hash)
+        return entries
+
+    def diff_geo_coverage(self, geo_indices: Dict) -> Dict:
+        """
+        Compare geo_indices with the coverage of the previous fetch, with set operations on the entry keys.
+
+        :return: The entries and the previous coverage (see `get_geo_coverage`), with the keys of
+            the entries added, changed (another hash), removed, and missing (unchanged but not cached anymore).
+        """
+        entries = self.geo_coverage_entries(geo_indices)
+        previous = self.get_geo_coverage()
+        kept = entries.keys() & previous.keys()
+        changed = {key for key in kept if entries[key][1] != previous[key][2]}
+        return {
+            'entries': entries,
+            'previous': previous,
+            'added': entries.keys() - previous.keys(),
+            'changed': changed,
+            'removed': previous.keys() - entries.keys(),
+            'missing': {key for key in kept - changed if not previous[key][3]},
+        }
+
+    async def ensure_geoid_cache(self, geo_indices: Dict) -> Dict[str, Dict[str, int]]:
+        """
+        Geocode the entries of geo_indices added or changed since the previous fetch, and record the coverage.
+
+        Entries not cached yet are geocoded, unchanged ones are not looked up at all. Removed
+        entries are marked in geo_coverage so the transform and the price fetch skip them, and
+        cities cached under the name they had before are removed from geo_cache. Entries whose
+        geocoding failed are not recorded, so the next fetch tries them again.
+
+        :return: The coverage report, see `Database.geo_coverage_report`.
+        """
+        with metrics.span("ensure_geoid_cache") as span:
+            diff = self.diff_geo_coverage(geo_indices)
+            entries, previous = diff['entries'], diff['previous']
+            self.logger.info(
+                "geo_indices since the previous fetch: "
+                + ", ".join(f"{len(diff[change])} {change}" for change in ('added', 'changed', 'removed', 'missing'))
+            )
+            pending = diff['added'] | diff['changed'] | diff['missing']
+            candidates = [entry for key, (entry, _) in entries.items() if key in pending]
+            cached = self.get_cached_geo_entries([self.geo_cache_key(entry) for entry in candidates])
+            not_cached_yet = [entry for entry in candidates if self.geo_cache_key(entry) not in cached]
+            lookups = metrics.counter("geo_cache_lookups", "geo_cache lookups by result")
+            lookups.inc(len(candidates) - len(not_cached_yet), result='hit')
+            lookups.inc(len(not_cached_yet), result='miss')
+            span.rows = len(not_cached_yet)
+            if not_cached_yet:
+                self.logger.info(f"Found {len(not_cached_yet)} geo_indices haven't been cached yet")
+                await self.fetch_geo(not_cached_yet)
+                cached |= self.get_cached_geo_entries([self.geo_cache_key(entry) for entry in not_cached_yet])
+
+            covered, stale = [], []
+            for key, (entry, entry_hash) in entries.items():
+                cache_key = self.geo_cache_key(entry)
+                if key not in pending or cache_key not in cached:
+                    continue
+                covered.append((*key, *cache_key, entry_hash))
+                # A renamed city, still cached under the name it had before
+                if key in diff['changed'] and previous[key][:2] != cache_key:
+                    stale.append(previous[key][:2])
+            self.save_geo_coverage(covered, sorted(diff['removed']), stale)
+
+            report = self.geo_coverage_report(self.min_confidence_score)
+            for level, statuses in report.items():
+                self.logger.info(
+                    f"Geo coverage of {level}: "
+                    + ", ".join(f"{count} {status.replace('_', ' ')}" for status, count in statuses.items())
+                )
+            return report
+
+    @staticmethod
+    def geo_cache_key(entry: Dict) -> Tuple[str, str]:
+        """(geo_index, hd_geo_id) an entry of geo_indices is cached under."""
+        return entry['name'], entry['id']
 
     async def fetch_geo(self, index_group: List[Dict]):
         await self.process_data_in_batch(
-            self.GEOCODING_URL, index_group, self.api.fetch_geocoding_data, self.cache_geo_response, 
-            self.api.batch_size, self.api.rate_limit_interval)
+            self.GEOCODING_URL, index_group, self.api.fetch_geocoding_data, self.cache_geo_response,
+            self.api.batch_size, self.api.rate_limit_interval, bulk_cache_function=self.cache_geo_responses)
 
 
 class PostgresToS3(Database):
+    # Rows fetched per round trip of the server-side cursor streaming a table to S3
+    STREAM_ROWS = 2000
+    # Tables dumped at the same time by `backup_tables`
+    BACKUP_WORKERS = 4
+    MANIFEST_NAME = "backup_manifest"
+    # Chunks of incremental backups up to this size are hashed in memory, larger ones in a temporary file
+    SPOOL_SIZE = 64 * 1024 * 1024
+
     def __init__(self, config: Dynaconf, s3_connector: S3Connector, test: bool):
         """
         Initialize the PostgresToS3 class.
@@ -137,19 +280,203 @@ class PostgresToS3(Database):
         super().__init__(config=config, test=test)
         self.logger = logging.getLogger(self.__class__.__name__)
         self.s3_connector = s3_connector
+        self.backup_workers = self.db_params.get('backup_workers', self.BACKUP_WORKERS)
+        # "json": local backups are JSON arrays, "indexed": NDJSON with an offsets index for IndexedBackupReader
+        self.backup_format = self.db_params.get('backup_format', "json")
+
+    def is_local(self, local: bool) -> bool:
+        """Whether backups go to data/: always for the test database."""
+        return local or self.db_handler.db_config.database == "test_db"
+
+    def backup_target(self, table_name: str, price_date: Optional[str] = None) -> Tuple[str, str]:
+        """
+        Table to dump and S3 key of a table's backup.
+
+        :param price_date: Only back up the quarter partition of this price date
+            when the table is partitioned by quarter.
+        """
+        s3_key = f"{table_name}_{datetime.date.today().strftime('%Y%m')}.json"  # e.g., "prices_all_202410.json"
+        if price_date and self.partition_by_quarter and self.is_partitioned(table_name):
+            # The partition name carries its quarter already, e.g. "prices_all_2024q3.json"
+            table_name = f"{table_name}_{get_quarter_suffix(price_date)}"
+            s3_key = f"{table_name}.json"
+        return table_name, s3_key
+
+    def run(self, table_name, local=True, price_date: Optional[str] = None) -> Dict:
+        """
+        Backup a table to S3 or data/.
+
+        :param table_name: The name of the table to back up.
+        :param local: Save to data/ instead of uploading to S3.
+        :param price_date: Only back up the quarter partition of this price date
+            when the table is partitioned by quarter.
+        :return: The manifest entry of the backup.
+        """
+        table_name, s3_key = self.backup_target(table_name, price_date)
+        return self.backup_table(table_name, s3_key, local)
+
+    def backup_tables(self, tables: List[str], local=True, price_date: Optional[str] = None) -> Dict:
+        """
+        Backup tables in parallel from one consistent snapshot and save a manifest with them.
+
+        A REPEATABLE READ transaction exports its snapshot and stays open while each table is
+        dumped by a worker whose transaction imports it, so all backups see the same data even
+        while a fetch keeps writing. Uploads to S3 overlap with dumping.
+
+        :param tables: The names of the tables to back up.
+        :param local: Save to data/ instead of uploading to S3.
+        :param price_date: Only back up the quarter partitions of this price date.
+        :return: The manifest: the snapshot, and the rows, bytes and SHA-256 checksum of each backup.
+        """
+        with self.db_handler.borrow():
+            targets = [self.backup_target(table_name, price_date) for table_name in tables]
+        exporter = DatabaseHandler(self.db_handler.db_config)
+        with exporter.borrow(), metrics.span("backup_tables", tables=len(targets)):
+            exporter.connect()
+            exporter.conn.isolation_level = IsolationLevel.REPEATABLE_READ
+            [(snapshot,)] = exporter.execute_query(EXPORT_SNAPSHOT)
+            with ThreadPoolExecutor(max_workers=self.backup_workers) as executor:
+                entries = list(executor.map(
+                    lambda target: self.backup_in_snapshot(*target, local, snapshot), targets
+                ))
+            exporter.conn.rollback()
+        manifest = {
+            "snapshot": snapshot,
+            "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "tables": entries
+        }
+        self.save_manifest(manifest, local)
+        return manifest
+
+    def backup_in_snapshot(self, table_name: str, s3_key: str, local: bool, snapshot: str) -> Dict:
+        """Backup a table over a connection of its own, in a transaction importing `snapshot`."""
+        handler = DatabaseHandler(self.db_handler.db_config)
+        with handler.borrow():
+            handler.connect()
+            handler.conn.isolation_level = IsolationLevel.REPEATABLE_READ
+            handler.execute_query(sql.SQL(SET_TRANSACTION_SNAPSHOT).format(sql.Literal(snapshot)))
+            entry = self.backup_table(table_name, s3_key, local, handler)
+            handler.conn.rollback()
+        return entry
 
-    def run(self, table_name, local=True):
-        # Example configuration and usage
-        quarter = datetime.date.today().strftime("%Y%m")  # e.g., "2024Q3"
-        s3_key = f"{table_name}_{quarter}.json"  # Desired S3 key
+    def backup_table(self, table_name: str, s3_key: str, local: bool,
+                     handler: Optional[DatabaseHandler] = None) -> Dict:
+        """Backup a table (or partition) to `s3_key` or data/ and return its manifest entry."""
+        with metrics.span("backup", table=table_name):
+            if self.is_local(local) and self.backup_format == "indexed":
+                entry = self.dump_to_indexed_file(table_name, f"data/{table_name}.ndjson", handler)
+            elif self.is_local(local):
+                entry = self.dump_to_file(table_name, f"data/{table_name}.json", handler)
+            else:
+                self.logger.info(self.db_handler.db_config.database)
+                entry = self.dump_and_upload(table_name, s3_key, handler)
+            memory_snapshot(f"backup_{table_name}")
+        return entry
 
-        if local or self.db_handler.db_config.database == "test_db":
-            data = self.dump_table_to_json(table_name)
-            self.save_json_to_file(data, file_path=f"data/{table_name}.json")
+    def save_manifest(self, manifest: Dict, local: bool):
+        """Save a backup manifest next to the backups it describes."""
+        if self.is_local(local):
+            self.save_json_to_file(manifest, file_path=f"data/{self.MANIFEST_NAME}.json")
         else:
-            # Dump table and upload to S3
-            self.logger.info(self.db_handler.db_config.database)
-            self.dump_and_upload(table_name, s3_key)
+            s3_key = f"{self.MANIFEST_NAME}_{datetime.date.today().strftime('%Y%m')}.json"
+            self.s3_connector.upload_json_data(manifest, s3_key)
+
+    def backup_store(self, local: bool) -> BackupStore:
+        """Store of incremental backups: data/incremental/ or the incremental/ prefix of the S3 bucket."""
+        return LocalBackupStore() if self.is_local(local) else S3BackupStore(self.s3_connector)
+
+    def backup_incremental(self, tables: List[str], local=True) -> Dict:
+        """
+        Backup tables as content-addressed chunks, storing only chunks no earlier backup stored.
+
+        Tables are split into the chunks of `INCREMENTAL_CHUNKS`. Chunks whose rows have the same
+        fingerprint as in the previous backup are referenced without being read, the others are
+        dumped as NDJSON, hashed, and stored under their SHA-256 unless that content is stored
+        already. The manifest saved for the backup references the chunks of every table, so any
+        backup can be restored on its own with `BackupToPostgres.restore_incremental`.
+
+        :param tables: The names of the tables to back up.
+        :param local: Store in data/incremental/ instead of S3.
+        :return: The manifest, with the chunks and bytes stored by this backup.
+        """
+        store = self.backup_store(local)
+        previous = store.load_manifest(store.manifest_at()) or {"tables": {}}
+        created_at = datetime.datetime.now(datetime.timezone.utc)
+        manifest = {"created_at": created_at.isoformat(), "tables": {}, "stored": {"chunks": 0, "bytes": 0}}
+        handler = DatabaseHandler(self.db_handler.db_config)
+        with handler.borrow(), metrics.span("backup_incremental", tables=len(tables)):
+            handler.connect()
+            # Fingerprints and chunks are all read from the same snapshot
+            handler.conn.isolation_level = IsolationLevel.REPEATABLE_READ
+            for table_name in tables:
+                known = {
+                    (chunk["chunk"], chunk["fingerprint"]): chunk
+                    for chunk in previous["tables"].get(table_name, {}).get("chunks", [])
+                }
+                manifest["tables"][table_name] = {
+                    "chunks": self.backup_chunks(handler, store, table_name, known, manifest["stored"])
+                }
+            handler.conn.rollback()
+        store.save_manifest(manifest, created_at)
+        self.logger.info(
+            f"Incremental backup stored {manifest['stored']['chunks']} new chunk(s), "
+            f"{manifest['stored']['bytes']} bytes."
+        )
+        return manifest
+
+    def backup_chunks(self, handler: DatabaseHandler, store: BackupStore, table_name: str,
+                      known: Dict[tuple, Dict], stored: Dict[str, int]) -> List[Dict]:
+        """
+        Store the chunks of a table that changed since the previous backup.
+
+        :param known: Chunks of the previous backup by (chunk, fingerprint).
+        :param stored: Counts of the chunks and bytes stored, updated in place.
+        :return: Manifest entries of all chunks of the table.
+        """
+        chunk, keys = self.chunk_query_parts(handler, table_name)
+        fingerprints = handler.execute_query(
+            sql.SQL(CHUNK_FINGERPRINTS).format(chunk=chunk, keys=keys, table=sql.Identifier(table_name))
+        )
+        entries = []
+        for value, rows, fingerprint in fingerprints:
+            if (value, fingerprint) in known:
+                entries.append(known[(value, fingerprint)])
+                continue
+            query = sql.SQL(SELECT_CHUNK_ROWS).format(chunk=chunk, keys=keys, table=sql.Identifier(table_name))
+            with tempfile.SpooledTemporaryFile(self.SPOOL_SIZE) as spool:
+                checksum = hashlib.sha256()
+                with handler.conn.cursor(name=f"incremental_{table_name}") as cur:
+                    cur.execute(query, (value,))
+                    columns = [desc[0] for desc in cur.description]
+                    while batch := cur.fetchmany(self.STREAM_ROWS):
+                        data = "".join(
+                            json.dumps(dict(zip(columns, row)), default=str) + "\n" for row in batch
+                        ).encode()
+                        checksum.update(data)
+                        spool.write(data)
+                size = spool.tell()
+                key = store.chunk_key(checksum.hexdigest())
+                if not store.exists(key):
+                    spool.seek(0)
+                    store.write(key, iter(lambda: spool.read(1024 * 1024), b""))
+                    stored["chunks"] += 1
+                    stored["bytes"] += size
+            entries.append({
+                "chunk": value, "fingerprint": fingerprint, "rows": rows, "bytes": size,
+                "sha256": checksum.hexdigest(), "key": key
+            })
+        metrics.counter("backup_rows", "Rows dumped for backup").inc(
+            sum(entry["rows"] for entry in entries), table=table_name
+        )
+        return entries
+
+    @staticmethod
+    def chunk_query_parts(handler: DatabaseHandler, table_name: str) -> Tuple[sql.Composable, sql.Composable]:
+        """Chunk expression and ordering primary key columns of a table's incremental backup."""
+        if table_name not in INCREMENTAL_CHUNKS:
+            raise ValueError(f"No incremental backup chunks defined for table '{table_name}'.")
+        keys = handler.fetch_primary_key(table_name)
+        return sql.SQL(INCREMENTAL_CHUNKS[table_name]), sql.SQL(', ').join(map(sql.Identifier, keys))
 
     def dump_table_to_json(self, table_name: str) -> List[Dict]:
         """
@@ -164,24 +491,134 @@ class PostgresToS3(Database):
                 cur.execute(f"SELECT * FROM {table_name}")
                 columns = [desc[0] for desc in cur.description]
                 rows = cur.fetchall()
+                metrics.counter("backup_rows", "Rows dumped for backup").inc(len(rows), table=table_name)
                 return [dict(zip(columns, row)) for row in rows]
         except Exception as e:
             self.logger.error(f"Error dumping table {table_name} to JSON: {e}")
             return []
 
-    def dump_and_upload(self, table_name: str, s3_key: str):
+    def stream_table_json(self, table_name: str, handler: Optional[DatabaseHandler] = None,
+                          entry: Optional[Dict] = None) -> Iterator[bytes]:
+        """
+        Stream a PostgreSQL table as the JSON array `dump_table_to_json` returns, encoded in chunks.
+        Rows are read from a server-side cursor, so the table is never held in memory.
+        :param table_name: The name of the table to stream.
+        :param handler: Handler of the connection to read from (default: this loader's).
+        :param entry: Manifest entry counting the streamed rows.
+        """
+        handler = handler or self.db_handler
+        if not handler.conn:
+            handler.connect()
+        rows = 0
+        with handler.conn.cursor(name=f"backup_{table_name}") as cur:
+            cur.execute(f"SELECT * FROM {table_name}")
+            columns = [desc[0] for desc in cur.description]
+            while chunk := cur.fetchmany(self.STREAM_ROWS):
+                encoded = ", ".join(json.dumps(dict(zip(columns, row)), default=str) for row in chunk)
+                yield f"{', ' if rows else '['}{encoded}".encode()
+                rows += len(chunk)
+                if entry is not None:
+                    entry["rows"] = rows
+        yield b"]" if rows else EMPTY_BACKUP
+        metrics.counter("backup_rows", "Rows dumped for backup").inc(rows, table=table_name)
+
+    def measured_stream(self, table_name: str, handler: Optional[DatabaseHandler] = None) -> Tuple[Iterator[bytes], Dict]:
         """
-        Dump a PostgreSQL table to JSON and upload it to S3.
+        Stream a table as JSON, counting its rows and bytes and hashing it on the way.
+        :return: The chunks, and the manifest entry of the table, complete once the chunks are consumed.
+        """
+        entry = {"table": table_name, "location": None, "rows": 0, "bytes": 0, "sha256": None}
+
+        def chunks():
+            checksum = hashlib.sha256()
+            for chunk in self.stream_table_json(table_name, handler, entry):
+                checksum.update(chunk)
+                entry["bytes"] += len(chunk)
+                yield chunk
+            entry["sha256"] = checksum.hexdigest()
+
+        return chunks(), entry
+
+    def dump_to_file(self, table_name: str, file_path: str, handler: Optional[DatabaseHandler] = None) -> Dict:
+        """
+        Stream a PostgreSQL table as JSON into a local file.
+        :param table_name: The name of the PostgreSQL table.
+        :param file_path: The path of the file to save the JSON data to.
+        :return: The manifest entry of the file.
+        """
+        chunks, entry = self.measured_stream(table_name, handler)
+        with open(file_path, "wb") as json_file:
+            for chunk in chunks:
+                json_file.write(chunk)
+        entry["location"] = file_path
+        self.logger.info(f"Data successfully saved to {file_path}")
+        return entry
+
+    def dump_to_indexed_file(self, table_name: str, file_path: str, handler: Optional[DatabaseHandler] = None) -> Dict:
+        """
+        Stream a PostgreSQL table in its `INDEXED_BACKUP_ORDER` into NDJSON and an offsets index,
+        readable with `IndexedBackupReader` without loading the file.
+        :param table_name: The name of the PostgreSQL table or quarter partition.
+        :param file_path: The path of the NDJSON file, the index is saved as `<file_path>.idx`.
+        :return: The manifest entry of the NDJSON file.
+        """
+        base_table = next(
+            name for name in INDEXED_BACKUP_ORDER if table_name == name or table_name.startswith(f"{name}_")
+        )
+        sort, partition = INDEXED_BACKUP_ORDER[base_table]
+        # Sorted by code points, the order the reader compares keys in
+        query = sql.SQL(SELECT_SORTED_ROWS).format(
+            table=sql.Identifier(table_name),
+            order=sql.SQL(', ').join(sql.SQL('{} COLLATE "C"').format(sql.Identifier(column)) for column in sort)
+        )
+        handler = handler or self.db_handler
+        if not handler.conn:
+            handler.connect()
+        entry = {"table": table_name, "location": file_path, "rows": 0, "bytes": 0, "sha256": None}
+        checksum = hashlib.sha256()
+        with IndexedBackupWriter(file_path, sort, partition) as writer, \
+                handler.conn.cursor(name=f"backup_{table_name}") as cur:
+            cur.execute(query)
+            columns = [desc[0] for desc in cur.description]
+            while chunk := cur.fetchmany(self.STREAM_ROWS):
+                for row in chunk:
+                    line = writer.write(dict(zip(columns, row)))
+                    checksum.update(line)
+                    entry["bytes"] += len(line)
+                entry["rows"] += len(chunk)
+        entry["sha256"] = checksum.hexdigest()
+        metrics.counter("backup_rows", "Rows dumped for backup").inc(entry["rows"], table=table_name)
+        self.logger.info(f"Data successfully saved to {file_path} with its index")
+        return entry
+
+    def dump_and_upload(self, table_name: str, s3_key: str, handler: Optional[DatabaseHandler] = None) -> Dict:
+        """
+        Stream a PostgreSQL table as JSON into a multipart upload to S3.
         :param table_name: The name of the PostgreSQL table.
         :param s3_key: The S3 key (object name) for the uploaded JSON file.
+        :param handler: Handler of the connection to read from (default: this loader's).
+        :return: The manifest entry of the upload, without location when the table is empty.
         """
-        self.logger.info(f"Dumping table '{table_name}' to JSON...")
-        table_data = self.dump_table_to_json(table_name)
-        if table_data:
-            self.logger.info(f"Uploading table data to S3 bucket: {self.s3_connector.bucket_name}, key: {s3_key}")
-            self.s3_connector.upload_json_data(table_data, s3_key)
-        else:
+        self.logger.info(f"Streaming table '{table_name}' to JSON...")
+        chunks, entry = self.measured_stream(table_name, handler)
+        first_chunk = next(chunks)
+        if first_chunk == EMPTY_BACKUP:
             self.logger.info(f"No data to upload for table {table_name}.")
+            return entry
+        self.logger.info(f"Uploading table data to S3 bucket: {self.s3_connector.bucket_name}, key: {s3_key}")
+        try:
+            outcome = self.s3_connector.upload_stream(itertools.chain([first_chunk], chunks), s3_key)
+        except Exception as e:
+            # The multipart upload is left open and resumed by the next backup of the same key
+            self.logger.error(f"Error uploading table {table_name} to s3://{self.s3_connector.bucket_name}/{s3_key}: {e}")
+            raise
+        memory_snapshot(f"dump_{table_name}")
+        self.logger.info(
+            f"Uploaded {outcome['bytes']} bytes of {table_name} in {outcome['parts']} part(s), "
+            f"{outcome['skipped']} already uploaded."
+        )
+        entry["location"] = s3_key
+        return entry
 
     def save_json_to_file(self, data: List[Dict], file_path: str):
         """
@@ -0,0 +1,254 @@
+import datetime
+import glob
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Iterator, List, Optional
+from dynaconf import Dynaconf
+from psycopg import sql
+from src.db import Database, DatabaseHandler
+from src.db.query_base import (
+    GET_COLUMN_TYPES, CREATE_SEED_TABLE, COPY_SEED_ROWS, INSERT_SEED_ROWS, DROP_TABLE_IF_EXISTS, GET_PRICE_DATES
+)
+from src.lib import metrics
+from src.lib.backup_store import BackupStore
+
+
+class BackupToPostgres(Database):
+    """
+    Seed the source tables of a fresh database from a previous backup.
+
+    Backups are the JSON arrays written by `PostgresToS3` (`data/<table>.json`, also per
+    quarter partition as `data/<table>_<YYYYqN>.json`) or NDJSON files with one row per line.
+    Rows are loaded with binary COPY in parallel chunks, rows already in the table are kept,
+    so a seeded geo_cache lets `ensure_geoid_cache` skip the geocoding API. Incremental backups
+    are restored from their manifests with `restore_incremental`.
+    """
+    SEEDED_TABLES = ['geo_cache', 'prices_all']
+    BACKUP_EXTENSIONS = ('.json', '.ndjson', '.jsonl')
+    # Written by `PostgresToS3.backup_tables` next to the backups
+    MANIFEST_FILE = 'backup_manifest.json'
+
+    def __init__(self, config: Dynaconf, test=False, workers: int = 4, chunk_size: int = 50000):
+        """
+        :param workers: Number of parallel COPY connections.
+        :param chunk_size: Rows per COPY chunk.
+        """
+        super().__init__(config=config, test=test)
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.workers = workers
+        self.chunk_size = chunk_size
+
+    def find_backup_files(self, source: str, table_name: str) -> List[str]:
+        """
+        Backup files of a table: `source` itself when it is a file, otherwise the
+        `<table>.*` and `<table>_*.*` files of the `source` directory.
+        """
+        if os.path.isfile(source):
+            name = os.path.basename(source)
+            return [source] if name.startswith((f"{table_name}.", f"{table_name}_")) else []
+        files = []
+        for pattern in (f"{table_name}.*", f"{table_name}_*.*"):
+            files += glob.glob(os.path.join(source, pattern))
+        return sorted(file for file in files if file.endswith(self.BACKUP_EXTENSIONS))
+
+    def verify_backup(self, source: str) -> List[str]:
+        """
+        Check the backup files of a directory against the manifest saved with them: sizes first,
+        then SHA-256 checksums.
+
+        :return: The files that are missing or differ from the manifest, empty without a manifest.
+        """
+        manifest_path = os.path.join(source, self.MANIFEST_FILE)
+        if not os.path.isfile(manifest_path):
+            return []
+        with open(manifest_path, "r") as file:
+            manifest = json.load(file)
+        mismatched = []
+        for entry in manifest["tables"]:
+            if not entry["location"]:
+                continue
+            file_path = os.path.join(source, os.path.basename(entry["location"]))
+            if not os.path.isfile(file_path) or os.path.getsize(file_path) != entry["bytes"]:
+                mismatched.append(file_path)
+                continue
+            if self.file_checksum(file_path) != entry["sha256"]:
+                mismatched.append(file_path)
+        self.logger.info(
+            f"Verified {len(manifest['tables'])} backup(s) of snapshot {manifest['snapshot']}: "
+            + ", ".join(f"{entry['table']} ({entry['rows']} rows)" for entry in manifest["tables"])
+        )
+        return mismatched
+
+    @staticmethod
+    def file_checksum(file_path: str) -> str:
+        """SHA-256 of a file, read in blocks."""
+        checksum = hashlib.sha256()
+        with open(file_path, "rb") as file:
+            while block := file.read(1024 * 1024):
+                checksum.update(block)
+        return checksum.hexdigest()
+
+    @staticmethod
+    def read_rows(file_path: str) -> Iterator[Dict]:
+        """Rows of a JSON array backup, or streamed line by line from an NDJSON backup."""
+        with open(file_path, "r") as file:
+            if file_path.endswith('.json'):
+                yield from json.load(file)
+                return
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+    def copy_chunk(self, seed_table: str, column_types: Dict[str, str], rows: List[Dict]) -> int:
+        """COPY one chunk of rows into the seed table over its own connection."""
+        handler = DatabaseHandler(self.db_handler.db_config)
+        with handler.borrow():
+            handler.connect()
+            query = sql.SQL(COPY_SEED_ROWS).format(
+                seed=sql.Identifier(seed_table),
+                columns=sql.SQL(', ').join(map(sql.Identifier, column_types))
+            )
+            with handler.conn.cursor() as cur, cur.copy(query) as copy:
+                copy.set_types(list(column_types.values()))
+                for row in rows:
+                    copy.write_row([row.get(column) for column in column_types])
+            handler.commit()
+            return len(rows)
+
+    def seed_table(self, table_name: str, files: List[str]) -> int:
+        """
+        Load the backup files of one table.
+
+        :return: Number of rows added to the table.
+        """
+        seed_table = f"{table_name}_seed"
+        column_types = dict(self.db_handler.execute_query(GET_COLUMN_TYPES, (table_name,)))
+        self.db_handler.execute_query(sql.SQL(DROP_TABLE_IF_EXISTS).format(sql.Identifier(seed_table)))
+        self.db_handler.execute_query(sql.SQL(CREATE_SEED_TABLE).format(
+            seed=sql.Identifier(seed_table), table=sql.Identifier(table_name)
+        ))
+        self.db_handler.commit()
+        try:
+            with metrics.span("seed_copy", table=table_name) as span:
+                span.rows = self._copy_in_parallel(seed_table, column_types, files)
+            self.logger.info(f"Copied {span.rows} backup rows of {table_name} from {len(files)} file(s).")
+
+            if table_name == 'prices_all':
+                # Quarter partitions for the seeded dates, no-op on unpartitioned tables
+                seed_dates = self.db_handler.execute_query(
+                    sql.SQL(GET_PRICE_DATES).format(sql.Identifier(seed_table))
+                )
+                for (price_date,) in seed_dates:
+                    self.ensure_quarter_partitions(price_date)
+            columns = sql.SQL(', ').join(map(sql.Identifier, column_types))
+            with self.db_handler.conn.cursor() as cur:
+                cur.execute(sql.SQL(INSERT_SEED_ROWS).format(
+                    table=sql.Identifier(table_name), columns=columns, seed=sql.Identifier(seed_table)
+                ))
+                added = cur.rowcount
+            self.db_handler.commit()
+        except Exception:
+            self.db_handler.conn.rollback()
+            raise
+        finally:
+            self.db_handler.execute_query(sql.SQL(DROP_TABLE_IF_EXISTS).format(sql.Identifier(seed_table)))
+            self.db_handler.commit()
+        metrics.counter("seeded_rows", "Rows seeded from backups").inc(added, table=table_name)
+        self.logger.info(f"Seeded {added} new rows into {table_name}.")
+        return added
+
+    def _copy_in_parallel(self, seed_table: str, column_types: Dict[str, str], files: List[str]) -> int:
+        """Split the rows of all files into chunks COPYed by `workers` connections."""
+        copied = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            in_flight = set()
+            chunk = []
+
+            def submit():
+                nonlocal in_flight, copied
+                # Bound the chunks held in memory to two per worker
+                if len(in_flight) >= self.workers * 2:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    copied += sum(future.result() for future in done)
+                in_flight.add(executor.submit(self.copy_chunk, seed_table, column_types, chunk))
+
+            for file_path in files:
+                for row in self.read_rows(file_path):
+                    chunk.append(row)
+                    if len(chunk) >= self.chunk_size:
+                        submit()
+                        chunk = []
+            if chunk:
+                submit()
+            copied += sum(future.result() for future in in_flight)
+        return copied
+
+    def seed_tables(self, files: Dict[str, List[str]]) -> Dict[str, int]:
+        """
+        Seed tables from their backup files, then map the seeded geo_cache entries.
+
+        :param files: Backup files per table.
+        :return: Rows added per table.
+        """
+        seeded = {}
+        with self.db_handler.borrow():
+            self.initiate_db()
+            for table_name, table_files in files.items():
+                seeded[table_name] = self.seed_table(table_name, table_files)
+            if seeded.get('geo_cache'):
+                self.refresh_geo_mapping()
+            self.db_handler.analyze_tables(list(seeded))
+            return seeded
+
+    def run(self, source: str = "data", tables: Optional[List[str]] = None) -> Dict[str, int]:
+        """
+        Seed tables from the backups found in `source`.
+
+        :param source: Backup file or directory (default: the local data/ directory).
+        :param tables: Tables to seed (default: geo_cache and prices_all).
+        :return: Rows added per table.
+        """
+        if os.path.isdir(source) and (mismatched := self.verify_backup(source)):
+            raise ValueError(f"Backups do not match their manifest: {', '.join(mismatched)}")
+        files = {}
+        for table_name in tables or self.SEEDED_TABLES:
+            files[table_name] = self.find_backup_files(source, table_name)
+            if not files[table_name]:
+                self.logger.warning(f"No backup of {table_name} found in {source}.")
+                del files[table_name]
+        return self.seed_tables(files)
+
+    def restore_incremental(self, store: BackupStore, at: Optional[datetime.datetime] = None) -> Dict[str, int]:
+        """
+        Seed tables from the incremental backup taken at or before `at` (default: the latest one).
+
+        Every chunk is checked against the SHA-256 it is stored under before it is loaded. Rows
+        already in the tables are kept, so seed a fresh database to rebuild the tables as they
+        were at that time.
+
+        :param store: Store of the incremental backups written by `PostgresToS3.backup_incremental`.
+        :param at: Point in time to restore.
+        :return: Rows added per table.
+        """
+        manifest_key = store.manifest_at(at)
+        if manifest_key is None:
+            raise ValueError(f"No incremental backup found{f' at or before {at}' if at else ''}.")
+        manifest = store.load_manifest(manifest_key)
+        self.logger.info(f"Restoring the incremental backup of {manifest['created_at']} ({manifest_key}).")
+        with tempfile.TemporaryDirectory() as directory:
+            files = {}
+            for table_name, table in manifest["tables"].items():
+                files[table_name] = [store.fetch(chunk["key"], directory) for chunk in table["chunks"]]
+                mismatched = [
+                    path for path, chunk in zip(files[table_name], table["chunks"])
+                    if self.file_checksum(path) != chunk["sha256"]
+                ]
+                if mismatched:
+                    raise ValueError(f"Backup chunks of {table_name} do not match their checksum: {', '.join(mismatched)}")
+                if not files[table_name]:
+                    del files[table_name]
+            return self.seed_tables(files)
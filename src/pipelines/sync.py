@@ -0,0 +1,373 @@
+import datetime
+import logging
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from psycopg import sql
+from src.db import DatabaseHandler
+from src.db.query_base import (
+    sync_tables, create_sync_watermarks, GET_SYNC_WATERMARK, UPSERT_SYNC_WATERMARK,
+    COUNT_CHANGED_ROWS, SELECT_CHANGED_ROWS, FIND_UNIQUE_CONFLICTS, QUARTER_CHECKSUMS, GET_LATEST_ACTIVE_QUARTER,
+    CREATE_STAGING_TABLE, DROP_TABLE_IF_EXISTS, COPY_QUARTER_OUT, COPY_STAGING_IN, UPSERT_FROM_TABLE, PUBLISHED_WATERMARK,
+    LIST_INDEX_DEFINITIONS, CREATE_STAGING_INDEX, ADD_STAGING_PRIMARY_KEY, ADD_INTERVAL_CHECK, CARRY_OVER_ROWS, ANALYZE_TABLE,
+    CHECK_PARTITIONED, CHECK_PARTITION_ATTACHED, DETACH_PARTITION, ATTACH_RANGE_PARTITION, RENAME_TABLE
+)
+from src.lib import metrics, get_quarter_suffix, get_quarter_interval_bounds
+
+
+SYNC_MODES = ["full", "delta", "verify", "publish"]
+
+
+class PricesUpdater:
+    """
+    Ship transformed tables from the local database to the Homeday Prices DB on RDS.
+
+    - full: ship every row.
+    - delta: ship only rows whose `updated_at` is newer than the watermark of the last
+      successful sync of the table to this target.
+    - verify: compare per-quarter row counts and checksums, nothing is shipped.
+    - publish: load one quarter into staging tables and swap it in atomically (see `publish`).
+
+    Rows are upserted on the RDS primary key, so re-shipping a row is idempotent.
+    Watermarks are kept in the local `sync_watermarks` table per table and target.
+    """
+    def __init__(
+            self, local_config, rds_config, chunk_size=10000, target: Optional[str] = None, bulk_load: bool = False
+        ):
+        """
+        :param bulk_load: In full/delta mode, drop the non-unique indexes of each RDS table while
+            loading and rebuild them with CREATE INDEX CONCURRENTLY afterwards. Meant for large
+            loads, queries on the table are slower until the indexes are back.
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.bulk_load = bulk_load
+        self.local_config = local_config
+        self.rds_config = rds_config
+        self.local_handler = DatabaseHandler(local_config)
+        self.rds_handler = DatabaseHandler(rds_config)
+        self.chunk_size = chunk_size
+        self.target = target or f"{rds_config.host}/{rds_config.database}"
+
+    def get_watermark(self, handler: DatabaseHandler, table_name: str) -> Optional[datetime.datetime]:
+        """Last synced updated_at of a table, None if never synced."""
+        result = handler.execute_query(GET_SYNC_WATERMARK, (table_name, self.target))
+        return result[0][0] if result else None
+
+    def set_watermark(self, handler: DatabaseHandler, table_name: str, updated_at, rows: int, commit: bool = True):
+        handler.execute_query(UPSERT_SYNC_WATERMARK, (table_name, self.target, updated_at, rows))
+        if commit:
+            handler.commit()
+
+    def check_unique_conflicts(self, handler: DatabaseHandler, table_name: str, source: sql.Composable, params=None):
+        """
+        Fail before shipping rows whose unique column (see `sync_tables`) is taken on RDS by another id.
+
+        :param source: Rows to ship, as an `s` aliased FROM item with `id` and the unique column.
+        :raises ValueError: Listing the conflicting values with their local and RDS ids.
+        """
+        unique = sync_tables[table_name]['unique']
+        if not unique:
+            return
+        conflicts = handler.execute_query(sql.SQL(FIND_UNIQUE_CONFLICTS).format(
+            unique=sql.Identifier(unique), source=source, table=sql.Identifier(table_name)
+        ), params)
+        if conflicts:
+            details = ', '.join(
+                f"{value!r} (local id {local_id}, RDS id {rds_id})" for value, local_id, rds_id in conflicts
+            )
+            raise ValueError(
+                f"Cannot sync {table_name}: {unique} already exists on {self.target} under another id: {details}"
+            )
+
+    def update_table(self, table_name, mode="delta"):
+        """Update data from a local table to an RDS table."""
+        self.logger.info(f"Processing table: {table_name} ({mode})")
+        # Own connections per table: the rows are streamed with a server side cursor
+        local_handler = DatabaseHandler(self.local_config)
+        rds_handler = DatabaseHandler(self.rds_config)
+        with local_handler.borrow(), rds_handler.borrow():
+            column_names = local_handler.fetch_column_names(table_name)
+            key_columns = rds_handler.fetch_primary_key(table_name)
+            watermark = self.get_watermark(local_handler, table_name) if mode == "delta" else None
+            params = {'updated_at': watermark}
+
+            total_rows = local_handler.execute_query(
+                sql.SQL(COUNT_CHANGED_ROWS).format(table=sql.Identifier(table_name)), params
+            )[0][0]
+            self.logger.info(f"Rows to sync in {table_name}: {total_rows} (watermark: {watermark})")
+            if not total_rows:
+                return
+
+            updated_at_index = column_names.index('updated_at')
+            unique_column = sync_tables[table_name]['unique']
+            if unique_column:
+                unique_source = sql.SQL("unnest(%s::int8[], %s::text[]) AS s (id, {})").format(
+                    sql.Identifier(unique_column)
+                )
+                id_index, unique_index = column_names.index('id'), column_names.index(unique_column)
+            latest_updated_at = watermark
+
+            offset = 0
+            write_latency = metrics.histogram("db_write_seconds", "Latency of database writes")
+            query = sql.SQL(SELECT_CHANGED_ROWS).format(
+                columns=sql.SQL(', ').join(map(sql.Identifier, column_names)),
+                table=sql.Identifier(table_name)
+            )
+            deferred_indexes = (
+                rds_handler.deferred_indexes([table_name], concurrently=True) if self.bulk_load else nullcontext()
+            )
+            with metrics.span("sync", table=table_name, mode=mode) as span, deferred_indexes:
+                with local_handler.conn.cursor(name=f"sync_{table_name}") as cur:
+                    cur.execute(query, params)
+                    while chunk := cur.fetchmany(self.chunk_size):
+                        if unique_column:
+                            self.check_unique_conflicts(rds_handler, table_name, unique_source, (
+                                [row[id_index] for row in chunk], [row[unique_index] for row in chunk]
+                            ))
+                        with write_latency.time(table=f"rds_{table_name}"):
+                            rds_handler.upsert_data(table_name, chunk, column_names, key_columns)
+                        offset += len(chunk)
+                        # Rows are ordered by updated_at, the last one carries the newest value
+                        latest_updated_at = chunk[-1][updated_at_index]
+
+                        progress = (offset / total_rows) * 100
+                        self.logger.info(f"Progress for {table_name}: {progress:.2f}%")
+                span.rows = offset
+
+            rds_handler.analyze_tables([table_name])
+            self.set_watermark(local_handler, table_name, latest_updated_at, offset)
+            self.logger.info(f"Data from {table_name} synced successfully!")
+
+    def quarter_checksums(self, handler: DatabaseHandler, table_name: str, column_names: List[str]) -> Dict:
+        """{quarter: (row count, checksum)} of the AVIV rows of a table."""
+        spec = sync_tables[table_name]
+        query = sql.SQL(QUARTER_CHECKSUMS).format(
+            quarter=sql.SQL(spec['quarter']),
+            columns=sql.SQL(', ').join(sql.Identifier('t', column) for column in column_names),
+            table=sql.Identifier(table_name),
+            join=sql.SQL(spec['join']),
+            filter=sql.SQL(spec['filter'])
+        )
+        return {quarter: (row_count, checksum) for quarter, row_count, checksum in handler.execute_query(query)}
+
+    def verify(self, tables) -> Dict[str, List[Dict]]:
+        """
+        Compare per-quarter row counts and checksums of the local quarters with RDS.
+
+        :param tables: Tables to verify.
+        :return: {table name: mismatching quarters}, empty lists when in sync.
+        """
+        mismatches = {}
+        for table_name in tables:
+            column_names = self.local_handler.fetch_column_names(table_name)
+            local = self.quarter_checksums(self.local_handler, table_name, column_names)
+            remote = self.quarter_checksums(self.rds_handler, table_name, column_names)
+            mismatches[table_name] = []
+            for quarter, (row_count, checksum) in sorted(local.items()):
+                rds_count, rds_checksum = remote.get(quarter, (0, None))
+                status = "ok" if (row_count, checksum) == (rds_count, rds_checksum) else "MISMATCH"
+                self.logger.info(f"{table_name:<16} {quarter:<8} local {row_count:>8}  rds {rds_count:>8}  {status}")
+                if status != "ok":
+                    mismatches[table_name].append({
+                        'quarter': quarter,
+                        'local_rows': row_count,
+                        'rds_rows': rds_count,
+                        'checksum_match': checksum == rds_checksum
+                    })
+        return mismatches
+
+    def is_partitioned_on_rds(self, table_name: str) -> bool:
+        result = self.rds_handler.execute_query(sql.SQL(CHECK_PARTITIONED).format(sql.Literal(table_name)))
+        return bool(result[0][0])
+
+    def stage_table(self, table_name: str, price_date: str) -> int:
+        """
+        COPY the AVIV rows of one quarter into an unlogged `<table>_staging` table on RDS.
+
+        Indexes are built after the load, and only when the staging table is going to be
+        attached as a partition; otherwise it is just analyzed for the swap.
+        :return: Number of staged rows.
+        """
+        staging = sql.Identifier(f"{table_name}_staging")
+        spec = sync_tables[table_name]
+        column_names = self.local_handler.fetch_column_names(table_name)
+        self.rds_handler.execute_query(sql.SQL(DROP_TABLE_IF_EXISTS).format(staging))
+        self.rds_handler.execute_query(
+            sql.SQL(CREATE_STAGING_TABLE).format(staging=staging, table=sql.Identifier(table_name))
+        )
+        copy_out = sql.SQL(COPY_QUARTER_OUT).format(
+            columns=sql.SQL(', ').join(sql.Identifier('t', column) for column in column_names),
+            table=sql.Identifier(table_name),
+            join=sql.SQL(spec['join']),
+            filter=sql.SQL(spec['filter']),
+            quarter=sql.SQL(spec['quarter']),
+            value=sql.Literal(get_quarter_suffix(price_date).upper())
+        )
+        copy_in = sql.SQL(COPY_STAGING_IN).format(
+            staging=staging, columns=sql.SQL(', ').join(map(sql.Identifier, column_names))
+        )
+        with metrics.span("publish_stage", table=table_name) as span:
+            with self.local_handler.conn.cursor() as local_cur, self.rds_handler.conn.cursor() as rds_cur:
+                with local_cur.copy(copy_out) as source, rds_cur.copy(copy_in) as target:
+                    for block in source:
+                        target.write(block)
+                span.rows = rds_cur.rowcount
+
+            if table_name == "location_prices" and self.is_partitioned_on_rds(table_name):
+                interval_from, interval_to = get_quarter_interval_bounds(price_date)
+                # A matching CHECK constraint lets ATTACH PARTITION skip its validation scan
+                self.rds_handler.execute_query(sql.SQL(ADD_INTERVAL_CHECK).format(
+                    staging=staging,
+                    name=sql.Identifier(f"{table_name}_{get_quarter_suffix(price_date)}_interval_check"),
+                    interval_from=sql.Literal(interval_from),
+                    interval_to=sql.Literal(interval_to)
+                ))
+                key_columns = self.rds_handler.fetch_primary_key(table_name)
+                self.rds_handler.execute_query(sql.SQL(ADD_STAGING_PRIMARY_KEY).format(
+                    staging=staging, keys=sql.SQL(', ').join(map(sql.Identifier, key_columns))
+                ))
+                for unique, definition in self.rds_handler.execute_query(LIST_INDEX_DEFINITIONS, (table_name,)):
+                    self.rds_handler.execute_query(sql.SQL(CREATE_STAGING_INDEX).format(
+                        unique=sql.SQL("UNIQUE" if unique else ""), staging=staging, definition=sql.SQL(definition)
+                    ))
+            self.rds_handler.execute_query(sql.SQL(ANALYZE_TABLE).format(staging))
+            self.rds_handler.commit()
+        self.logger.info(f"Staged {span.rows} rows of {table_name}")
+        return span.rows
+
+    def published_watermark(self, table_name: str, price_date: str) -> Optional[datetime.datetime]:
+        """
+        Delta watermark of a table once its quarter is published: publishing skips the rows of
+        other quarters, so it only moves past the changed rows that belong to the quarter.
+        """
+        spec = sync_tables[table_name]
+        watermark = self.get_watermark(self.local_handler, table_name)
+        # Rows without a report header are not published either. The filters may contain %,
+        # so the watermark is passed as a literal
+        join = sql.SQL(f"LEFT {spec['join']}" if spec['join'] else "")
+        result = self.local_handler.execute_query(sql.SQL(PUBLISHED_WATERMARK).format(
+            filter=sql.SQL(spec['filter']),
+            quarter=sql.SQL(spec['quarter']),
+            value=sql.Literal(get_quarter_suffix(price_date).upper()),
+            table=sql.Identifier(table_name),
+            join=join,
+            updated_at=sql.Literal(watermark)
+        ))
+        return result[0][0] or watermark
+
+    def swap_staging(self, tables, price_date: str, published: Optional[Dict[str, tuple]] = None):
+        """
+        Move the staged quarter of every table into the live RDS tables in one transaction.
+
+        Unpartitioned tables are upserted from staging row by row, see `publish`.
+        :param published: {table name: (watermark, staged rows)} written to `sync_watermarks`
+            with the swap, committed locally right after the RDS transaction.
+        """
+        with metrics.span("publish_swap", price_date=price_date), self.rds_handler.conn.transaction():
+            for table_name, (watermark, rows) in (published or {}).items():
+                self.set_watermark(self.local_handler, table_name, watermark, rows, commit=False)
+            for table_name in tables:
+                staging = f"{table_name}_staging"
+                if table_name == "location_prices" and self.is_partitioned_on_rds(table_name):
+                    self.attach_staging_partition(table_name, staging, price_date)
+                    continue
+                self.check_unique_conflicts(self.rds_handler, table_name, sql.SQL("{} s").format(sql.Identifier(staging)))
+                column_names = self.local_handler.fetch_column_names(table_name)
+                key_columns = self.rds_handler.fetch_primary_key(table_name)
+                self.rds_handler.execute_query(DatabaseHandler.upsert_query(
+                    UPSERT_FROM_TABLE, table_name, column_names, key_columns, source=sql.Identifier(staging)
+                ))
+                self.rds_handler.execute_query(sql.SQL(DROP_TABLE_IF_EXISTS).format(sql.Identifier(staging)))
+
+    def attach_staging_partition(self, table_name: str, staging: str, price_date: str):
+        """Replace the quarter partition with the staging table, keeping rows that were not published."""
+        partition = f"{table_name}_{get_quarter_suffix(price_date)}"
+        replaced = f"{partition}_replaced"
+        attached = self.rds_handler.execute_query(
+            sql.SQL(CHECK_PARTITION_ATTACHED).format(sql.Literal(partition))
+        )[0][0]
+        if attached:
+            self.rds_handler.execute_query(
+                sql.SQL(DETACH_PARTITION).format(sql.Identifier(table_name), sql.Identifier(partition))
+            )
+            self.rds_handler.execute_query(
+                sql.SQL(RENAME_TABLE).format(sql.Identifier(partition), sql.Identifier(replaced))
+            )
+        interval_from, interval_to = get_quarter_interval_bounds(price_date)
+        self.rds_handler.execute_query(sql.SQL(ATTACH_RANGE_PARTITION).format(
+            sql.Identifier(table_name), sql.Identifier(staging), sql.Literal(interval_from), sql.Literal(interval_to)
+        ))
+        self.rds_handler.execute_query(sql.SQL(RENAME_TABLE).format(sql.Identifier(staging), sql.Identifier(partition)))
+        if attached:
+            self.rds_handler.execute_query(sql.SQL(CARRY_OVER_ROWS).format(
+                table=sql.Identifier(table_name), old_partition=sql.Identifier(replaced)
+            ))
+            self.rds_handler.execute_query(sql.SQL(DROP_TABLE_IF_EXISTS).format(sql.Identifier(replaced)))
+
+    def publish(self, tables, price_date: Optional[str] = None):
+        """
+        Publish one quarter to RDS without exposing a partially loaded quarter.
+
+        The quarter is bulk loaded into unlogged staging tables first, then a single
+        transaction upserts it into the live tables (or attaches it as the quarter partition
+        of a partitioned location_prices). Readers see either the previous state of the
+        quarter or all of it, never active headers without their location prices.
+
+        Only the partition attach is a short, metadata-only swap. On an unpartitioned
+        location_prices the swap is an INSERT ... SELECT ... ON CONFLICT of the whole
+        quarter: it is atomic but takes as long as writing the quarter's rows, and holds
+        their row locks until it commits. Partition location_prices on RDS by quarter to
+        keep the swap short.
+
+        The delta watermarks move past the published rows when the swap commits, so the next
+        delta sync does not ship the quarter again.
+
+        :param tables: Tables to publish.
+        :param price_date: First day of the quarter (default: latest active local quarter).
+        """
+        if not price_date:
+            result = self.local_handler.execute_query(GET_LATEST_ACTIVE_QUARTER)
+            price_date = str(result[0][0]) if result and result[0][0] else None
+        if not price_date:
+            raise ValueError("No transformed quarter to publish")
+        self.logger.info(f"Publishing quarter {get_quarter_suffix(price_date)} to {self.target}")
+        self.local_handler.execute_query(create_sync_watermarks)
+        published = {}
+        for table_name in tables:
+            # Read before the rows are staged, rows changed meanwhile are shipped again by delta
+            watermark = self.published_watermark(table_name, price_date)
+            published[table_name] = (watermark, self.stage_table(table_name, price_date))
+        self.swap_staging(tables, price_date, published)
+        self.local_handler.commit()
+        self.rds_handler.analyze_tables(tables)
+        self.logger.info(f"Quarter {get_quarter_suffix(price_date)} published successfully!")
+
+    def run(self, tables, mode="delta", price_date: Optional[str] = None):
+        """
+        Run the update process for multiple tables concurrently.
+
+        :param tables: Tables to sync.
+        :param mode: One of SYNC_MODES.
+        :param price_date: Quarter to publish in publish mode.
+        :return: Mismatches per table in verify mode, None otherwise.
+        """
+        if mode not in SYNC_MODES:
+            raise ValueError(f"Invalid sync mode '{mode}', expected one of {SYNC_MODES}")
+        try:
+            with self.local_handler.borrow(), self.rds_handler.borrow():
+                self.local_handler.connect()
+                self.rds_handler.connect()
+                if mode == "verify":
+                    return self.verify(tables)
+                if mode == "publish":
+                    return self.publish(tables, price_date)
+
+                self.local_handler.execute_query(create_sync_watermarks)
+                self.local_handler.commit()
+                with ThreadPoolExecutor() as executor:
+                    futures = [executor.submit(self.update_table, table, mode) for table in tables]
+                    for future in futures:
+                        future.result()
+        except Exception as e:
+            self.logger.error(f"An error occurred: {e}")
+            raise
@@ -1,145 +1,351 @@
 import os
 import logging
+import numpy as np
+from contextlib import nullcontext
+from typing import Dict, List, Optional
+from psycopg import sql
 from dynaconf import Dynaconf
 from src.db import Database
-from src.db.query_base import insert_price_map
-from src.lib import update_report_batch_id
+from src.db.query_base import health_checks, HEALTH_CHECK_SCOPE, GET_LATEST_ACTIVE_QUARTER, ANOMALY_CHECK_PRICES
+from src.db.query_base import RUN_TRANSFORM_FUNCTION
+from src.lib import update_report_batch_id, metrics
 
 
 class AVIVRawToHDPrices(Database):
-    SQL_REPORT_BATCHES = insert_price_map['report_batches']
-    SQL_REPORT_HEADERS = insert_price_map['report_headers']
-    SQL_LOCATION_PRICES = insert_price_map['location_prices']
+    TRANSFORMED_TABLES = ['report_batches', 'report_headers', 'location_prices']
 
-    def __init__(self, config: Dynaconf, test=False):
+    def __init__(self, config: Dynaconf, test=False, bulk_load: Optional[bool] = None):
+        """
+        :param bulk_load: Drop the non-unique location_prices indexes while inserting the
+            quarter and rebuild them afterwards (default: `db.params.bulk_load`).
+        """
         super().__init__(config=config, test=test)
         self.logger = logging.getLogger(self.__class__.__name__)
+        self.bulk_load = self.db_params.get('bulk_load', False) if bulk_load is None else bulk_load
 
     def run(self):
         """
         Run the entire transformation pipeline in sequence.
         """
+        with self.db_handler.borrow():
+            try:
+                self.logger.info("Starting transformation pipeline...")
+                if self.partition_by_quarter:
+                    for price_date in self.get_price_dates():
+                        self.ensure_quarter_partitions(price_date)
+                with self.db_handler.deferred_indexes(['location_prices']) if self.bulk_load else nullcontext():
+                    row_counts = self.run_transform_function()
+                # Fresh statistics for the health checks that follow
+                self.db_handler.analyze_tables(self.TRANSFORMED_TABLES)
+                last_value = row_counts['report_batches_id_seq']
+                if self.db_handler.db_config.database != "test_db":
+                    self.logger.info("Update report batch ID for next time to re-run")
+                    secret_path = os.path.join(os.getcwd(), os.getenv("SECRET_PATH"))
+                    update_report_batch_id(file_path=secret_path, latest_value=last_value+1)
+                return row_counts
+            finally:
+                self.logger.info("Pipeline execution completed.")
+
+    def run_transform_function(self) -> Dict[str, int]:
+        """
+        Run all transform steps server side in one round trip and one transaction.
+
+        A failing step rolls back the whole transform, so report headers are never
+        deactivated without their new location prices.
+        :return: Affected rows per step, plus the last report_batches id.
+        """
+        self.logger.info("Transforming data to report batches, report headers and location prices...")
         try:
-            self.logger.info("Starting transformation pipeline...")
-            self.execute_transform_query("Transforming data to report batches...", self.SQL_REPORT_BATCHES)
-            self.execute_transform_query("Transforming data to report headers...", self.SQL_REPORT_HEADERS)
-            self.execute_transform_query("Transforming data to location prices...", self.SQL_LOCATION_PRICES)
-            last_value = self.get_last_value_sequence()
-            if self.db_handler.db_config.database != "test_db":
-                self.logger.info("Update report batch ID for next time to re-run")
-                secret_path = os.path.join(os.getcwd(), os.getenv("SECRET_PATH"))
-                update_report_batch_id(file_path=secret_path, latest_value=last_value+1)
-        finally:
-            self.db_handler.close()
-            self.logger.info("Pipeline execution completed.")
-
-    def execute_transform_query(self, task_description, query):
-        """
-        Execute a SQL query and log the task description.
-        """
-        self.logger.info(task_description)
-        if not self.db_handler.conn:
-            self.db_handler.connect()
-        try:
-            with self.db_handler.conn.cursor() as cur:
-                cur.execute(query)
-                self.db_handler.conn.commit()
-            self.logger.info(f"{task_description} - Success.")
+            with metrics.span("transform") as span:
+                row_counts = dict(self.db_handler.execute_query(RUN_TRANSFORM_FUNCTION))
+                self.db_handler.commit()
+                span.rows = row_counts['location_prices']
         except Exception as e:
-            self.logger.error(f"{task_description} - Failed. Error: {e}")
+            self.db_handler.conn.rollback()
+            self.logger.error(f"Transform failed and was rolled back. Error: {e}")
             raise
+        transform_rows = metrics.counter("transform_rows", "Rows written per transform step")
+        for step in self.TRANSFORMED_TABLES:
+            transform_rows.inc(row_counts[step], step=step)
+            self.logger.info(f"Transformed {step}: {row_counts[step]} rows.")
+        return row_counts
 
 
 class TransformedPricesHealthCheck(Database):
+    """
+    Health checks of a transformed quarter.
+
+    All registered checks are evaluated in one statement over one connection and
+    scoped to a single quarter. Each check returns its number of violations and a
+    capped sample of offending rows; failing `error` checks raise, `warning` checks are logged.
+    """
+    checks = dict(health_checks)
+    default_params = {
+        'sample_size': 10,
+        'max_null_price_ratio': 0.05,
+        'min_coverage': 0.9,
+        'max_price_jump': 0.5
+    }
+
     def __init__(self, config: Dynaconf, test=False):
         super().__init__(config=config, test=test)
         self.config = config
         self.logger = logging.getLogger(self.__class__.__name__)
+        self.params = {**self.default_params, **config.get('health_check', {})}
 
-    def execute_query(self, query):
+    @classmethod
+    def register_check(cls, name: str, query: str, severity: str = "error", description: str = ""):
+        """
+        Register an additional check.
+
+        :param name: Unique check name.
+        :param query: SELECT returning one `sample` jsonb per violation. It can use the CTEs
+            scope, scoped_batches, scoped_headers, scoped_prices and previous_prices, and the
+            query parameters of `default_params`/`health_check` config.
+        :param severity: 'error' fails the health check, 'warning' only logs.
+        :param description: Message used when the check reports violations.
+        """
+        cls.checks[name] = {"severity": severity, "description": description or name, "query": query}
+
+    def execute_query(self, query, params=None):
         """
         Execute a SQL query for health check purposes.
 
         Args:
             query (str): SQL query to execute.
+            params (dict): Query parameters.
 
         Returns:
             list: Query results.
         """
-        self.logger.info(f"Executing health check query:\n{query}")
+        self.logger.debug(f"Executing health check query:\n{query}")
         try:
-            self.db_handler.connect()
-            with self.db_handler.conn.cursor() as cur:
-                cur.execute(query)
-                result = cur.fetchall()
-                self.logger.info("Query executed successfully.")
-                return result
+            result = self.db_handler.execute_query(query, params)
+            self.logger.info("Query executed successfully.")
+            return result
         except Exception as e:
             self.logger.error(f"Health check query failed: {e}")
             raise
 
-    def validate_report_batches(self):
-        """
-        Validate the `report_batches` table.
+    def build_query(self, names: List[str]) -> sql.Composed:
+        """Compose the selected checks into a single statement."""
+        checks = [
+            sql.SQL("SELECT {name}::text AS check_name, sample FROM ({query}) AS {alias}").format(
+                name=sql.Literal(name),
+                query=sql.SQL(self.checks[name]["query"].strip()),
+                alias=sql.Identifier(f"check_{index}")
+            )
+            for index, name in enumerate(names)
+        ]
+        return sql.SQL(HEALTH_CHECK_SCOPE).format(checks=sql.SQL("\n        UNION ALL\n        ").join(checks))
 
-        - Ensure unique `name` values.
-        - Validate `started_at` and `completed_at` timestamps.
-        """
-        query = """
-            SELECT name, COUNT(*)
-            FROM report_batches
-            GROUP BY name
-            HAVING COUNT(*) > 1
-        """
-        results = self.execute_query(query)
-        if results:
-            raise ValueError(f"Duplicate names found in report_batches: {results}")
+    def resolve_price_date(self) -> Optional[str]:
+        """Latest quarter with active report headers."""
+        result = self.execute_query(GET_LATEST_ACTIVE_QUARTER)
+        return str(result[0][0]) if result and result[0][0] else None
 
-    def validate_report_headers(self):
+    def run_checks(
+            self,
+            names: Optional[List[str]] = None,
+            price_date: Optional[str] = None,
+            geo_indices: Optional[Dict] = None
+        ) -> Dict[str, Dict]:
         """
-        Validate the `report_headers` table.
+        Evaluate checks for one quarter.
 
-        - Ensure proper mapping between `price_date` and `report_batch_id`.
+        :param names: Checks to run (default: all registered checks).
+        :param price_date: First day of the quarter to check (default: latest active quarter).
+        :param geo_indices: Geo indices the quarter should cover, enables the coverage check.
+        :return: {check name: {'violations': int, 'samples': list, 'severity': str}}
         """
-        query = """
-            SELECT rh.report_batch_id, COUNT(*)
-            FROM report_headers rh
-            JOIN report_batches rb ON rh.report_batch_id = rb.id
-            WHERE rh.date != DATE_TRUNC('quarter', rb.started_at)
-                AND rh.active = TRUE
-            GROUP BY rh.report_batch_id
-            HAVING COUNT(*) > 4
+        names = names or list(self.checks)
+        price_date = price_date or self.resolve_price_date()
+        if not price_date:
+            self.logger.warning("No active report headers found, nothing to check.")
+            return {}
+
+        params = {
+            **self.params,
+            'price_date': price_date,
+            'expected_zip_codes': len(geo_indices['zip_codes']) if geo_indices else 0,
+            'expected_cities': len(geo_indices['cities']) if geo_indices else 0
+        }
+        rows = self.execute_query(self.build_query(names), params) or []
+        results = {
+            name: {'violations': 0, 'samples': [], 'severity': self.checks[name]['severity']}
+            for name in names
+        }
+        for check_name, violations, samples in rows:
+            results[check_name].update(violations=violations, samples=samples)
+        return results
+
+    def validate_report_batches(self, price_date: Optional[str] = None):
+        """Ensure unique `name` values in `report_batches`."""
+        self._raise_on_errors(self.run_checks(["duplicate_report_batches"], price_date))
+
+    def validate_report_headers(self, price_date: Optional[str] = None):
+        """Ensure proper mapping between `price_date` and `report_batch_id`."""
+        self._raise_on_errors(self.run_checks(["report_headers_mapping"], price_date))
+
+    def validate_location_prices(self, price_date: Optional[str] = None):
+        """Ensure `price`, `max`, and `min` values are non-negative."""
+        self._raise_on_errors(self.run_checks(["negative_location_prices"], price_date))
+
+    def _raise_on_errors(self, results: Dict[str, Dict]):
+        errors = []
+        for name, result in results.items():
+            if not result['violations']:
+                continue
+            message = f"{self.checks[name]['description']} ({result['violations']} violations): {result['samples']}"
+            if result['severity'] == 'error':
+                errors.append(message)
+            else:
+                self.logger.warning(message)
+        if errors:
+            raise ValueError("; ".join(errors))
+
+    def run_all_checks(self, price_date: Optional[str] = None, geo_indices: Optional[Dict] = None):
         """
-        results = self.execute_query(query)
-        if results:
-            raise ValueError(f"Inconsistent report_headers mapping: {results}")
+        Run all health checks for a quarter in a single pass.
 
-    def validate_location_prices(self):
+        Raises:
+            ValueError: If any health check fails.
         """
-        Validate the `location_prices` table.
+        self.logger.info("Running health checks...")
+        with self.db_handler.borrow():
+            with metrics.span("health_check"):
+                results = self.run_checks(price_date=price_date, geo_indices=geo_indices)
+            self._raise_on_errors(results)
+        self.logger.info("All health checks passed successfully.")
+        return results
 
-        - Ensure `price`, `max`, and `min` values are non-negative.
-        - Check that `zip_code` and `city_id` are correctly mapped.
+
+class PriceAnomalyCheck(Database):
+    """
+    Quarter-over-quarter price anomaly detection of a transformed quarter.
+
+    Current and previous quarter prices of all locations are read with one statement into NumPy
+    arrays. Relative changes, their z-scores within each level (zip codes, cities) and property
+    type, and min <= price <= max are evaluated vectorized. A check fails when more than
+    `max_anomaly_ratio` of the prices it compares violate it, which stops the sync.
+    """
+    default_params = {
+        'max_relative_change': 0.5,
+        'max_z_score': 4.0,
+        # z-scores of smaller groups are not meaningful
+        'min_group_size': 30,
+        'max_anomaly_ratio': 0.01,
+        'sample_size': 10
+    }
+    COLUMNS = ['header_name', 'property_type', 'location', 'price', 'min', 'max', 'previous_price']
+
+    def __init__(self, config: Dynaconf, test=False):
+        super().__init__(config=config, test=test)
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.params = {**self.default_params, **config.get('anomaly_check', {})}
+
+    def load_prices(self, price_date: str) -> Dict[str, np.ndarray]:
+        """Prices of a quarter and of the previous quarter by location, as one array per column."""
+        rows = self.db_handler.execute_query(ANOMALY_CHECK_PRICES, {'price_date': price_date}) or []
+        table = np.array(rows, dtype=object).reshape(len(rows), len(self.COLUMNS))
+        return {
+            column: table[:, index].astype(float if index > 2 else str)
+            for index, column in enumerate(self.COLUMNS)
+        }
+
+    def detect(self, prices: Dict[str, np.ndarray]) -> Dict[str, Dict]:
         """
-        query = """
-            SELECT report_header_id, price, max, min
-            FROM location_prices
-            WHERE (zip_code is not null OR city_id is not null)
-            AND (price < 0 OR max < 0 OR min < 0)
+        Evaluate the anomaly checks over the arrays of `load_prices`.
+
+        :return: {check name: {'violations', 'compared', 'ratio', 'failed', 'samples'}}, and
+            per group ('<level>/<property type>') its compared prices and mean and deviation of the changes.
         """
-        results = self.execute_query(query)
-        if results:
-            raise ValueError(f"Negative values detected in location_prices: {results}")
+        price, previous = prices['price'], prices['previous_price']
+        low, high = prices['min'], prices['max']
+        header_names, header_codes = np.unique(prices['header_name'], return_inverse=True)
+        property_types, property_codes = np.unique(prices['property_type'], return_inverse=True)
+        group = header_codes * len(property_types) + property_codes
+        groups = len(header_names) * len(property_types)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            compared = (previous > 0) & ~np.isnan(price)
+            change = np.where(compared, price / previous - 1, np.nan)
+            counts = np.bincount(group, weights=compared, minlength=groups)
+            mean = np.bincount(group, weights=np.where(compared, change, 0), minlength=groups) / counts
+            variance = np.bincount(group, weights=np.where(compared, change ** 2, 0), minlength=groups) / counts - mean ** 2
+            deviation = np.sqrt(np.maximum(variance, 0))
+            z_score = (change - mean[group]) / deviation[group]
+        z_score[(counts[group] < self.params['min_group_size']) | (deviation[group] == 0)] = np.nan
 
-    def run_all_checks(self):
+        priced = ~np.isnan(price)
+        checks = {
+            'relative_change': (compared & (np.abs(change) > self.params['max_relative_change']), compared, np.abs(change)),
+            'z_score': (np.abs(np.nan_to_num(z_score)) > self.params['max_z_score'], ~np.isnan(z_score), np.abs(z_score)),
+            'min_max': (
+                priced & ((price < low) | (price > high) | (low > high)), priced,
+                np.fmax(np.nan_to_num(low - price), np.nan_to_num(price - high))
+            )
+        }
+        report = {}
+        for name, (violated, scope, severity) in checks.items():
+            violations, total = int(violated.sum()), int(scope.sum())
+            ratio = violations / total if total else 0.0
+            worst = np.flatnonzero(violated)[np.argsort(-severity[violated], kind='stable')][:self.params['sample_size']]
+            report[name] = {
+                'violations': violations, 'compared': total, 'ratio': ratio,
+                'failed': ratio > self.params['max_anomaly_ratio'],
+                'samples': [
+                    {
+                        'header_name': str(prices['header_name'][index]),
+                        'property_type': str(prices['property_type'][index]),
+                        'location': str(prices['location'][index]), 'price': float(price[index]),
+                        'previous_price': float(previous[index]), 'min': float(low[index]), 'max': float(high[index]),
+                        'change': float(change[index]), 'z_score': float(z_score[index])
+                    }
+                    for index in worst
+                ]
+            }
+        report['groups'] = {
+            f"{header_names[code // len(property_types)]}/{property_types[code % len(property_types)]}": {
+                'compared': int(counts[code]), 'mean_change': float(mean[code]), 'deviation': float(deviation[code])
+            }
+            for code in range(groups) if counts[code]
+        }
+        return report
+
+    def run(self, price_date: Optional[str] = None) -> Dict[str, Dict]:
         """
-        Run all health checks.
+        Check a quarter (default: latest active quarter) for price anomalies.
 
         Raises:
-            ValueError: If any health check fails.
+            ValueError: If a check exceeds `max_anomaly_ratio`.
         """
-        self.logger.info("Running health checks...")
-        self.validate_report_batches()
-        self.validate_report_headers()
-        self.validate_location_prices()
-        self.logger.info("All health checks passed successfully.")
+        with self.db_handler.borrow():
+            price_date = price_date or self.latest_quarter()
+            if not price_date:
+                self.logger.warning("No active report headers found, nothing to check.")
+                return {}
+            with metrics.span("anomaly_check", price_date=price_date) as span:
+                prices = self.load_prices(price_date)
+                report = self.detect(prices)
+                span.rows = len(prices['price'])
+        failed = []
+        for name, result in report.items():
+            if name == 'groups' or not result['violations']:
+                continue
+            message = (
+                f"{name}: {result['violations']} of {result['compared']} prices ({result['ratio']:.2%}), "
+                f"worst: {result['samples'][:3]}"
+            )
+            if result['failed']:
+                failed.append(message)
+            else:
+                self.logger.warning(f"Price anomalies below max_anomaly_ratio, {message}")
+        if failed:
+            raise ValueError(f"Price anomalies in {price_date} block the sync: " + "; ".join(failed))
+        self.logger.info(f"No price anomalies above max_anomaly_ratio in {price_date}.")
+        return report
+
+    def latest_quarter(self) -> Optional[str]:
+        result = self.db_handler.execute_query(GET_LATEST_ACTIVE_QUARTER)
+        return str(result[0][0]) if result and result[0][0] else None
@@ -0,0 +1,57 @@
+import json
+import pytest
+from config import settings
+from src.db import Database
+
+
+geo_rows = [
+    ("10315", "no_hd_geo_id_applicable", "NBH2DE75702", "NBH2", "{}", "Friedrichsfelde", 1),
+    ("12589", "no_hd_geo_id_applicable", "NBH2DE75693", "NBH2", "{}", "Rahnsdorf", 1),
+    ("Ohne", "3fdcc595-161c-57c0-b786-94bc424ea460", "AD08DE1992", "AD08", "{}", "Ohne", 1),
+]
+geo_indices = {
+    "zip_codes": [{"id": "no_hd_geo_id_applicable", "name": "10315"}, {"id": "no_hd_geo_id_applicable", "name": "12589"}],
+    "cities": [{"id": "3fdcc595-161c-57c0-b786-94bc424ea460", "name": "Ohne"}],
+}
+
+PIPELINE_TABLES = [
+    "geo_cache", "geo_mapping", "geo_coverage", "prices_all", "report_batches", "report_headers", "location_prices",
+    "sync_watermarks"
+]
+
+
+def price(value):
+    return json.dumps({"low": int(value * 0.6), "high": int(value * 1.6), "value": value, "accuracy": 3})
+
+
+def insert_prices(cur, price_date, factor=1.0):
+    for index, (_, _, aviv_geo_id, *_rest) in enumerate(geo_rows):
+        value = int((3000 + index * 500) * factor)
+        cur.execute(
+            "INSERT INTO prices_all VALUES (%s, %s, 'TRANSACTION_TYPE.SELL', %s, %s, %s)",
+            (aviv_geo_id, price_date, price(value), price(value), price(value))
+        )
+
+
+@pytest.fixture
+def source_db():
+    """
+    Empty the pipeline tables of the test database, then cache `geo_rows` and their prices.
+
+    Call it with {price_date: price factor} of the quarters to insert.
+    """
+    db = Database(config=settings, test=True)
+    db.initiate_db()
+
+    def seed(quarters):
+        with db.db_handler.conn.cursor() as cur:
+            cur.execute(f"TRUNCATE {', '.join(PIPELINE_TABLES)}")
+            for row in geo_rows:
+                cur.execute("INSERT INTO geo_cache VALUES (%s, %s, %s, %s, %s, %s, %s)", row)
+            for price_date, factor in quarters.items():
+                insert_prices(cur, price_date, factor)
+        db.db_handler.commit()
+        return db
+
+    yield seed
+    db.db_handler.close()
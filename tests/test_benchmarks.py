@@ -0,0 +1,35 @@
+from benchmarks.run import compare_with_baseline
+from benchmarks.seed import quarter_dates, synthetic_geo_indices
+from benchmarks.statements import benchmark_statements
+from config import settings
+
+
+def test_quarter_dates():
+    assert quarter_dates("2024-04-01", 3) == ["2023-10-01", "2024-01-01", "2024-04-01"]
+
+
+def test_synthetic_geo_indices_scale():
+    geo_indices = synthetic_geo_indices(0.01, prefix="x ")
+    assert len(geo_indices["zip_codes"]) == 82
+    assert len(geo_indices["cities"]) == 110
+    assert geo_indices["zip_codes"][0] == {"id": "no_hd_geo_id_applicable", "name": "x Z0000000"}
+
+
+def test_compare_with_baseline():
+    baseline = {"scales": {"1": {"stages": {"transform": 1.0, "sync": 2.0}}}}
+    results = {"scales": {"1": {"stages": {"transform": 1.1, "sync": 3.0, "backup": 5.0}}}}
+
+    regressions = compare_with_baseline(results, baseline, threshold=0.2)
+
+    assert len(regressions) == 1
+    assert regressions[0].startswith("sync at 1x")
+
+
+def test_benchmark_statements_cleans_up():
+    results = benchmark_statements(settings.db.test, units=4, batch_size=2)
+    assert {name: list(modes) for name, modes in results.items()} == {
+        "geo_cache_insert": ["text", "prepared", "pipeline"],
+        "prices_all_insert": ["text", "prepared", "pipeline"],
+        "geo_cache_lookup": ["text", "prepared"],
+    }
+    assert all(rate > 0 for modes in results.values() for rate in modes.values())
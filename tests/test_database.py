@@ -1,8 +1,9 @@
+import logging
 import pytest
 import json
 from config import settings
 from src.models import GeocodingResponse, PriceResponse
-from src.db import Database
+from src.db import Database, DatabaseHandler
 
 
 db = Database(config=settings, test=True)
@@ -24,6 +25,29 @@ def db_conn():
 def test_connect_to_db(db_conn):
     assert db_conn is not None, "Database connection should be established"
 
+
+def test_handlers_share_pooled_connections(db_conn):
+    handler = DatabaseHandler(settings.db.test)
+    assert handler.pool() is db.db_handler.pool()
+
+    with handler.borrow():
+        handler.connect()
+        connection = handler.conn
+        # Connecting again and nested blocks keep the borrowed connection
+        handler.connect()
+        with handler.borrow():
+            assert handler.execute_query("SELECT 1") == [(1,)]
+        assert handler.conn is connection
+    assert handler.conn is None
+
+    # A connection returned inside a transaction is rolled back and reused
+    handler.connect()
+    handler.execute_query("CREATE TEMP TABLE pooled (id int)")
+    handler.close()
+    handler.connect()
+    assert handler.execute_query("SELECT to_regclass('pooled')") == [(None,)]
+    handler.close()
+
 # Test create_tables function
 def test_create_tables(db_conn):
     with db_conn.cursor() as cur:
@@ -68,6 +92,23 @@ def test_cache_geoid(db_conn):
     cached_geo_id = db.get_cached_geoid([geocoding_response.geo_index])[0]
     assert cached_geo_id == geocoding_response.id
 
+def test_cache_geo_responses_in_one_pipeline(db_conn):
+    responses = [
+        GeocodingResponse(
+            geo_index=f"pipelined{index}", hd_geo_id="no_hd_geo_id_applicable", id=f"geo_pipelined{index}",
+            type_key="NBH2", coordinates="{}", bounding_box={}, match_name=f"Pipelined {index}",
+            confidence_score=1, parents=[]
+        )
+        for index in range(3)
+    ]
+    assert db.cache_geo_responses(responses) == {"cached": 3}
+    assert db.get_cached_geoid(["pipelined0", "pipelined2", "unknown"]) == ["geo_pipelined0", "geo_pipelined2"]
+    # The inserts and the lookup run as statements prepared on the connection
+    prepared = db.db_handler.execute_query("SELECT statement FROM pg_prepared_statements")
+    assert any("INSERT INTO geo_cache" in statement for statement, in prepared)
+    assert any("geo_index = ANY" in statement for statement, in prepared)
+
+
 # Test store_data_in_db function
 def test_store_data_in_db(db_conn):
     price_response = PriceResponse(
@@ -88,3 +129,157 @@ def test_store_data_in_db(db_conn):
     assert result is not None, "Data should be stored in the database"
     assert result[0] == 'geo789', f"Expected 'geo789', but got {result[0]}"
     assert result[1] == '2023-10-01', f"Expected '2023-10-01', but got {result[1]}"
+
+
+def bulk_price(place_id, transaction_type, value):
+    prices = {"value": value} if transaction_type else {}
+    return PriceResponse(place_id, "2023-07-01", transaction_type, prices, prices, prices)
+
+
+@pytest.mark.parametrize("database", ["db_conn", "partitioned_db"])
+def test_store_prices_in_db_merges_like_single_rows(database, request):
+    request.getfixturevalue(database)
+    if database == "db_conn":
+        database = db
+    else:
+        database = request.getfixturevalue(database)
+    handler = database.db_handler
+    handler.execute_query("DELETE FROM prices_all WHERE aviv_geo_id LIKE 'bulk%'")
+    database.store_price_in_db(bulk_price("bulk_priced", "sell", 1))
+    database.store_price_in_db(bulk_price("bulk_null", None, 0))
+
+    outcome = database.store_prices_in_db([
+        bulk_price("bulk_priced", "sell", 2),  # already priced: kept
+        bulk_price("bulk_null", "sell", 3),  # stored without a price: upgraded
+        bulk_price("bulk_new", None, 0),  # the same unit twice: the priced row wins
+        bulk_price("bulk_new", "sell", 4),
+    ])
+
+    assert outcome == {"inserted": 1, "upgraded": 1, "skipped": 2}
+    rows = handler.execute_query(
+        "SELECT aviv_geo_id, transaction_type, house_price->>'value' FROM prices_all "
+        "WHERE aviv_geo_id LIKE 'bulk%%' ORDER BY 1"
+    )
+    assert rows == [("bulk_new", "sell", "4"), ("bulk_null", "sell", "3"), ("bulk_priced", "sell", "1")]
+
+
+@pytest.fixture
+def partitioned_db(caplog):
+    """Fresh database with unpartitioned tables holding two quarters, then converted to partitions."""
+    from dynaconf.utils.boxing import DynaBox
+    config = DynaBox({
+        'db': {
+            'test': {**dict(settings.db.test), 'database': f"{settings.db.test.database}_partitioned"},
+            'params': {'report_batch_id': 1}
+        }
+    })
+    admin = Database(config=settings, test=True)
+    admin.db_handler.connect()
+    admin.db_handler.conn.autocommit = True
+    # Idle pooled connections of an earlier run would block the drop
+    DatabaseHandler.close_pools(config.db.test.database)
+    admin.db_handler.execute_query(f"DROP DATABASE IF EXISTS {config.db.test.database}")
+    admin.db_handler.close()
+
+    unpartitioned = Database(config=config, test=True)
+    unpartitioned.initiate_db()
+    with unpartitioned.db_handler.conn.cursor() as cur:
+        for price_date in ("2024-07-01", "2024-10-01"):
+            cur.execute(
+                "INSERT INTO prices_all VALUES ('geo1', %s, 'sell', '{}', '{}', '{}')", (price_date,)
+            )
+        cur.execute("""
+            INSERT INTO location_prices (price, created_at, updated_at, interval)
+            VALUES (1, now(), now(), daterange('2024-07-01', '2024-10-01'))
+        """)
+    unpartitioned.db_handler.commit()
+    unpartitioned.db_handler.close()
+
+    config.db.params.partition_by_quarter = True
+    partitioned = Database(config=config, test=True)
+    caplog.set_level(logging.INFO, logger="Database")
+    partitioned.create_tables()
+    yield partitioned
+    partitioned.db_handler.close()
+
+
+def partition_rows(database, table_name):
+    rows = database.db_handler.execute_query(
+        f"SELECT tableoid::regclass::text, COUNT(*) FROM {table_name} GROUP BY 1 ORDER BY 1"
+    )
+    return dict(rows)
+
+
+def test_create_tables_migrates_to_quarter_partitions(partitioned_db, caplog):
+    assert partitioned_db.is_partitioned('prices_all')
+    assert partitioned_db.is_partitioned('location_prices')
+    assert not partitioned_db.is_partitioned('geo_cache')
+    assert partition_rows(partitioned_db, 'prices_all') == {'prices_all_2024q3': 1, 'prices_all_2024q4': 1}
+    assert partition_rows(partitioned_db, 'location_prices') == {'location_prices_2024q4': 1}
+    migrated = [record.getMessage() for record in caplog.get_records("setup") if "Migrated" in record.getMessage()]
+    assert migrated == [
+        "Migrated 2 rows of 'prices_all' into quarter partitions.",
+        "Migrated 1 rows of 'location_prices' into quarter partitions."
+    ]
+
+
+def test_ensure_quarter_partitions_moves_rows_out_of_default(partitioned_db):
+    partitioned_db.db_handler.execute_query(
+        "INSERT INTO prices_all VALUES ('geo1', '2025-01-01', 'sell', '{}', '{}', '{}')"
+    )
+    partitioned_db.db_handler.commit()
+    assert partition_rows(partitioned_db, 'prices_all')['prices_all_default'] == 1
+
+    partitioned_db.ensure_quarter_partitions('2025-01-01')
+    partitioned_db.ensure_quarter_partitions('2025-01-01')  # idempotent
+    rows = partition_rows(partitioned_db, 'prices_all')
+    assert 'prices_all_default' not in rows
+    assert rows['prices_all_2025q1'] == 1
+
+
+def test_detach_quarter_partition(partitioned_db):
+    partition = partitioned_db.detach_quarter_partition('prices_all', '2024-07-01', drop=True)
+    assert partition == 'prices_all_2024q3'
+    assert partition_rows(partitioned_db, 'prices_all') == {'prices_all_2024q4': 1}
+    assert partitioned_db.get_price_dates() == ['2024-10-01']
+
+
+def secondary_indexes(handler, table_name):
+    rows = handler.execute_query(
+        "SELECT indexname FROM pg_indexes WHERE tablename = %s AND indexdef NOT LIKE 'CREATE UNIQUE%%'",
+        (table_name,)
+    )
+    return sorted(row[0] for row in rows)
+
+
+@pytest.mark.parametrize("concurrently", [False, True])
+def test_deferred_indexes_are_rebuilt(db_conn, concurrently):
+    before = secondary_indexes(db.db_handler, 'location_prices')
+    assert len(before) == 4
+
+    with pytest.raises(RuntimeError):
+        with db.db_handler.deferred_indexes(['location_prices'], concurrently=concurrently) as dropped:
+            assert len(dropped) == 4
+            assert secondary_indexes(db.db_handler, 'location_prices') == []
+            raise RuntimeError("load failed")
+
+    assert secondary_indexes(db.db_handler, 'location_prices') == before
+    assert db.db_handler.conn.autocommit is False
+
+
+def test_deferred_indexes_rebuild_invalid_index(db_conn):
+    before = secondary_indexes(db.db_handler, 'location_prices')
+    with db.db_handler.deferred_indexes(['location_prices'], concurrently=True) as dropped:
+        # What a failed CREATE INDEX CONCURRENTLY leaves behind under the same name
+        index_name, table_name, definition, _ = dropped[0]
+        db.db_handler.execute_query(f"CREATE INDEX {index_name} ON {table_name} {definition}")
+        db.db_handler.execute_query(
+            "UPDATE pg_index SET indisvalid = false WHERE indexrelid = to_regclass(%s)", (index_name,)
+        )
+        db.db_handler.commit()
+
+    assert secondary_indexes(db.db_handler, 'location_prices') == before
+    invalid = db.db_handler.execute_query(
+        "SELECT COUNT(*) FROM pg_index WHERE indrelid = 'location_prices'::regclass AND NOT indisvalid"
+    )
+    assert invalid == [(0,)]
@@ -1,10 +1,20 @@
+import copy
+import datetime
+import hashlib
+import boto3
 import pytest
 import json
 from unittest.mock import AsyncMock, MagicMock, patch
+from botocore.exceptions import ClientError
+from dynaconf.utils.boxing import DynaBox
+from src.db import DatabaseHandler
 from src.lib.aws import S3Connector
+from src.lib.backup_store import S3BackupStore
 from src.pipelines.extract_and_load import APIToPostgres, PostgresToS3
-from src.models import PriceResponse
+from src.api_client import APIClient
+from src.models import GeocodingResponse, PriceResponse
 from config import settings
+from tests.conftest import geo_indices
 
 
 class TestFixtures:
@@ -33,6 +43,19 @@ class TestFixtures:
             pg_to_s3.conn = mock_conn
             yield pg_to_s3
 
+    @pytest.fixture
+    def moto_s3(self, monkeypatch):
+        """S3Connector of a bucket in moto's in-memory S3."""
+        moto = pytest.importorskip("moto")
+        for variable in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"):
+            monkeypatch.setenv(variable, "testing")
+        session = boto3.Session(region_name="us-east-1")
+        with moto.mock_aws(), patch("src.lib.aws.boto3.Session", return_value=session):
+            connector = S3Connector(config=settings)
+            connector.s3_client.create_bucket(Bucket=connector.bucket_name)
+            connector.part_size = S3Connector.MIN_PART_SIZE
+            yield connector
+
     @pytest.fixture
     def mock_api_to_postgres(self):
         """Fixture to provide a mocked instance of APIToPostgres."""
@@ -61,13 +84,138 @@ class TestPostgresToS3(TestFixtures):
         table_name = "test_table"
         s3_key = "test_key.json"
 
-        # Mock dump_table_to_json to return fake table data
-        with patch.object(postgres_to_s3, "dump_table_to_json", return_value=[{"key": "value"}]) as mock_dump, \
-             patch.object(postgres_to_s3.s3_connector, "upload_json_data") as mock_upload:
-            
-            postgres_to_s3.dump_and_upload(table_name, s3_key)
-            mock_dump.assert_called_once_with(table_name)
-            mock_upload.assert_called_once_with([{"key": "value"}], s3_key)
+        chunks = [b'[{"key": "value"}', b"]"]
+        with patch.object(postgres_to_s3, "stream_table_json", return_value=iter(chunks)) as mock_stream, \
+             patch.object(postgres_to_s3.s3_connector, "upload_stream") as mock_upload:
+            mock_upload.side_effect = lambda stream, key: {"parts": 1, "bytes": len(b"".join(stream)), "skipped": 0}
+
+            entry = postgres_to_s3.dump_and_upload(table_name, s3_key)
+            assert mock_stream.call_args.args[:2] == (table_name, None)
+            assert mock_upload.call_args.args[1] == s3_key
+            assert entry["location"] == s3_key
+            assert entry["bytes"] == len(b"".join(chunks))
+            assert entry["sha256"] == hashlib.sha256(b"".join(chunks)).hexdigest()
+
+        with patch.object(postgres_to_s3, "stream_table_json", return_value=iter([b"[]"])), \
+             patch.object(postgres_to_s3.s3_connector, "upload_stream") as mock_upload:
+            assert postgres_to_s3.dump_and_upload(table_name, s3_key)["location"] is None
+            mock_upload.assert_not_called()
+
+    def test_upload_stream_in_parallel_parts(self, moto_s3):
+        body = bytes(range(256)) * (12 * 1024 * 4)  # 12 MiB
+        chunks = (body[index:index + 1000000] for index in range(0, len(body), 1000000))
+
+        outcome = moto_s3.upload_stream(chunks, "stream.json")
+
+        assert outcome == {"parts": 3, "bytes": len(body), "skipped": 0}
+        assert moto_s3.s3_client.get_object(Bucket=moto_s3.bucket_name, Key="stream.json")["Body"].read() == body
+        assert moto_s3.incomplete_upload("stream.json") is None
+
+    def test_upload_stream_retries_and_resumes_parts(self, moto_s3):
+        body = b"".join(bytes([index]) * S3Connector.MIN_PART_SIZE for index in range(3)) + b"end"
+        upload_part = moto_s3.s3_client.upload_part
+        failures = {2: 1, 4: 3}  # part 2 fails once, part 4 as often as it is attempted
+
+        def flaky_upload_part(**kwargs):
+            if failures.get(kwargs["PartNumber"]):
+                failures[kwargs["PartNumber"]] -= 1
+                raise ClientError({"Error": {"Code": "InternalError"}}, "UploadPart")
+            return upload_part(**kwargs)
+
+        with patch.object(moto_s3.s3_client, "upload_part", side_effect=flaky_upload_part) as mock_upload_part:
+            with pytest.raises(ClientError):
+                moto_s3.upload_stream([body], "resumed.json")
+            assert failures == {2: 0, 4: 0}
+            upload_id = moto_s3.incomplete_upload("resumed.json")
+            assert sorted(moto_s3.uploaded_parts("resumed.json", upload_id)) == [1, 2, 3]
+
+            mock_upload_part.reset_mock()
+            outcome = moto_s3.upload_stream([body], "resumed.json")
+
+        assert outcome == {"parts": 4, "bytes": len(body), "skipped": 3}
+        assert [call.kwargs["PartNumber"] for call in mock_upload_part.call_args_list] == [4]
+        assert moto_s3.s3_client.get_object(Bucket=moto_s3.bucket_name, Key="resumed.json")["Body"].read() == body
+
+    def test_s3_backup_store(self, moto_s3):
+        store = S3BackupStore(moto_s3)
+        key = store.chunk_key("abc")
+        assert not store.exists(key)
+        store.write(key, [b'{"a": 1}\n', b'{"a": 2}\n'])
+        assert store.exists(key)
+        assert store.read(key) == b'{"a": 1}\n{"a": 2}\n'
+        assert moto_s3.list_keys("incremental/") == ["incremental/chunks/abc.ndjson"]
+
+        created = [datetime.datetime(2024, 10, day, tzinfo=datetime.timezone.utc) for day in (1, 15)]
+        keys = [store.save_manifest({"day": moment.day}, moment) for moment in created]
+        assert store.list("manifests/") == keys
+        assert store.manifest_at() == keys[1]
+        assert store.manifest_at(datetime.datetime(2024, 10, 14)) == keys[0]
+        assert store.manifest_at(datetime.datetime(2024, 9, 30)) is None
+        assert store.load_manifest(keys[0]) == {"day": 1}
+
+    def test_stream_table_to_s3(self, moto_s3, source_db):
+        """A table is streamed from a server-side cursor into the same JSON array as a full dump."""
+        source_db({"2024-07-01": 1.0, "2024-10-01": 1.1})
+        pg_to_s3 = PostgresToS3(config=settings, s3_connector=moto_s3, test=True)
+        pg_to_s3.STREAM_ROWS = 2
+        with pg_to_s3.db_handler.borrow():
+            pg_to_s3.dump_and_upload("prices_all", "prices_all.json")
+            dumped = pg_to_s3.dump_table_to_json("prices_all")
+
+        uploaded = moto_s3.s3_client.get_object(Bucket=moto_s3.bucket_name, Key="prices_all.json")["Body"].read()
+        assert len(dumped) == 6
+        assert json.loads(uploaded) == dumped
+
+    @pytest.mark.parametrize("price_date, partitioned, dumped_table, s3_key", [
+        (None, False, "prices_all", "prices_all_202410.json"),
+        ("2024-07-01", True, "prices_all_2024q3", "prices_all_2024q3.json"),
+    ])
+    def test_run_s3_key(self, postgres_to_s3, price_date, partitioned, dumped_table, s3_key):
+        """A quarter partition is uploaded under its own name, other tables with the backup month."""
+        postgres_to_s3.partition_by_quarter = partitioned
+        postgres_to_s3.db_handler.db_config = DynaBox({"database": "prices"})
+        with patch.object(postgres_to_s3, "is_partitioned", return_value=partitioned), \
+             patch.object(postgres_to_s3, "dump_and_upload") as mock_upload, \
+             patch("src.pipelines.extract_and_load.datetime") as mock_datetime:
+            mock_datetime.date.today.return_value = datetime.date(2024, 10, 15)
+            postgres_to_s3.run("prices_all", local=False, price_date=price_date)
+        mock_upload.assert_called_once_with(dumped_table, s3_key, None)
+
+    def test_backup_tables_from_one_snapshot(self, source_db, tmp_path, monkeypatch):
+        """Rows committed while the tables are dumped are in none of the backups."""
+        source_db({"2024-07-01": 1.0, "2024-10-01": 1.1})
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "data").mkdir()
+        pg_to_s3 = PostgresToS3(config=settings, s3_connector=None, test=True)
+        backup_in_snapshot = pg_to_s3.backup_in_snapshot
+        writer = DatabaseHandler(settings.db.test)
+
+        def write_then_backup(*args):
+            with writer.borrow():
+                writer.execute_query(
+                    "INSERT INTO geo_cache VALUES ('late', 'hd', 'AVIV_LATE', 'NBH2', '{}', 'Late', 1) "
+                    "ON CONFLICT DO NOTHING"
+                )
+                writer.execute_query(
+                    "INSERT INTO prices_all VALUES ('AVIV_LATE', '2024-10-01', 'sell', '{}', '{}', '{}') "
+                    "ON CONFLICT DO NOTHING"
+                )
+                writer.commit()
+            return backup_in_snapshot(*args)
+
+        with patch.object(pg_to_s3, "backup_in_snapshot", side_effect=write_then_backup):
+            manifest = pg_to_s3.backup_tables(["geo_cache", "prices_all"], local=True)
+
+        entries = {entry["table"]: entry for entry in manifest["tables"]}
+        assert {table: entry["rows"] for table, entry in entries.items()} == {"geo_cache": 3, "prices_all": 6}
+        for table, entry in entries.items():
+            content = (tmp_path / entry["location"]).read_bytes()
+            assert len(json.loads(content)) == entry["rows"]
+            assert (len(content), hashlib.sha256(content).hexdigest()) == (entry["bytes"], entry["sha256"])
+        assert json.loads((tmp_path / "data" / "backup_manifest.json").read_text()) == manifest
+        # The late rows were committed before the dumps started
+        assert pg_to_s3.db_handler.execute_query("SELECT COUNT(*) FROM geo_cache") == [(4,)]
+        pg_to_s3.db_handler.close()
 
     def test_save_json_to_file(self, postgres_to_s3, tmp_path):
         """Test the save_json_to_file method."""
@@ -124,6 +272,29 @@ class TestAPIToPostgres(TestFixtures):
             mock_logger.info.assert_called()
 
 
+    @pytest.mark.asyncio
+    async def test_process_data_in_batch_uses_bulk_sink_for_large_batches(self, mock_api_to_postgres):
+        mock_fetch_function = AsyncMock(side_effect=lambda base_url, unit, **kwargs: {"data": unit})
+        mock_cache_function = MagicMock()
+        mock_bulk_cache_function = MagicMock(side_effect=lambda results: {"inserted": len(results)})
+        mock_api_to_postgres.bulk_sink_min_rows = 2
+
+        outcome = await mock_api_to_postgres.process_data_in_batch(
+            base_url="http://example.com",
+            idx_group=[{"id": "1"}, {"id": "2"}, {"id": "3"}, {"id": "4"}, {"id": "5"}],
+            fetch_function=mock_fetch_function,
+            cache_function=mock_cache_function,
+            batch_size=2,
+            rate_limit_interval=0,
+            bulk_cache_function=mock_bulk_cache_function,
+        )
+
+        # Two full batches go through the bulk sink, the single leftover row through cache_function
+        assert mock_bulk_cache_function.call_count == 2
+        assert mock_cache_function.call_count == 1
+        assert outcome == {"inserted": 4}
+
+
     @pytest.mark.asyncio
     async def test_run(self, mock_api_to_postgres):
         """Test the run method."""
@@ -163,29 +334,62 @@ class TestAPIToPostgres(TestFixtures):
             mock_api_to_postgres.store_price_in_db,
             mock_api_to_postgres.api.batch_size,
             mock_api_to_postgres.api.rate_limit_interval,
+            bulk_cache_function=mock_api_to_postgres.store_prices_in_db,
             price_date=price_date,
         )
 
 
     @pytest.mark.asyncio
-    async def test_ensure_geoid_cache(self, mock_api_to_postgres):
-        """Test the ensure_geoid_cache method."""
-        mock_api_to_postgres.get_cached_geoid = MagicMock(side_effect=lambda names: None if names[0] == "12345" else ["geoid_456"])
-        mock_api_to_postgres.fetch_geo = AsyncMock()
-
-        geo_indices = {
-            "zip_codes": [{"name": "12345"}, {"name": "67890"}],
-            "cities": [{"name": "Berlin"}]
-        }
-
-        await mock_api_to_postgres.ensure_geoid_cache(geo_indices)
-
-        # Assertions
-        mock_api_to_postgres.get_cached_geoid.assert_any_call(["12345"])
-        mock_api_to_postgres.get_cached_geoid.assert_any_call(["67890"])
-        mock_api_to_postgres.get_cached_geoid.assert_any_call(["Berlin"])
-        mock_api_to_postgres.fetch_geo.assert_awaited_once_with([{"name": "12345"}])
-
+    async def test_ensure_geoid_cache_geocodes_only_changed_entries(self, source_db):
+        """Only entries added or changed since the previous fetch are geocoded, removed ones are skipped."""
+        source_db({"2024-10-01": 1.0})
+        pipeline = APIToPostgres(settings, test=True)
+        matches = {"10117": ("NBH2DE10117", 0), "99999": ("NBH2DE99999", 1), "Ohne Stadt": ("AD08DE1992", 1)}
+        unavailable = {"99999"}
+        geocoded = []
+
+        async def fetch_geo(index_group):
+            geocoded.append([entry['name'] for entry in index_group])
+            pipeline.cache_geo_responses([
+                GeocodingResponse(entry['name'], entry['id'], matches[entry['name']][0], "NBH2", {}, {},
+                                  entry['name'], matches[entry['name']][1], [])
+                if entry['name'] in matches else APIClient._default_geocoding_response(entry['name'], entry['id'])
+                for entry in index_group if entry['name'] not in unavailable
+            ])
+
+        pipeline.fetch_geo = fetch_geo
+        indices = copy.deepcopy(geo_indices)
+        indices['zip_codes'] += [
+            {"id": "no_hd_geo_id_applicable", "name": "10117"}, {"id": "no_hd_geo_id_applicable", "name": "99999"}
+        ]
+        indices['cities'].append({"id": "hd-neustadt", "name": "Neustadt"})
+
+        # Cached entries are recorded without geocoding them, a failed one is not recorded
+        report = await pipeline.ensure_geoid_cache(indices)
+        assert geocoded == [["10117", "99999", "Neustadt"]]
+        assert report['zip_codes'] == {'matched': 2, 'defaulted': 0, 'low_confidence': 1, 'missing': 0, 'removed': 0}
+        assert report['cities'] == {'matched': 1, 'defaulted': 1, 'low_confidence': 0, 'missing': 0, 'removed': 0}
+
+        # A removed zip code and a renamed city
+        unavailable.clear()
+        indices['zip_codes'] = [entry for entry in indices['zip_codes'] if entry['name'] != "12589"]
+        indices['cities'][0]['name'] = "Ohne Stadt"
+        report = await pipeline.ensure_geoid_cache(indices)
+        assert geocoded[1] == ["99999", "Ohne Stadt"]
+        assert report['zip_codes'] == {'matched': 3, 'defaulted': 0, 'low_confidence': 1, 'missing': 0, 'removed': 1}
+        assert report['cities'] == {'matched': 1, 'defaulted': 1, 'low_confidence': 0, 'missing': 0, 'removed': 0}
+        assert pipeline.get_cached_geo_entries([("Ohne", geo_indices['cities'][0]['id'])]) == set()
+
+        # The transform and the price fetch skip the removed zip code
+        pipeline.refresh_geo_mapping()
+        mapped = pipeline.db_handler.execute_query("SELECT geo_index FROM geo_mapping ORDER BY 1")
+        assert [geo_index for geo_index, in mapped] == ["10117", "10315", "99999", "Neustadt", "Ohne Stadt"]
+        assert "NBH2DE75693" not in pipeline.get_validated_price("2025-01-01")
+
+        # Nothing changed: nothing is looked up or geocoded
+        await pipeline.ensure_geoid_cache(indices)
+        assert len(geocoded) == 2
+        pipeline.db_handler.close()
 
     @pytest.mark.asyncio
     async def test_fetch_geo(self, mock_api_to_postgres):
@@ -205,4 +409,5 @@ class TestAPIToPostgres(TestFixtures):
             mock_api_to_postgres.cache_geo_response,
             mock_api_to_postgres.api.batch_size,
             mock_api_to_postgres.api.rate_limit_interval,
+            bulk_cache_function=mock_api_to_postgres.cache_geo_responses,
         )
\ No newline at end of file
@@ -0,0 +1,73 @@
+import json
+import pytest
+from config import settings
+from src.lib.indexed_backup import IndexedBackupReader, IndexedBackupWriter
+from src.pipelines import BackupToPostgres, PostgresToS3
+from tests.conftest import geo_rows
+
+
+def write_prices(path, rows):
+    with IndexedBackupWriter(str(path), ["price_date", "aviv_geo_id"], "price_date") as writer:
+        for row in rows:
+            writer.write(row)
+
+
+def test_reader_finds_rows_without_scanning(tmp_path, monkeypatch):
+    rows = [
+        {"aviv_geo_id": f"geo{index:03}", "price_date": price_date, "value": index}
+        for price_date in ("2024-07-01", "2024-10-01") for index in range(100)
+    ]
+    path = tmp_path / "prices_all.ndjson"
+    write_prices(path, rows)
+    # The NDJSON file is a plain backup of the rows
+    assert [json.loads(line) for line in path.read_text().splitlines()] == rows
+
+    with IndexedBackupReader(str(path)) as prices:
+        assert len(prices) == 200
+        row = prices.row
+        parsed = []
+        monkeypatch.setattr(prices, "row", lambda position: parsed.append(position) or row(position))
+        assert prices.find(aviv_geo_id="geo042", price_date="2024-10-01") == [rows[142]]
+        assert len(parsed) < 20
+        assert prices.find(aviv_geo_id="geo042") == [rows[42], rows[142]]
+        assert prices.find(aviv_geo_id="missing") == []
+        assert prices.find(price_date="2025-01-01") == []
+        assert list(prices.partition_rows("2024-10-01")) == rows[100:]
+        assert list(prices.partition_rows("2025-01-01")) == []
+
+
+def test_reader_of_empty_backup(tmp_path):
+    path = tmp_path / "geo_cache.ndjson"
+    with IndexedBackupWriter(str(path), ["aviv_geo_id"]):
+        pass
+    with IndexedBackupReader(str(path)) as geo_cache:
+        assert len(geo_cache) == 0
+        assert geo_cache.find(aviv_geo_id="geo") == []
+
+
+def test_writer_rejects_partition_not_sorted_first(tmp_path):
+    with pytest.raises(ValueError):
+        IndexedBackupWriter(str(tmp_path / "prices.ndjson"), ["aviv_geo_id", "price_date"], "price_date")
+
+
+def test_indexed_local_backup(source_db, tmp_path, monkeypatch):
+    db = source_db({"2024-07-01": 1.0, "2024-10-01": 1.1})
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data").mkdir()
+    dumper = PostgresToS3(config=settings, s3_connector=None, test=True)
+    dumper.backup_format = "indexed"
+    manifest = dumper.backup_tables(["geo_cache", "prices_all"])
+    assert {entry["location"] for entry in manifest["tables"]} == {"data/geo_cache.ndjson", "data/prices_all.ndjson"}
+
+    with IndexedBackupReader("data/prices_all.ndjson") as prices:
+        assert [row["aviv_geo_id"] for row in prices.partition_rows("2024-10-01")] == sorted(
+            aviv_geo_id for _, _, aviv_geo_id, *_rest in geo_rows
+        )
+        [row] = prices.find(aviv_geo_id="NBH2DE75693", price_date="2024-10-01")
+        assert row["house_price"]["value"] == int(3500 * 1.1)
+    with IndexedBackupReader("data/geo_cache.ndjson") as geo_cache:
+        assert [row["geo_index"] for row in geo_cache.find(aviv_geo_id="AD08DE1992")] == ["Ohne"]
+
+    db.db_handler.execute_query("TRUNCATE geo_cache, geo_mapping, prices_all")
+    db.db_handler.commit()
+    assert BackupToPostgres(settings, test=True).run(source="data") == {"geo_cache": 3, "prices_all": 6}
@@ -0,0 +1,50 @@
+import json
+import pytest
+from src.lib.metrics import MetricsRegistry
+
+
+@pytest.fixture
+def registry():
+    return MetricsRegistry()
+
+
+def test_prometheus_export(registry):
+    registry.counter("aviv_http_requests", "AVIV API requests").inc(endpoint="prices", status=200)
+    registry.counter("aviv_http_requests", "AVIV API requests").inc(endpoint="prices", status=200)
+    histogram = registry.histogram("db_write_seconds", "Latency of database writes", buckets=(0.1, 1.0))
+    histogram.observe(0.05, table="geo_cache")
+    histogram.observe(0.5, table="geo_cache")
+
+    text = registry.to_text()
+
+    assert "# TYPE aviv_http_requests counter" in text
+    assert 'aviv_http_requests_total{endpoint="prices",status="200"} 2' in text
+    assert 'db_write_seconds_bucket{table="geo_cache",le="0.1"} 1' in text
+    assert 'db_write_seconds_bucket{table="geo_cache",le="1.0"} 2' in text
+    assert 'db_write_seconds_bucket{table="geo_cache",le="+Inf"} 2' in text
+    assert 'db_write_seconds_count{table="geo_cache"} 2' in text
+    assert registry.to_text(openmetrics=True).endswith("# EOF\n")
+
+
+def test_span_records_stage_metrics(registry):
+    with registry.span("fetch_price") as span:
+        span.rows = 10
+
+    assert registry.histogram("pipeline_stage_seconds").count(stage="fetch_price") == 1
+    assert registry.counter("pipeline_stage_rows").value(stage="fetch_price") == 10
+    assert registry.gauge("pipeline_stage_rows_per_second").value(stage="fetch_price") > 0
+
+
+def test_trace_file(registry, tmp_path):
+    registry.enable_tracing()
+    with registry.span("run"):
+        with registry.span("ensure_geoid_cache") as inner:
+            inner.rows = 3
+
+    file_path = tmp_path / "trace.json"
+    registry.write_trace(str(file_path))
+    events = json.loads(file_path.read_text())["traceEvents"]
+
+    assert [event["name"] for event in events] == ["ensure_geoid_cache", "run"]
+    assert events[0]["args"] == {"rows": 3}
+    assert events[1]["dur"] >= events[0]["dur"]
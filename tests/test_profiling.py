@@ -0,0 +1,51 @@
+import asyncio
+import pstats
+import pytest
+from src.lib.profiling import Profiler, memory_snapshot, pstats_to_collapsed
+
+
+def busy(n):
+    return sum(i * i for i in range(n))
+
+
+async def stages():
+    busy(20000)
+    memory_snapshot("first_stage")
+    await asyncio.sleep(0.01)
+    data = [str(i) for i in range(10000)]
+    memory_snapshot("second_stage")
+    return data
+
+
+@pytest.mark.parametrize("mode", ["cprofile", "yappi"])
+def test_cpu_profile_files(mode, tmp_path, capsys):
+    with Profiler(mode, label="fetch", output_dir=str(tmp_path), top=5) as profiler:
+        asyncio.run(stages())
+
+    stats_file = next(f for f in profiler.files if f.endswith(".pstats"))
+    collapsed_file = next(f for f in profiler.files if f.endswith(".collapsed"))
+    assert pstats.Stats(stats_file).total_calls > 0
+    assert any("test_profiling.py" in line for line in open(collapsed_file))
+    assert "Top 5 functions" in capsys.readouterr().out
+
+
+def test_tracemalloc_snapshots_at_stage_boundaries(tmp_path, capsys):
+    with Profiler("tracemalloc", label="backup", output_dir=str(tmp_path), top=3) as profiler:
+        asyncio.run(stages())
+
+    assert [file.rsplit("_", 1)[-1] for file in profiler.files] == [
+        "start.snapshot", "stage.snapshot", "stage.snapshot", "end.snapshot"
+    ]
+    assert "'first_stage' and 'second_stage'" in capsys.readouterr().out
+
+
+def test_memory_snapshot_without_profiler_is_noop():
+    memory_snapshot("nothing_running")
+
+
+def test_collapsed_stacks_follow_callers():
+    profile = __import__("cProfile").Profile()
+    profile.runcall(busy, 10000)
+    lines = pstats_to_collapsed(pstats.Stats(profile))
+    assert lines
+    assert all(int(line.rsplit(" ", 1)[1]) >= 0 for line in lines)
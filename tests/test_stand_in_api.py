@@ -0,0 +1,79 @@
+import pytest
+import json
+from benchmarks import StandInAPI
+from src.api_client import APIClient
+from src.models import GeocodingResponse, PriceResponse
+
+
+geo_indices = {
+    "zip_codes": [{"id": "no_hd_geo_id_applicable", "name": "10315"}],
+    "cities": [{"id": "3fdcc595-161c-57c0-b786-94bc424ea460", "name": "Ohne"}]
+}
+
+
+@pytest.fixture
+def api_client():
+    return APIClient(geoapi_key="stand-in", priceapi_key="stand-in")
+
+
+@pytest.mark.asyncio
+async def test_generated_responses(api_client):
+    """Generated payloads go through the regular APIClient validation."""
+    async with StandInAPI(geo_indices=geo_indices) as stand_in:
+        urls = stand_in.api_config()
+        zip_code = await api_client.fetch_geocoding_data(urls["geo_coding_url"], geo_indices["zip_codes"][0])
+        city = await api_client.fetch_geocoding_data(urls["geo_coding_url"], geo_indices["cities"][0])
+        price = await api_client.fetch_price_data(urls["price_url"], zip_code.id, price_date="2024-10-01")
+
+    assert isinstance(zip_code, GeocodingResponse)
+    assert zip_code.type_key == "NBH2"
+    assert city.type_key == "AD08"
+    assert isinstance(price, PriceResponse)
+    assert price.place_id == zip_code.id
+    assert price.house_price["low"] <= price.house_price["value"] <= price.house_price["high"]
+
+
+@pytest.mark.asyncio
+async def test_unknown_index_and_error_injection(api_client):
+    """Unknown geo indices and injected 5xx responses end up as default responses."""
+    async with StandInAPI(geo_indices=geo_indices) as stand_in:
+        urls = stand_in.api_config()
+        unknown = await api_client.fetch_geocoding_data(urls["geo_coding_url"], {"id": "x", "name": "Atlantis"})
+    assert unknown.id == "no_aviv_id_available"
+
+    async with StandInAPI(geo_indices=geo_indices, error_rate=1.0) as stand_in:
+        urls = stand_in.api_config()
+        price = await api_client.fetch_price_data(urls["price_url"], "NBH2DE1", price_date="2024-10-01")
+        assert price.transaction_type is None
+        assert sum(v for k, v in stand_in.stats.items() if k.startswith("prices_5")) == 1
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_per_key(api_client):
+    """Requests above the per-key rate are answered with 429."""
+    async with StandInAPI(geo_indices=geo_indices, rate_limit=2) as stand_in:
+        urls = stand_in.api_config()
+        for _ in range(5):
+            await api_client.fetch_price_data(urls["price_url"], "NBH2DE1", price_date="2024-10-01")
+        assert stand_in.stats["prices_429"] >= 3
+
+
+@pytest.mark.asyncio
+async def test_replay_recordings(api_client, tmp_path):
+    """Recorded responses take precedence over generated ones."""
+    recording = {
+        "endpoint": "prices",
+        "key": "NBH2DE75702|2023-10-01",
+        "status": 200,
+        "body": {"items": [{
+            "place_id": "NBH2DE75702", "price_date": "2023-10-01", "transaction_type": "TRANSACTION_TYPE.SELL",
+            "house_price": {"value": 5027}, "apartment_price": None, "hybrid_price": None
+        }]}
+    }
+    file_path = tmp_path / "recordings.ndjson"
+    file_path.write_text(json.dumps(recording) + "\n")
+
+    async with StandInAPI(geo_indices=geo_indices, recordings=str(file_path)) as stand_in:
+        urls = stand_in.api_config()
+        price = await api_client.fetch_price_data(urls["price_url"], "NBH2DE75702", price_date="2023-10-01")
+    assert price.house_price == {"value": 5027}
@@ -0,0 +1,172 @@
+import pytest
+from dynaconf.utils.boxing import DynaBox
+from config import settings
+from src.db import Database
+from src.pipelines import AVIVRawToHDPrices, PricesUpdater
+
+
+TABLES = ["report_batches", "report_headers", "location_prices"]
+
+rds_config = DynaBox({
+    'db': {
+        'test': {**dict(settings.db.test), 'database': f"{settings.db.test.database}_rds"},
+        'params': {'report_batch_id': 1}
+    }
+})
+
+
+@pytest.fixture
+def databases(source_db):
+    """Transformed local test database and an empty stand-in of the RDS database."""
+    local = source_db({"2024-07-01": 1.0})
+    AVIVRawToHDPrices(settings, test=True).run()
+
+    rds = Database(config=rds_config, test=True)
+    rds.initiate_db()
+    rds.db_handler.execute_query(f"TRUNCATE {', '.join(TABLES)}")
+    rds.db_handler.commit()
+    yield local, rds
+    rds.db_handler.close()
+
+
+def synced_rows(local):
+    rows = local.db_handler.execute_query("SELECT table_name, synced_rows FROM sync_watermarks ORDER BY 1")
+    return dict(rows)
+
+
+def test_delta_sync_ships_only_changed_rows(databases):
+    local, rds = databases
+    updater = PricesUpdater(settings.db.test, rds_config.db.test, target="rds")
+
+    updater.run(TABLES)
+    assert synced_rows(local) == {"location_prices": 6, "report_batches": 1, "report_headers": 4}
+
+    # Nothing changed: nothing shipped
+    updater.run(TABLES)
+    assert synced_rows(local) == {"location_prices": 6, "report_batches": 1, "report_headers": 4}
+
+    # Re-transforming the quarter deactivates the old headers and adds new ones
+    AVIVRawToHDPrices(settings, test=True).run()
+    updater.run(TABLES)
+    assert synced_rows(local) == {"location_prices": 12, "report_batches": 1, "report_headers": 12}
+    assert rds.db_handler.execute_query("SELECT active, COUNT(*) FROM report_headers GROUP BY 1 ORDER BY 1") == [
+        (False, 4), (True, 4)
+    ]
+
+
+def test_verify_compares_quarter_checksums(databases):
+    local, rds = databases
+    updater = PricesUpdater(settings.db.test, rds_config.db.test, target="rds")
+    updater.run(TABLES, mode="full")
+
+    assert updater.run(TABLES, mode="verify") == {table: [] for table in TABLES}
+
+    rds.db_handler.execute_query("UPDATE location_prices SET price = price + 1 WHERE zip_code = '10315'")
+    rds.db_handler.commit()
+    mismatches = updater.run(TABLES, mode="verify")
+    assert mismatches["location_prices"] == [
+        {"quarter": "2024Q3", "local_rows": 6, "rds_rows": 6, "checksum_match": False}
+    ]
+    assert mismatches["report_headers"] == []
+
+
+@pytest.mark.parametrize("mode", ["full", "publish"])
+def test_report_batch_name_taken_on_rds_fails_clearly(databases, mode):
+    local, rds = databases
+    rds.db_handler.execute_query(
+        "INSERT INTO report_batches (id, name, created_at, updated_at) VALUES (999, 'AVIV-2024Q3', now(), now())"
+    )
+    rds.db_handler.commit()
+    updater = PricesUpdater(settings.db.test, rds_config.db.test, target="rds")
+    with pytest.raises(ValueError, match=r"name already exists on rds under another id: 'AVIV-2024Q3' \(local id"):
+        updater.run(["report_batches"], mode=mode, price_date="2024-07-01")
+    assert rds.db_handler.execute_query("SELECT id FROM report_batches") == [(999,)]
+
+
+def test_bulk_load_sync_rebuilds_rds_indexes(databases):
+    local, rds = databases
+    PricesUpdater(settings.db.test, rds_config.db.test, target="rds", bulk_load=True).run(TABLES, mode="full")
+    indexes = rds.db_handler.execute_query("SELECT COUNT(*) FROM pg_indexes WHERE tablename = 'location_prices'")
+    assert indexes == [(5,)]
+    assert PricesUpdater(settings.db.test, rds_config.db.test).run(TABLES, mode="verify") == {
+        table: [] for table in TABLES
+    }
+
+def test_publish_swaps_quarter_in_via_staging(databases):
+    local, rds = databases
+    updater = PricesUpdater(settings.db.test, rds_config.db.test, target="rds")
+    updater.run(TABLES, mode="publish", price_date="2024-07-01")
+
+    assert updater.run(TABLES, mode="verify") == {table: [] for table in TABLES}
+    staging = rds.db_handler.execute_query("SELECT to_regclass('location_prices_staging')")
+    assert staging == [(None,)]
+
+    # Publishing again after a re-transform replaces the active headers in the same transaction
+    AVIVRawToHDPrices(settings, test=True).run()
+    updater.run(TABLES, mode="publish")
+    assert rds.db_handler.execute_query("SELECT active, COUNT(*) FROM report_headers GROUP BY 1 ORDER BY 1") == [
+        (False, 4), (True, 4)
+    ]
+    assert updater.run(TABLES, mode="verify") == {table: [] for table in TABLES}
+
+
+def test_delta_after_publish_ships_only_other_changes(databases):
+    local, rds = databases
+    updater = PricesUpdater(settings.db.test, rds_config.db.test, target="rds")
+    updater.run(TABLES, mode="publish", price_date="2024-07-01")
+    assert synced_rows(local) == {"location_prices": 6, "report_batches": 1, "report_headers": 4}
+
+    # The published quarter is not shipped again
+    updater.run(TABLES)
+    assert synced_rows(local) == {"location_prices": 6, "report_batches": 1, "report_headers": 4}
+
+    # A header of another quarter changed before a published one still goes out with the next delta
+    local.db_handler.execute_query("""
+        INSERT INTO report_headers (name, created_at, updated_at, date, active, source)
+        VALUES ('zip_codes', now(), clock_timestamp(), '2024-10-01', true, 1)
+    """)
+    local.db_handler.execute_query("UPDATE report_headers SET updated_at = clock_timestamp() WHERE date = '2024-07-01'")
+    local.db_handler.commit()
+    updater.run(["report_headers"], mode="publish", price_date="2024-07-01")
+    assert synced_rows(local)["report_headers"] == 8
+    updater.run(["report_headers"])
+    assert synced_rows(local)["report_headers"] == 13
+    assert updater.run(["report_headers"], mode="verify") == {"report_headers": []}
+
+
+def test_publish_attaches_partition_on_partitioned_rds(databases):
+    local, rds = databases
+    partitioned_config = DynaBox({'db': {'test': dict(rds_config.db.test), 'params': {
+        'report_batch_id': 1, 'partition_by_quarter': True
+    }}})
+    partitioned = Database(config=partitioned_config, test=True)
+    partitioned.db_handler.execute_query("DROP TABLE location_prices")
+    partitioned.create_tables()
+    partitioned.ensure_quarter_partitions("2024-07-01")
+    # A row of another source in the quarter partition survives the swap
+    partitioned.db_handler.execute_query("""
+        INSERT INTO location_prices (price, created_at, updated_at, interval)
+        VALUES (1, now(), now(), daterange('2024-04-01', '2024-07-01'))
+    """)
+    partitioned.db_handler.commit()
+
+    try:
+        updater = PricesUpdater(settings.db.test, rds_config.db.test, target="rds")
+        updater.run(TABLES, mode="publish", price_date="2024-07-01")
+
+        rows = partitioned.db_handler.execute_query(
+            "SELECT tableoid::regclass::text, COUNT(*) FROM location_prices GROUP BY 1"
+        )
+        assert rows == [("location_prices_2024q3", 7)]
+        # The indexes built on staging became the partition's indexes, none was built again on ATTACH
+        indexes = partitioned.db_handler.execute_query("""
+            SELECT tablename, COUNT(*) FROM pg_indexes
+            WHERE tablename IN ('location_prices', 'location_prices_2024q3') GROUP BY 1 ORDER BY 1
+        """)
+        assert indexes == [("location_prices", 5), ("location_prices_2024q3", 5)]
+        assert updater.run(TABLES, mode="verify") == {table: [] for table in TABLES}
+    finally:
+        partitioned.db_handler.execute_query("DROP TABLE location_prices")
+        partitioned.db_handler.commit()
+        partitioned.db_handler.close()
+        rds.create_tables()
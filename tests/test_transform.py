@@ -0,0 +1,198 @@
+import time
+import numpy as np
+import pytest
+from config import settings
+from src.models import GeocodingResponse
+from src.pipelines import AVIVRawToHDPrices, TransformedPricesHealthCheck, PriceAnomalyCheck
+from tests.conftest import geo_indices
+
+
+@pytest.fixture
+def transformed_db(source_db):
+    """Test database with two transformed quarters."""
+    db = source_db({"2024-07-01": 1.0, "2024-10-01": 1.1})
+    AVIVRawToHDPrices(settings, test=True).run()
+    return db
+
+
+def test_transform_maps_zip_codes_and_cities(transformed_db):
+    rows = transformed_db.db_handler.execute_query("""
+        SELECT rh.date, rh.name, COUNT(*), COUNT(lp.zip_code), COUNT(lp.city_id)
+        FROM location_prices lp JOIN report_headers rh ON lp.report_header_id = rh.id
+        WHERE rh.active
+        GROUP BY rh.date, rh.name
+        ORDER BY rh.date, rh.name
+    """)
+    assert [(str(date), name, total, zips, cities) for date, name, total, zips, cities in rows] == [
+        ("2024-07-01", "cities", 2, 0, 2),
+        ("2024-07-01", "zip_codes", 4, 4, 0),
+        ("2024-10-01", "cities", 2, 0, 2),
+        ("2024-10-01", "zip_codes", 4, 4, 0),
+    ]
+
+
+def test_health_checks_pass_in_single_pass(transformed_db):
+    results = TransformedPricesHealthCheck(settings, test=True).run_all_checks(geo_indices=geo_indices)
+    assert set(results) == set(TransformedPricesHealthCheck.checks)
+    assert all(result["violations"] == 0 for result in results.values())
+
+
+def test_health_checks_report_capped_samples(transformed_db):
+    with transformed_db.db_handler.conn.cursor() as cur:
+        cur.execute("UPDATE location_prices SET price = -1")
+    transformed_db.db_handler.commit()
+
+    health_check = TransformedPricesHealthCheck(settings, test=True)
+    health_check.params["sample_size"] = 2
+    results = health_check.run_checks(price_date="2024-10-01")
+    assert results["negative_location_prices"]["violations"] == 6
+    assert len(results["negative_location_prices"]["samples"]) == 2
+
+    with pytest.raises(ValueError, match="Negative values detected in location_prices"):
+        health_check.run_all_checks(price_date="2024-10-01")
+
+
+def test_registered_check_runs_with_the_others(transformed_db):
+    TransformedPricesHealthCheck.register_check(
+        "expensive_zip_codes",
+        "SELECT to_jsonb(zip_code) AS sample FROM scoped_prices WHERE price > 3400",
+        severity="warning"
+    )
+    try:
+        results = TransformedPricesHealthCheck(settings, test=True).run_all_checks(price_date="2024-10-01")
+        assert results["expensive_zip_codes"]["violations"] == 4
+    finally:
+        TransformedPricesHealthCheck.checks.pop("expensive_zip_codes")
+
+
+def test_bulk_load_transform_rebuilds_indexes(transformed_db):
+    AVIVRawToHDPrices(settings, test=True, bulk_load=True).run()
+    indexes = transformed_db.db_handler.execute_query(
+        "SELECT COUNT(*) FROM pg_indexes WHERE tablename = 'location_prices'"
+    )
+    assert indexes == [(5,)]
+    active_rows = transformed_db.db_handler.execute_query("""
+        SELECT COUNT(*) FROM location_prices lp JOIN report_headers rh ON lp.report_header_id = rh.id
+        WHERE rh.active
+    """)
+    assert active_rows == [(12,)]
+
+
+def test_transform_runs_in_one_transaction(transformed_db):
+    handler = transformed_db.db_handler
+    # Re-transforming a quarter reports the rows of every step
+    row_counts = AVIVRawToHDPrices(settings, test=True).run()
+    assert {step: row_counts[step] for step in AVIVRawToHDPrices.TRANSFORMED_TABLES} == {
+        "report_batches": 0, "report_headers": 8, "location_prices": 12
+    }
+    assert row_counts["report_batches_id_seq"] >= 2
+
+    handler.execute_query("ALTER TABLE location_prices ADD CONSTRAINT always_fails CHECK (price < 0) NOT VALID")
+    handler.commit()
+    try:
+        with pytest.raises(Exception, match="always_fails"):
+            AVIVRawToHDPrices(settings, test=True).run()
+        # The failed location_prices step also rolled back the header deactivation
+        assert handler.execute_query("SELECT COUNT(*) FROM report_headers WHERE active") == [(8,)]
+    finally:
+        handler.execute_query("ALTER TABLE location_prices DROP CONSTRAINT always_fails")
+        handler.commit()
+
+
+def test_transform_keeps_geo_mapping_in_line_with_geo_cache(transformed_db):
+    handler = transformed_db.db_handler
+    # geo_cache changed behind the mapping's back: a city removed, a zip code loaded directly
+    handler.execute_query("DELETE FROM geo_cache WHERE geo_index = 'Ohne'")
+    handler.execute_query(
+        "INSERT INTO geo_cache VALUES ('10317', 'no_hd_geo_id_applicable', 'NBH2DE75702', 'NBH2', '{}', 'Lichtenberg', 1)"
+    )
+    handler.commit()
+    AVIVRawToHDPrices(settings, test=True).run()
+
+    assert handler.execute_query("SELECT geo_index, level, zip_code, city_id FROM geo_mapping ORDER BY 1") == [
+        ("10315", "zip_codes", "10315", None),
+        ("10317", "zip_codes", "10317", None),
+        ("12589", "zip_codes", "12589", None),
+    ]
+    rows = handler.execute_query("""
+        SELECT rh.name, COUNT(*) FROM location_prices lp JOIN report_headers rh ON lp.report_header_id = rh.id
+        WHERE rh.active AND rh.date = '2024-10-01'
+        GROUP BY rh.name
+    """)
+    assert rows == [("zip_codes", 6)]
+
+
+def test_cached_geo_response_without_aviv_id_is_not_mapped(transformed_db):
+    transformed_db.cache_geo_response(GeocodingResponse(
+        geo_index="99999", hd_geo_id="no_hd_geo_id_applicable", id=None, type_key=None, coordinates={},
+        bounding_box={}, match_name=None, confidence_score=None, parents=[]
+    ))
+    assert transformed_db.db_handler.execute_query("SELECT COUNT(*) FROM geo_cache WHERE geo_index = '99999'") == [(1,)]
+    assert transformed_db.db_handler.execute_query("SELECT COUNT(*) FROM geo_mapping WHERE geo_index = '99999'") == [(0,)]
+
+
+def test_transform_function_is_only_replaced_when_changed(transformed_db):
+    def function_row_version():
+        return transformed_db.db_handler.execute_query(
+            "SELECT xmin::text FROM pg_proc WHERE oid = to_regprocedure('transform_aviv_prices()')"
+        )
+    installed = function_row_version()
+    transformed_db.create_tables()
+    AVIVRawToHDPrices(settings, test=True).run()
+    assert function_row_version() == installed
+
+    transformed_db.db_handler.execute_query("COMMENT ON FUNCTION transform_aviv_prices() IS 'outdated'")
+    transformed_db.create_tables()
+    assert function_row_version() != installed
+
+
+def synthetic_prices(locations=19000, seed=7):
+    """Prices of all zip codes and cities for both property types, changed by about 2% since the last quarter."""
+    rng = np.random.default_rng(seed)
+    rows = 2 * locations
+    previous = rng.uniform(1000, 9000, rows)
+    price = previous * rng.normal(1.02, 0.03, rows)
+    return {
+        'header_name': np.where(np.arange(rows) % locations < locations * 0.9, 'zip_codes', 'cities'),
+        'property_type': np.repeat(['apartment', 'house'], locations),
+        'location': np.tile(np.arange(locations).astype(str), 2),
+        'price': price, 'min': price * 0.8, 'max': price * 1.2, 'previous_price': previous
+    }
+
+
+def test_anomaly_detection_is_vectorized():
+    prices = synthetic_prices()
+    prices['price'][[5, 7]] = prices['previous_price'][[5, 7]] * 3
+    prices['min'][11] = prices['price'][11] * 1.1
+    check = PriceAnomalyCheck(settings, test=True)
+
+    start = time.perf_counter()
+    report = check.detect(prices)
+    assert time.perf_counter() - start < 0.5
+
+    assert report['relative_change']['violations'] == 2
+    assert sorted(sample['location'] for sample in report['relative_change']['samples']) == ['5', '7']
+    assert report['z_score']['violations'] >= 2
+    assert report['min_max']['violations'] == 3  # the tripled prices are above their max too
+    assert report['min_max']['compared'] == 38000
+    assert not any(report[name]['failed'] for name in ('relative_change', 'z_score', 'min_max'))
+    assert report['groups']['zip_codes/apartment']['mean_change'] == pytest.approx(0.02, abs=0.005)
+
+
+def test_anomaly_check_blocks_on_thresholds(transformed_db):
+    check = PriceAnomalyCheck(settings, test=True)
+    report = check.run()
+    assert report['relative_change'] == {
+        'violations': 0, 'compared': 6, 'ratio': 0.0, 'failed': False, 'samples': []
+    }
+    assert report['groups']['zip_codes/apartment']['mean_change'] == pytest.approx(0.1, abs=0.01)
+
+    transformed_db.db_handler.execute_query("""
+        UPDATE location_prices SET price = price * 3
+        WHERE zip_code = '10315' AND report_header_id IN (SELECT id FROM report_headers WHERE date = '2024-10-01')
+    """)
+    transformed_db.db_handler.commit()
+    with pytest.raises(ValueError, match="relative_change: 2 of 6 prices"):
+        check.run(price_date="2024-10-01")
+    check.params['max_anomaly_ratio'] = 0.5
+    assert check.run()['min_max']['violations'] == 2